@@ -27,10 +27,99 @@ DEBUG = True
 
 ALLOWED_HOSTS = ['10.0.2.2', '127.0.0.1', 'localhost']
 
+import importlib.util
 import os
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# كاش ديال الـ receipts (PDF) فـ MEDIA_ROOT/receipts
+RECEIPT_CACHE_MAX_BYTES = 50 * 1024 * 1024
+# عدد الـ processes ديال export (None = عدد الـ CPUs، 0 = بلا pool)
+RECEIPT_EXPORT_WORKERS = None
+# output=pdf (PDF واحد كيترسم ويتخزن كامل فالذاكرة): أكثر من هادشي = 400، استعمل output=zip
+RECEIPT_EXPORT_PDF_MAX_ORDERS = 200
+# عدد النصوص المشكّلة (arabic_reshaper + bidi) اللي كيتخزنو فكل process
+RTL_CACHE_SIZE = 4096
+
+# الخط العربي ديال الـ receipts: كيتسجل غير أول مرة كيترسم PDF.
+# env RECEIPT_FONT_PATH، وإلا كنقلبو على RECEIPT_FONT_FILES فـ RECEIPT_FONT_DIRS
+# (حط الخط فـ market_api/fonts/، شوف fonts/README.md)
+RECEIPT_FONT_PATH = os.environ.get('RECEIPT_FONT_PATH') or None
+RECEIPT_FONT_DIRS = [
+    BASE_DIR / 'fonts',
+    '/usr/share/fonts',
+    '/usr/local/share/fonts',
+    os.path.expanduser('~/.fonts'),
+    r'C:\Windows\Fonts',
+]
+RECEIPT_FONT_FILES = [
+    'Khalid Art bold Regular.ttf',
+    'Amiri-Regular.ttf',
+    'NotoNaskhArabic-Regular.ttf',
+    'NotoSansArabic-Regular.ttf',
+    'DejaVuSans.ttf',
+    'arial.ttf',
+]
+
+# Thumbnails ديال صور المنتجات (MEDIA_ROOT/products/thumbs)
+PRODUCT_IMAGE_SIZES = [160, 320, 640]
+PRODUCT_IMAGE_FORMAT = 'WEBP'
+PRODUCT_IMAGE_QUALITY = 80
+
+# MEDIA: 'X-Accel-Redirect' (nginx) ولا 'X-Sendfile' (apache) باش الـ server يبعث الملفات بوحدو
+MEDIA_SENDFILE_HEADER = os.environ.get('MEDIA_SENDFILE_HEADER') or None
+MEDIA_SENDFILE_PREFIX = os.environ.get('MEDIA_SENDFILE_PREFIX', '/protected-media/')
+
+# Cache ديال /api/products/ (products/catalog_cache.py). locmem كيكون فكل process بوحدو:
+# مع بزاف ديال workers ستعمل file ولا redis باش الـ invalidation توصل للكل.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': os.environ.get('CATALOG_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CATALOG_CACHE_LOCATION', 'catalog'),
+        'TIMEOUT': 600,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
+# /api/sync/: الـ tombstones كيتخلاو 30 يوم (من بعد: full sync)، والـ token كيرجع 5 ثواني للور
+SYNC_TOMBSTONE_DAYS = 30
+SYNC_OVERLAP_SECONDS = 5
+
+# MessagePack (Accept: application/msgpack) إلا msgpack مثبت
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+if importlib.util.find_spec('msgpack'):
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('products.renderers.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append('products.renderers.MessagePackParser')
+
+# ضغط الأجوبة (products/middleware.py): zstd/br كيتستعملو غير إلا zstandard/brotli مثبتين
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_ENCODINGS = ['zstd', 'br', 'gzip']
+COMPRESSION_LEVELS = {'zstd': 3, 'br': 4, 'gzip': 6}
+
+# ASGI: asgi.py كيشعل ASYNC_READ_VIEWS (products/async_urls.py قبل الـ router)
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS') == '1'
+# عدد الـ threads اللي كيرسمو PDF فالـ views async
+ASYNC_PDF_WORKERS = 4
+
+# Idempotency-Key ديال POST /api/orders/: مدة الحفظ، وشحال كيتسنى duplicate الطلب الأول
+IDEMPOTENCY_TTL = 24 * 3600
+IDEMPOTENCY_WAIT_SECONDS = 10
+# الحجز ديال طلب ماكملش كيتطلق من بعد هاد المدة (worker مات)؛ خاصها تفوت أطول طلب
+IDEMPOTENCY_LEASE_SECONDS = 60
 # Application definition
 
 INSTALLED_APPS = [
@@ -46,7 +135,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # الأول: الـ latency كتحسب حتى الـ middlewares الآخرين
+    'products.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'products.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -56,6 +148,11 @@ MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware"
 ]
 
+# /metrics/ (Prometheus). METRICS_TOKEN: إلا معمر خاص Authorization: Bearer <token>
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+# Server-Timing: app، db، serializer، pdf (كيبان فـ DevTools ديال المتصفح)
+METRICS_SERVER_TIMING = os.environ.get('METRICS_SERVER_TIMING') == '1'
+
 CORS_ALLOW_ALL_ORIGINS = True  # فقط للتجريب، فالإنتاج خدم CORS بشكل آمن
 
 
@@ -82,13 +179,56 @@ WSGI_APPLICATION = 'market_api.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+# القاعدة كتختار من الـ env:
+#   DB_ENGINE=sqlite (افتراضي)   DB_NAME=<path>   SQLITE_TUNED=1
+#   DB_ENGINE=postgresql         DB_NAME DB_USER DB_PASSWORD DB_HOST DB_PORT
+#                                DB_CONN_MAX_AGE (افتراضي: connections دايمين + health checks)
+#                                ولا DB_POOL=1 (psycopg_pool: DB_POOL_MIN_SIZE/DB_POOL_MAX_SIZE)
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite').lower()
+
+# SQLite مضبوطة: WAL (القراية ماكتوقفش الكتابة)، synchronous=NORMAL (آمن مع WAL)،
+# busy_timeout باش الكتابات يتسناو بلاصة "database is locked"، و BEGIN IMMEDIATE
+# باش الـ transaction تاخد الـ write lock من اللول (بلا upgrade اللي كيطيح بـ SQLITE_BUSY)
+SQLITE_TUNED_OPTIONS = {
+    'transaction_mode': 'IMMEDIATE',
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        f"PRAGMA busy_timeout={int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 20000))};"
+    ),
 }
 
+if DB_ENGINE in ('postgresql', 'postgres'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'market_api'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', ''),
+            'PORT': os.environ.get('DB_PORT', ''),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.environ.get('DB_POOL') == '1':
+        # psycopg[pool]: CONN_MAX_AGE خاصو يبقى 0 مع الـ pool
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        }
+    else:
+        DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': SQLITE_TUNED_OPTIONS if os.environ.get('SQLITE_TUNED', '1') == '1' else {},
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -1,19 +1,28 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
-from products.views import ProductViewSet, OrderViewSet
+from products.views import ProductViewSet, OrderViewSet, AnalyticsViewSet, StockAlertViewSet, SyncViewSet
+from products import mediafiles, metrics
 from django.conf import settings
-from django.conf.urls.static import static
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet, basename="product")
 router.register(r'orders', OrderViewSet, basename="order")
+router.register(r'analytics', AnalyticsViewSet, basename="analytics")
+router.register(r'stock-alerts', StockAlertViewSet, basename="stock-alert")
+router.register(r'sync', SyncViewSet, basename="sync")
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include(router.urls)),
+    path('metrics/', metrics.metrics_view, name='metrics'),
 ]
 
-# باش تقدر تشوف الصور فـ MEDIA
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# ASGI: القراءات الكثيرة (products، orders/<id>، pdf) بـ views async قبل الـ router
+if settings.ASYNC_READ_VIEWS:
+    urlpatterns.insert(1, path('api/', include('products.async_urls')))
+
+# باش تقدر تشوف الصور فـ MEDIA (حتى فالإنتاج: ETag، 304، Range، cache طويل)
+urlpatterns += [
+    re_path(r'^%s(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'), mediafiles.serve, name='media'),
+]
@@ -0,0 +1,196 @@
+"""
+Analytics ديال الداشبورد، مبنية على summary tables كيتحدثو بشكل تدريجي.
+
+كل طلب عندو "مساهمة" فـ DailyOrderStats (نهار، مدينة، حالة) و DailyProductSales
+(نهار، منتج). ملي كيتزاد/يتبدل/يتحذف طلب كنطبقو الفرق بين المساهمة القديمة
+والجديدة بـ UPDATE ... SET x = x + delta، يعني ما كاينش read-modify-write.
+
+الطلبات اللي ماعندهاش created_at (قدام) ماكيدخلوش فالـ analytics.
+أي كتابة مباشرة على الـ ORM خارج OrderSerializer / OrderViewSet خاصها
+`python manage.py rebuild_analytics`.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import DailyOrderStats, DailyProductSales, Order, OrderItem, Product
+
+
+def order_day(created_at):
+    return timezone.localdate(created_at) if timezone.is_aware(created_at) else created_at.date()
+
+
+def contribution(orders, items):
+    """
+    orders: [{'id', 'created_at', 'city', 'status', 'total'}]
+    items:  [{'order_id', 'product_id', 'quantity', 'price'}]
+    كيرجع (stats, sales): {key: [count, revenue]}.
+    """
+    stats = defaultdict(lambda: [0, Decimal(0)])
+    sales = defaultdict(lambda: [0, Decimal(0)])
+    days = {}
+    for order in orders:
+        if order['created_at'] is None:
+            continue
+        day = days[order['id']] = order_day(order['created_at'])
+        row = stats[(day, order['city'] or "", order['status'])]
+        row[0] += 1
+        row[1] += order['total']
+    for item in items:
+        day = days.get(item['order_id'])
+        if day is None:
+            continue
+        row = sales[(day, item['product_id'])]
+        row[0] += item['quantity']
+        row[1] += item['price'] * item['quantity']
+    return stats, sales
+
+
+def load_contribution(order_ids):
+    orders = Order.objects.filter(pk__in=order_ids).values('id', 'created_at', 'city', 'status', 'total')
+    items = OrderItem.objects.filter(order_id__in=order_ids).values('order_id', 'product_id', 'quantity', 'price')
+    return contribution(list(orders), list(items))
+
+
+def subtract(after, before):
+    delta = defaultdict(lambda: [0, Decimal(0)])
+    for key, (count, revenue) in after.items():
+        delta[key][0] += count
+        delta[key][1] += revenue
+    for key, (count, revenue) in before.items():
+        delta[key][0] -= count
+        delta[key][1] -= revenue
+    return {key: value for key, value in delta.items() if value[0] or value[1]}
+
+
+def _increment(model, key_fields, count_field, delta):
+    """
+    INSERT (صفوف خاويين، ignore_conflicts) ثم UPDATE ... SET x = x + %s لكل
+    مفتاح بـ executemany: جوج round trips، وبلا ما Django يبني CASE كبير.
+    """
+    if not delta:
+        return
+    model.objects.bulk_create(
+        [model(**dict(zip(key_fields, key))) for key in delta],
+        ignore_conflicts=True,
+    )
+    qn = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name in key_fields]
+    count_column = qn(model._meta.get_field(count_field).column)
+    sql = (
+        f"UPDATE {qn(model._meta.db_table)} "
+        f"SET {count_column} = {count_column} + %s, {qn('revenue')} = {qn('revenue')} + %s "
+        f"WHERE " + " AND ".join(f"{qn(field.column)} = %s" for field in fields)
+    )
+    revenue_field = model._meta.get_field('revenue')
+    rows = [
+        [
+            count,
+            connection.ops.adapt_decimalfield_value(revenue, revenue_field.max_digits, revenue_field.decimal_places),
+            *[field.get_db_prep_value(value, connection) for field, value in zip(fields, key)],
+        ]
+        for key, (count, revenue) in delta.items()
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def apply(stats, sales):
+    with transaction.atomic():
+        _increment(DailyOrderStats, ('date', 'city', 'status'), 'orders', stats)
+        _increment(DailyProductSales, ('date', 'product_id'), 'quantity', sales)
+
+
+def record(order, items):
+    """طلب جديد (من الذاكرة، بلا queries ديال القراءة)."""
+    orders = [{
+        'id': order.pk, 'created_at': order.created_at, 'city': order.city,
+        'status': order.status, 'total': order.total,
+    }]
+    rows = [
+        {'order_id': order.pk, 'product_id': item.product_id, 'quantity': item.quantity, 'price': item.price}
+        for item in items
+    ]
+    apply(*contribution(orders, rows))
+
+
+def change_status(orders, status):
+    """
+    orders: [{'id', 'created_at', 'city', 'status', 'total'}] قبل التبديل الجماعي
+    (queryset.update). غير DailyOrderStats كيتبدل: المبيعات ماكيتعلقوش بالحالة.
+    """
+    before, _ = contribution(orders, [])
+    after, _ = contribution([{**order, 'status': status} for order in orders], [])
+    apply(subtract(after, before), {})
+
+
+@contextmanager
+def track(*order_ids):
+    """كيقرا المساهمة قبل وبعد البلوك وكيطبق الفرق (تعديل ولا حذف)."""
+    with transaction.atomic():
+        before = load_contribution(order_ids)
+        yield
+        after = load_contribution(order_ids)
+        apply(subtract(after[0], before[0]), subtract(after[1], before[1]))
+
+
+def rebuild():
+    """كيعاود يحسب كلشي من الصفر (backfill ولا إصلاح)."""
+    with transaction.atomic():
+        DailyOrderStats.objects.all().delete()
+        DailyProductSales.objects.all().delete()
+        order_ids = Order.objects.values_list('id', flat=True).iterator(chunk_size=2000)
+        batch = []
+        for order_id in order_ids:
+            batch.append(order_id)
+            if len(batch) == 2000:
+                apply(*load_contribution(batch))
+                batch = []
+        if batch:
+            apply(*load_contribution(batch))
+
+
+# ==========================
+# Queries ديال الداشبورد
+# ==========================
+def money(rows):
+    """revenue كـ string بجوج أرقام بحال DecimalField ديال DRF."""
+    for row in rows:
+        row['revenue'] = f"{Decimal(row['revenue'] or 0).quantize(Decimal('0.01'))}"
+    return rows
+
+
+def dashboard(date_from=None, date_to=None, top=10):
+    stats = DailyOrderStats.objects.all()
+    sales = DailyProductSales.objects.all()
+    if date_from:
+        stats, sales = stats.filter(date__gte=date_from), sales.filter(date__gte=date_from)
+    if date_to:
+        stats, sales = stats.filter(date__lte=date_to), sales.filter(date__lte=date_to)
+
+    def totals(queryset, key):
+        return queryset.values(key).annotate(orders=Sum('orders'), revenue=Sum('revenue')).filter(orders__gt=0).order_by(key)
+
+    return {
+        'revenue_per_day': money(list(totals(stats, 'date'))),
+        'revenue_per_city': money(list(totals(stats, 'city'))),
+        'orders_by_status': {
+            row['status']: row['orders']
+            for row in stats.values('status').annotate(orders=Sum('orders')).filter(orders__gt=0)
+        },
+        'top_products': money(list(
+            sales.values('product_id', name=F('product__name'))
+            .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+            .filter(quantity__gt=0)
+            .order_by('-quantity', 'product_id')[:top]
+        )),
+        'low_stock': list(
+            Product.objects.filter(stock__lte=F('min_stock'))
+            .order_by('stock', 'id')
+            .values('id', 'name', 'stock', 'min_stock')
+        ),
+    }
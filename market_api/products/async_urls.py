@@ -0,0 +1,14 @@
+"""
+Routes async (products/async_views.py) اللي كيتحطو قبل الـ router فـ ASGI
+(ASYNC_READ_VIEWS). نفس الـ paths ديال الـ router.
+"""
+from django.urls import path, re_path
+
+from . import async_views
+
+urlpatterns = [
+    path('products/', async_views.product_list),
+    re_path(r'^products/(?P<pk>[^/.]+)/$', async_views.product_detail),
+    re_path(r'^orders/(?P<pk>[^/.]+)/$', async_views.order_detail),
+    re_path(r'^orders/(?P<pk>[^/.]+)/pdf/$', async_views.order_pdf),
+]
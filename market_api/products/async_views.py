@@ -0,0 +1,175 @@
+"""
+Views async (ASGI) للقراءات الكثيرة: ليستة/تفاصيل المنتجات، تفاصيل الطلب والـ PDF ديالو.
+
+نفس الـ output ديال الـ viewsets (filters، pagination، ?fields=، catalog cache، MessagePack)
+ولكن بالـ async ORM: كلاينت بطيء مابقاش كيحبس thread. كلشي آخر (POST/PATCH/DELETE،
+الـ browsable API، الأخطاء) كيدوز للـ viewset العادي.
+الرسم ديال PDF (reportlab، CPU) كيدوز فـ thread pool محدود (ASYNC_PDF_WORKERS).
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from . import catalog_cache, receipts, renderers
+from .filters import ProductFilter
+from .models import Order, Product
+from .pagination import ProductPagination
+from .serializers import OrderReadSerializer, ProductSerializer, query_list
+from .views import OrderViewSet, ProductViewSet, item_prefetch, receipt_headers, sparse_products
+
+LIST_VIEW = SimpleNamespace(action='list')
+
+product_list_fallback = sync_to_async(ProductViewSet.as_view({'get': 'list', 'post': 'create'}))
+product_detail_fallback = sync_to_async(ProductViewSet.as_view({
+    'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy',
+}))
+order_detail_fallback = sync_to_async(OrderViewSet.as_view({
+    'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy',
+}))
+order_pdf_fallback = sync_to_async(OrderViewSet.as_view({'get': 'pdf'}))
+
+_pdf_pool = None
+
+
+def pdf_pool():
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'ASYNC_PDF_WORKERS', 4), thread_name_prefix='receipt-pdf',
+        )
+    return _pdf_pool
+
+
+def negotiate(request):
+    """JSON ولا MessagePack، ولا None (browsable API...) باش يدوز للـ viewset."""
+    if request.method != 'GET':
+        return None
+    requested = request.GET.get('format')
+    accept = request.headers.get('Accept', '*/*')
+    if requested == 'msgpack' or (requested is None and 'application/msgpack' in accept):
+        return renderers.MessagePackRenderer() if renderers.msgpack is not None else None
+    if requested not in (None, 'json') or 'text/html' in accept:
+        return None
+    return JSONRenderer()
+
+
+def serialize_products(products, drf_request, many=False):
+    return ProductSerializer(products, many=many, context={'request': drf_request}).data
+
+
+# image_url/image_srcset كيقراو الديسك (digest) وكيرسمو thumbnails بـ Pillow:
+# فـ thread باش مايحبسوش الـ event loop (ماكاينش ORM هنا: thread_sensitive=False)
+aserialize_products = sync_to_async(serialize_products, thread_sensitive=False)
+
+
+def render(data, renderer):
+    return HttpResponse(renderer.render(data), content_type=renderer.media_type)
+
+
+@csrf_exempt
+async def product_list(request):
+    renderer = negotiate(request)
+    if renderer is None:
+        return await product_list_fallback(request)
+    drf_request = Request(request)
+
+    async def build():
+        try:
+            queryset = ProductFilter().filter_queryset(drf_request, Product.objects.all(), LIST_VIEW)
+            queryset = sparse_products(queryset, drf_request)
+            paginator = ProductPagination()
+            page = paginator.page_queryset(queryset, drf_request)
+            rows = paginator.set_page([product async for product in page])
+        except APIException:
+            return await product_list_fallback(request)
+        data = await aserialize_products(rows, drf_request, many=True)
+        response = render(paginator.get_paginated_data(data), renderer)
+        for header, value in paginator.get_headers().items():
+            response[header] = value
+        return response
+
+    if not catalog_cache.cacheable(request, renderer.format):
+        return await build()
+    return await catalog_cache.acached(request, catalog_cache.LIST_GENERATION, build)
+
+
+@csrf_exempt
+async def product_detail(request, pk):
+    renderer = negotiate(request)
+    if renderer is None:
+        return await product_detail_fallback(request, pk=pk)
+    drf_request = Request(request)
+
+    async def build():
+        try:
+            product = await sparse_products(Product.objects.all(), drf_request).aget(pk=pk)
+        except (Product.DoesNotExist, ValueError, DjangoValidationError, APIException):
+            return await product_detail_fallback(request, pk=pk)
+        return render(await aserialize_products(product, drf_request), renderer)
+
+    if not catalog_cache.cacheable(request, renderer.format):
+        return await build()
+    return await catalog_cache.acached(request, catalog_cache.product_generation(pk), build)
+
+
+@csrf_exempt
+async def order_detail(request, pk):
+    renderer = negotiate(request)
+    if renderer is None:
+        return await order_detail_fallback(request, pk=pk)
+    drf_request = Request(request)
+    fields = query_list(drf_request, 'fields')
+    # بحال OrderViewSet.expand_items فـ retrieve
+    expand = 'items' in (query_list(drf_request, 'include') or ()) or fields is None or 'items' in fields
+
+    queryset = Order.objects.prefetch_related(item_prefetch()) if expand else Order.objects.all()
+    try:
+        order = await queryset.aget(pk=pk)
+    except (Order.DoesNotExist, ValueError, DjangoValidationError):
+        return await order_detail_fallback(request, pk=pk)
+    data = OrderReadSerializer(order, context={'fields': fields, 'expand_items': expand}).data
+    return render(data, renderer)
+
+
+def load_receipt(data, key):
+    with receipts.open_receipt(data, key) as handle:
+        return handle.read()
+
+
+@csrf_exempt
+async def order_pdf(request, pk):
+    if request.method != 'GET':
+        return await order_pdf_fallback(request, pk=pk)
+    try:
+        order = await Order.objects.prefetch_related(item_prefetch()).aget(pk=pk)
+    except (Order.DoesNotExist, ValueError, DjangoValidationError):
+        return await order_pdf_fallback(request, pk=pk)
+    data = receipts.receipt_data(order)
+    key = receipts.receipt_key(data)
+    headers = receipt_headers(key)
+
+    not_modified = get_conditional_response(request, etag=headers['ETag'])
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified[header] = value
+        return not_modified
+
+    # copy_context: الوقت ديال الرسم كيتحسب لهاد الطلب (products.metrics)
+    render = functools.partial(contextvars.copy_context().run, load_receipt, data, key)
+    pdf = await asyncio.get_running_loop().run_in_executor(pdf_pool(), render)
+    response = HttpResponse(pdf, content_type='application/pdf', headers=headers)
+    response['Content-Disposition'] = content_disposition_header(True, f"invoice_{order.id}.pdf")
+    return response
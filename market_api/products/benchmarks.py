@@ -0,0 +1,839 @@
+"""
+Benchmarks ديال المسارات الثقيلة فالـ API.
+
+كيتشغلو على قاعدة بيانات مؤقتة (بحال التيستات) بـ:
+
+    python manage.py benchmark order_create
+
+الـ suite (run_suite): المسارات الساخنة على 1k / 100k / 1M طلب، مقارنة مع
+benchmark_baseline.json (كيتعاود يتكتب بـ --save-baseline على نفس الماكينة):
+
+    python manage.py benchmark --suite --scale 1k --scale 100k --repeat 100
+"""
+import asyncio
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, reset_queries
+from django.db.models import Prefetch
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import analytics, catalog_cache, filters, middleware, receipts, renderers
+from .serializers import OrderReadSerializer, ProductSerializer
+from .models import Product, Order, OrderItem
+
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def measure(func, repeat):
+    """كيرجع (أوقات التنفيذ بالثواني، عدد الـ queries ديال آخر تنفيذ)."""
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        queries = len(ctx.captured_queries)
+    return timings, queries
+
+
+def make_products(count, stock=1_000_000):
+    Product.objects.bulk_create([
+        Product(name=f"Product {i}", price=Decimal("10.00") + i, stock=stock)
+        for i in range(count)
+    ])
+    return list(Product.objects.order_by('id')[:count])
+
+
+@benchmark('order_create')
+def order_create(out, repeat):
+    """POST /api/orders/ مع عدد مختلف ديال السطور."""
+    client = APIClient()
+    products = make_products(50)
+
+    out.write(f"{'items':>6} {'queries':>8} {'mean ms':>9} {'min ms':>9}")
+    for size in (1, 10, 20, 40, 50):
+        payload = {
+            'client_name': 'bench',
+            'items': [{'product': p.id, 'quantity': 1} for p in products[:size]],
+        }
+
+        def post():
+            response = client.post('/api/orders/', payload, format='json')
+            assert response.status_code == 201, response.content
+
+        timings, queries = measure(post, repeat)
+        out.write(
+            f"{size:>6} {queries:>8} "
+            f"{1000 * sum(timings) / len(timings):>9.2f} {1000 * min(timings):>9.2f}"
+        )
+    Order.objects.all().delete()
+
+
+@benchmark('receipt_render')
+def receipt_render(out, repeat):
+    """receipts/second مع الكاش ديال RTL وبلا بيه."""
+    names = ["أتاي أخضر", "نعناع", "شيبة", "سكر قالب", "كاس ديال أتاي"]
+    datas = [
+        {
+            'id': i, 'status': 'paid', 'client_name': f"زبون {i % 7}", 'phone': '0600000000',
+            'city': ["الرباط", "فاس", "مراكش"][i % 3], 'total': '120.00',
+            'date': '2025-08-16', 'time': '12:30',
+            'items': [[names[(i + j) % len(names)], j + 1, '10.00'] for j in range(8)],
+        }
+        for i in range(repeat * 5)
+    ]
+
+    cached, cached_width = receipts.rtl, receipts.text_width
+    results = {}
+    modes = (
+        ('no cache', cached.__wrapped__, cached_width.__wrapped__),
+        ('lru cache', cached, cached_width),
+    )
+    for label, shaper, width in modes:
+        receipts.rtl, receipts.text_width = shaper, width
+        # الجوج باردين فكل mode: ماشي الـ mode الثاني كيستافد من الأول
+        cached.cache_clear()
+        cached_width.cache_clear()
+        try:
+            start = time.perf_counter()
+            for data in datas:
+                receipts.render_receipt(data)
+            results[label] = len(datas) / (time.perf_counter() - start)
+        finally:
+            receipts.rtl, receipts.text_width = cached, cached_width
+
+    out.write(f"{'mode':>10} {'receipts/s':>11}")
+    for label, rate in results.items():
+        out.write(f"{label:>10} {rate:>11.1f}")
+    stats = receipts.shaping_stats()
+    out.write(f"cache: {stats['hits']} hits, {stats['misses']} misses, {stats['size']}/{stats['maxsize']} entries")
+
+
+@benchmark('catalog_images')
+def catalog_images(out, repeat):
+    """Bytes ديال صفحة catalog (الصور الأصلية من media/products مقابل thumbnails)."""
+    source = os.path.join(settings.MEDIA_ROOT, 'products')
+    media_root = tempfile.mkdtemp(prefix='bench-media-')
+    try:
+        shutil.copytree(source, os.path.join(media_root, 'products'), ignore=shutil.ignore_patterns('thumbs'))
+        with override_settings(MEDIA_ROOT=media_root):
+            names = sorted(os.listdir(os.path.join(media_root, 'products')))
+            Product.objects.bulk_create([
+                Product(name=name, image=f"products/{name}") for name in names
+            ])
+            client = APIClient()
+
+            start = time.perf_counter()
+            page = client.get('/api/products/').json()['results']
+            cold = time.perf_counter() - start
+            timings, queries = measure(lambda: client.get('/api/products/'), repeat)
+
+            def served(url):
+                path = url.split(settings.MEDIA_URL, 1)[1].split('?', 1)[0]
+                return os.path.getsize(os.path.join(media_root, unquote(path)))
+
+            original = sum(served(row['image_url']) for row in page)
+            out.write(f"{len(page)} products, list: cold {1000 * cold:.0f} ms (generates thumbnails), "
+                      f"warm {1000 * sum(timings) / len(timings):.1f} ms, {queries} queries")
+            out.write(f"{'variant':>10} {'bytes/page':>12} {'vs original':>12}")
+            out.write(f"{'original':>10} {original:>12} {'100.0%':>12}")
+            for width in sorted({int(key) for row in page for key in row['image_srcset']}):
+                size = sum(served(row['image_srcset'][str(width)]) for row in page)
+                out.write(f"{str(width) + 'w':>10} {size:>12} {100 * size / original:>11.1f}%")
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+        Product.objects.all().delete()
+
+
+@benchmark('media_serving')
+def media_serving(out, repeat):
+    """Requests/s ديال /media/: ملف كامل، revalidation (304) و Range."""
+    media_root = tempfile.mkdtemp(prefix='bench-media-')
+    try:
+        with override_settings(MEDIA_ROOT=media_root):
+            os.makedirs(os.path.join(media_root, 'products'))
+            names = []
+            for index in range(20):
+                name = f"products/image{index}.webp"
+                with open(os.path.join(media_root, name), 'wb') as handle:
+                    handle.write(os.urandom(64 * 1024))
+                names.append(name)
+            client = Client()
+            etags = {name: client.get(f"/media/{name}")['ETag'] for name in names}
+
+            def full():
+                for name in names:
+                    b''.join(client.get(f"/media/{name}").streaming_content)
+
+            def revalidate():
+                for name in names:
+                    client.get(f"/media/{name}", HTTP_IF_NONE_MATCH=etags[name])
+
+            def ranged():
+                for name in names:
+                    b''.join(client.get(f"/media/{name}", HTTP_RANGE='bytes=0-16383').streaming_content)
+
+            out.write(f"{'request':>12} {'req/s':>10}")
+            for label, func in (('200 (64KB)', full), ('304', revalidate), ('206 (16KB)', ranged)):
+                timings, _ = measure(func, repeat)
+                out.write(f"{label:>12} {len(names) * len(timings) / sum(timings):>10.0f}")
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+
+
+@benchmark('product_search')
+def product_search(out, repeat):
+    """Filtering/search/ordering على catalog ديال 100k منتج (FTS5 مقابل icontains)."""
+    words = ['atay', 'zit', 'sokar', 'qahwa', 'hlib', 'smen', 'khobz', 'lben', 'ftour', 'harira']
+    Product.objects.bulk_create([
+        Product(
+            name=f"{words[i % 10]} {words[i // 10 % 10]} {i}",
+            description=f"{words[i // 100 % 10]} description {i % 997}",
+            category=f"cat{i % 50}",
+            price=Decimal(i % 5000) + Decimal('0.99'),
+            stock=i % 7,
+        )
+        for i in range(100_000)
+    ], batch_size=5000)
+    client = APIClient()
+
+    out.write(f"{'query':>48} {'queries':>8} {'mean ms':>9}")
+    for label, url in (
+        ('page 1 (no filter)', '/api/products/?page_size=50'),
+        ('category + ordering=price', '/api/products/?category=cat7&ordering=price&page_size=50'),
+        ('price range + in_stock', '/api/products/?min_price=100&max_price=101&in_stock=1&page_size=50'),
+        ('ordering=-price (all)', '/api/products/?ordering=-price&page_size=50'),
+        ('search=qahwa smen (FTS5)', '/api/products/?search=qahwa%20smen&page_size=50'),
+        ('search=qahwa smen (FTS5, 500 rows)', '/api/products/?search=qahwa%20smen&fields=id&page_size=500'),
+    ):
+        def get():
+            response = client.get(url)
+            assert response.status_code == 200, response.content
+        timings, queries = measure(get, repeat)
+        out.write(f"{label:>48} {queries:>8} {1000 * sum(timings) / len(timings):>9.1f}")
+
+    # نفس البحث بـ icontains (بحال غير SQLite) للمقارنة
+    def scan():
+        list(Product.objects.filter(name__icontains='qahwa', description__icontains='smen').values_list('id'))
+
+    def fts():
+        list(filters.search(Product.objects.all(), 'qahwa smen').values_list('id'))
+
+    for label, func in (('icontains (full scan)', scan), ('FTS5 MATCH', fts)):
+        timings, queries = measure(func, repeat)
+        out.write(f"{label:>48} {queries:>8} {1000 * sum(timings) / len(timings):>9.1f}")
+    Product.objects.all().delete()
+
+
+ORDER_CITIES = ('Rabat', 'Fes', 'Casablanca', 'Tanger')
+ORDER_STATUSES = ('pending', 'paid', 'shipped')
+
+
+SEED_BATCH_SIZE = 5000
+
+
+def make_orders(count, start=0):
+    """
+    count طلب بـ INSERT ... SELECT واحد (بلا signals/analytics): طلب فكل دقيقة
+    من 2024-01-01، statuses و cities بالتناوب، phone/email فريدين.
+    start: باش نزيدو طلبات من بعد اللي كاينين (n من start + 1).
+    غير SQLite: نفس الطلبات بـ bulk_create (seed_orders).
+    """
+    if connection.vendor != 'sqlite':
+        return seed_orders(range(start + 1, start + count + 1))
+    cities = ' '.join(f"WHEN {i} THEN '{city}'" for i, city in enumerate(ORDER_CITIES))
+    statuses = ' '.join(f"WHEN {i} THEN '{status}'" for i, status in enumerate(ORDER_STATUSES))
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            WITH RECURSIVE seq(n) AS (SELECT %s + 1 UNION ALL SELECT n + 1 FROM seq WHERE n < %s)
+            INSERT INTO products_order
+                (client_name, phone, email, city, address, total, status, created_at, updated_at)
+            SELECT 'Client ' || n, '06' || printf('%%08d', n), 'client' || n || '@example.ma',
+                   CASE n %% {len(ORDER_CITIES)} {cities} END, '', 10,
+                   CASE n %% {len(ORDER_STATUSES)} {statuses} END,
+                   datetime('2024-01-01', '+' || n || ' minutes'), datetime('now')
+            FROM seq
+        """, [start, start + count])
+
+
+def make_order_items(per_order, products, after_id=0):
+    """per_order سطر لكل طلب (id > after_id) بـ INSERT ... SELECT واحد، المنتجات بالتناوب."""
+    # ids ديال make_products متتابعين
+    first, count = products[0].pk, len(products)
+    if connection.vendor != 'sqlite':
+        order_ids = Order.objects.filter(id__gt=after_id).values_list('id', flat=True).iterator()
+        items = (
+            OrderItem(order_id=order_id, product_id=first + (order_id * per_order + k) % count, quantity=1, price=10)
+            for order_id in order_ids for k in range(per_order)
+        )
+        for batch in iter(lambda: list(itertools.islice(items, SEED_BATCH_SIZE)), []):
+            OrderItem.objects.bulk_create(batch)
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            WITH RECURSIVE line(k) AS (SELECT 0 UNION ALL SELECT k + 1 FROM line WHERE k < %s - 1)
+            INSERT INTO products_orderitem (order_id, product_id, quantity, price)
+            SELECT o.id, %s + (o.id * %s + k) %% %s, 1, 10
+            FROM products_order o, line
+            WHERE o.id > %s
+        """, [per_order, first, per_order, count, after_id])
+
+
+def seed_orders(numbers):
+    """نفس الطلبات ديال make_orders بالـ ORM (Postgres...)، batch بـ batch."""
+    # auto_now_add كان غادي يبدل created_at بالوقت ديال دابا
+    created_at = Order._meta.get_field('created_at')
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    numbers = iter(numbers)
+    created_at.auto_now_add = False
+    try:
+        for batch in iter(lambda: list(itertools.islice(numbers, SEED_BATCH_SIZE)), []):
+            Order.objects.bulk_create([
+                Order(
+                    client_name=f'Client {n}', phone=f'06{n:08d}', email=f'client{n}@example.ma',
+                    city=ORDER_CITIES[n % len(ORDER_CITIES)], address='', total=10,
+                    status=ORDER_STATUSES[n % len(ORDER_STATUSES)],
+                    created_at=start + timedelta(minutes=n),
+                )
+                for n in batch
+            ])
+    finally:
+        created_at.auto_now_add = True
+
+
+def query_plan(sql):
+    explain = 'EXPLAIN QUERY PLAN' if connection.vendor == 'sqlite' else 'EXPLAIN'
+    with connection.cursor() as cursor:
+        cursor.execute(f"{explain} {sql}")
+        return '; '.join(row[-1] for row in cursor.fetchall())
+
+
+@benchmark('order_filters')
+def order_filters(out, repeat):
+    """/api/orders/?status=&date_from=... على 1M طلب: الوقت، الـ queries والـ query plan."""
+    began = time.perf_counter()
+    make_orders(1_000_000)
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    out.write(f"seeded 1M orders in {time.perf_counter() - began:.1f}s")
+    client = APIClient()
+
+    out.write(f"{'query':>40} {'queries':>8} {'mean ms':>9}  plan")
+    for label, params in (
+        ('pending today', 'status=pending&date_from=2025-06-01&date_to=2025-06-01'),
+        ('pending (latest)', 'status=pending'),
+        ('city + date_from', 'city=Rabat&date_from=2025-06-01'),
+        ('phone', 'phone=0600000042'),
+        ('email (any case)', 'email=CLIENT42@Example.ma'),
+        ('no filter', ''),
+    ):
+        url = f'/api/orders/?page_size=50&{params}'
+
+        def get():
+            response = client.get(url)
+            assert response.status_code == 200, response.content
+        timings, queries = measure(get, repeat)
+        with CaptureQueriesContext(connection) as ctx:
+            get()
+        plan = query_plan(ctx.captured_queries[0]['sql'])
+        out.write(f"{label:>40} {queries:>8} {1000 * sum(timings) / len(timings):>9.1f}  {plan}")
+    # ماشي Order.objects.all().delete(): signals (Tombstone...) على 1M صف
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM products_order")
+
+
+@benchmark('order_transition')
+def order_transition(out, repeat):
+    """N طلب pending -> paid: PATCH لكل طلب مقابل POST /api/orders/transition/ واحد."""
+    client = APIClient()
+
+    def patch(ids):
+        for pk in ids:
+            client.patch(f'/api/orders/{pk}/', {'status': 'paid'}, format='json')
+
+    def transition(ids):
+        client.post('/api/orders/transition/', {'status': 'paid', 'ids': ids}, format='json')
+
+    out.write(f"{'orders':>8} {'path':>10} {'queries':>8} {'mean ms':>9}")
+    for count in (100, 1000):
+        for label, run in (('patch', patch), ('transition', transition)):
+            timings = []
+            for _ in range(repeat):
+                make_orders(count)
+                analytics.rebuild()
+                ids = list(Order.objects.values_list('id', flat=True))
+                # الـ query log ديال Django كيوقف فـ 9000: فـ patch كنحسبو أول طلب ونضربو
+                split = 1 if run is patch else count
+                reset_queries()
+                began = time.perf_counter()
+                with CaptureQueriesContext(connection) as ctx:
+                    run(ids[:split])
+                if ids[split:]:
+                    run(ids[split:])
+                timings.append(time.perf_counter() - began)
+                queries = len(ctx.captured_queries) * (count // split)
+                assert not Order.objects.filter(status='pending').exists()
+                with connection.cursor() as cursor:
+                    cursor.execute("DELETE FROM products_order")
+            out.write(f"{count:>8} {label:>10} {queries:>8} {1000 * sum(timings) / len(timings):>9.1f}")
+
+
+@benchmark('catalog_io')
+def catalog_io_benchmark(out, repeat):
+    """Export/import ديال 100k منتج: الوقت والذاكرة (tracemalloc peak)."""
+    make_products(100_000)
+    client = APIClient()
+
+    out.write(f"{'step':>28} {'rows':>8} {'seconds':>8} {'peak MB':>8} {'size MB':>8}")
+    files = {}
+    for label, url, output in (
+        ('export csv', '/api/products/export/', 'csv'),
+        ('export xlsx', '/api/products/export/?output=xlsx', 'xlsx'),
+    ):
+        tracemalloc.start()
+        began = time.perf_counter()
+        response = client.get(url)
+        # كنحسبو غير الحجم: الـ chunks ماكيتخزنوش (بحال socket)
+        size = sum(len(chunk) for chunk in response.streaming_content)
+        seconds = time.perf_counter() - began
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        files[output] = b''.join(client.get(url).streaming_content)
+        out.write(f"{label:>28} {100_000:>8} {seconds:>8.2f} {peak / 2**20:>8.1f} {size / 2**20:>8.1f}")
+
+    rows = ''.join(f",New {i},{i % 500}.50,{i % 90}\n" for i in range(100_000))
+    for label, name, content in (
+        ('import csv (update 100k)', 'products.csv', files['csv']),
+        ('import xlsx (update 100k)', 'products.xlsx', files['xlsx']),
+        ('import csv (create 100k)', 'new.csv', f"id,name,price,stock\n{rows}".encode()),
+    ):
+        upload = SimpleUploadedFile(name, content)
+        began = time.perf_counter()
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.post('/api/products/import/', {'file': upload}, format='multipart')
+        seconds = time.perf_counter() - began
+        report = response.json()
+        assert not report['failed'], report['errors'][:3]
+        total = report['created'] + report['updated']
+        out.write(
+            f"{label:>28} {total:>8} {seconds:>8.2f} {'-':>8} {len(content) / 2**20:>8.1f}"
+            f"  ({len(ctx.captured_queries)} queries)"
+        )
+    Product.objects.all().delete()
+
+
+@benchmark('catalog_cache')
+def catalog_cache_benchmark(out, repeat):
+    """Mix ديال قراءات catalog (list/detail) مع order كل 20 request: بلا cache مقابل CACHES['catalog']."""
+    products = make_products(200)
+    client = APIClient()
+    urls = ['/api/products/', '/api/products/?page_size=50'] + [f'/api/products/{p.id}/' for p in products[:20]]
+
+    def traffic():
+        for index in range(200):
+            if index % 20 == 19:
+                client.post('/api/orders/', {'items': [{'product': products[index % 20].id, 'quantity': 1}]},
+                            format='json')
+            else:
+                client.get(urls[index % len(urls)])
+
+    out.write(f"{'cache':>10} {'mean ms/request':>16} {'hit ratio':>10}")
+    for label, backend in (('none', 'django.core.cache.backends.dummy.DummyCache'),
+                           ('locmem', 'django.core.cache.backends.locmem.LocMemCache')):
+        caches_setting = dict(settings.CACHES, catalog={'BACKEND': backend, 'LOCATION': 'bench-catalog'})
+        with override_settings(CACHES=caches_setting):
+            catalog_cache.reset_stats()
+            timings, _ = measure(traffic, repeat)
+            ratio = catalog_cache.stats()['hit_ratio']
+        out.write(f"{label:>10} {1000 * sum(timings) / len(timings) / 200:>16.2f} {100 * ratio:>9.1f}%")
+    Product.objects.all().delete()
+
+
+@benchmark('encodings')
+def encodings(out, repeat):
+    """Bytes و وقت (serializer + render + ضغط) ديال ليستات products/orders: JSON مقابل MessagePack."""
+    products = make_products(1000)
+    orders = [Order(client_name=f"Client {i}", city='Casablanca', phone='0600000000', total=Decimal('30.00'))
+              for i in range(1000)]
+    Order.objects.bulk_create(orders)
+    orders = list(Order.objects.order_by('id'))
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=products[(order.id + n) % 1000], quantity=1, price=Decimal('10.00'))
+        for order in orders for n in range(3)
+    ])
+
+    formats = {'json': JSONRenderer()}
+    if renderers.msgpack is not None:
+        formats['msgpack'] = renderers.MessagePackRenderer()
+    compressors = [(None, lambda data: data)] + [
+        (name, lambda data, name=name: middleware.compress(data, name))
+        for name in middleware.available_encodings()
+    ]
+
+    out.write(f"{'list':>8} {'rows':>6} {'format':>8} {'encoding':>9} {'bytes':>10} {'ms':>8}")
+    for label, queryset, serializer in (
+        ('products', Product.objects.order_by('id'), ProductSerializer),
+        ('orders', Order.objects.prefetch_related(Prefetch('items', queryset=OrderItem.objects.select_related('product')))
+         .order_by('id'), OrderReadSerializer),
+    ):
+        for size in (10, 100, 1000):
+            rows = list(queryset[:size])
+            serialize_timings, _ = measure(lambda: serializer(rows, many=True).data, repeat)
+            data = serializer(rows, many=True).data
+            for fmt, renderer in formats.items():
+                render_timings, _ = measure(lambda: renderer.render(data), repeat)
+                body = renderer.render(data)
+                for encoding, compress in compressors:
+                    timings, _ = measure(lambda: compress(body), repeat)
+                    elapsed = min(serialize_timings) + min(render_timings) + (min(timings) if encoding else 0)
+                    out.write(f"{label:>8} {size:>6} {fmt:>8} {encoding or 'identity':>9} "
+                              f"{len(compress(body)):>10} {1000 * elapsed:>8.2f}")
+    Order.objects.all().delete()
+    Product.objects.all().delete()
+
+
+@contextmanager
+def sqlite_file_database(options):
+    """الـ default connection على ملف SQLite مؤقت بـ OPTIONS هادو (الـ threads كيشوفوه حتى هما)."""
+    settings_dict = connection.settings_dict
+    saved = dict(settings_dict)
+    # الـ test DB ديال الـ memory كتموت إلا تسدات آخر connection ديالها: نخليوها محلولة
+    connection.ensure_connection()
+    memory = connection.connection
+    connection.connection = None
+    directory = tempfile.mkdtemp(prefix='bench-db-')
+    settings_dict.update(NAME=os.path.join(directory, 'db.sqlite3'), OPTIONS=options)
+    try:
+        call_command('migrate', verbosity=0)
+        yield
+    finally:
+        connection.close()
+        settings_dict.clear()
+        settings_dict.update(saved)
+        connection.connection = memory
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def checkout_load(buyers, orders_per_buyer):
+    """buyers threads كيديرو POST /api/orders/ (5 سطور) فنفس الوقت. كيرجع (latencies, errors, seconds)."""
+    products = make_products(20)
+    latencies, errors = [], []
+    start = threading.Barrier(buyers + 1)
+
+    def buyer(index):
+        client = APIClient(raise_request_exception=False)
+        try:
+            start.wait()
+            for n in range(orders_per_buyer):
+                payload = {'client_name': f'buyer {index}', 'items': [
+                    {'product': products[(index + n + k) % 20].id, 'quantity': 1} for k in range(5)
+                ]}
+                began = time.perf_counter()
+                try:
+                    response = client.post('/api/orders/', payload, format='json')
+                    status = response.status_code
+                except Exception as exc:  # database is locked...
+                    status = type(exc).__name__
+                latencies.append(time.perf_counter() - began)
+                if status != 201:
+                    errors.append(status)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=buyer, args=(index,)) for index in range(buyers)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - began
+
+
+@benchmark('concurrent_checkout')
+def concurrent_checkout(out, repeat):
+    """Checkout متوازي (threads) على SQLite عادية، SQLite مضبوطة (WAL...)، ولا القاعدة المضبوطة فالـ env."""
+    if connection.vendor == 'sqlite':
+        variants = [('sqlite default', {}), ('sqlite tuned', settings.SQLITE_TUNED_OPTIONS)]
+    else:
+        variants = [(f"{connection.vendor} (env)", None)]
+
+    out.write(f"{'database':>16} {'buyers':>7} {'orders/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for label, options in variants:
+        for buyers in (1, 4, 8):
+            database = sqlite_file_database(options) if options is not None else nullcontext()
+            with database:
+                latencies, errors, seconds = checkout_load(buyers, max(repeat, 5))
+                Product.objects.all().delete()
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2]
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            out.write(f"{label:>16} {buyers:>7} {(len(latencies) - len(errors)) / seconds:>9.1f} "
+                      f"{1000 * p50:>8.1f} {1000 * p99:>8.1f} {len(errors):>7}")
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+@benchmark('async_reads')
+def async_reads(out, repeat):
+    """
+    N طلبات فنفس الوقت على order detail / product detail / pdf:
+    WSGI (views sync، 4 worker threads) مقابل ASGI (products/async_views.py، event loop واحد).
+    slow = كل كلاينت كياخد 50ms باش يقرا الجواب: فـ WSGI كيحبس الـ thread، فـ ASGI لا.
+    الـ latency محسوبة من اللحظة اللي تبعتو فيها الطلبات كاملين (فيها الانتظار).
+    """
+    products = make_products(50)
+    orders = Order.objects.bulk_create([Order(client_name=f"Client {i}", city='Fes') for i in range(50)])
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=products[(order.id + n) % 50], quantity=1, price=Decimal('10.00'))
+        for order in orders for n in range(5)
+    ])
+    media_root = tempfile.mkdtemp(prefix='bench-async-')
+    paths = {
+        'order': [f"orders/{order.id}/" for order in orders],
+        'product': [f"products/{product.id}/" for product in products],
+        'pdf': [f"orders/{order.id}/pdf/" for order in orders[:10]],
+    }
+
+    def wsgi(urls, delay):
+        client = Client()
+        began = time.perf_counter()
+
+        def get(url):
+            response = client.get('/api/' + url)
+            assert response.status_code == 200, response.status_code
+            time.sleep(delay)
+            return time.perf_counter() - began
+
+        try:
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                return list(pool.map(get, urls))
+        finally:
+            connections.close_all()
+
+    def asgi(urls, delay):
+        async def run():
+            client = AsyncClient()
+            began = time.perf_counter()
+
+            async def get(url):
+                response = await client.get('/' + url)
+                assert response.status_code == 200, response.status_code
+                await asyncio.sleep(delay)
+                return time.perf_counter() - began
+
+            return await asyncio.gather(*(get(url) for url in urls))
+
+        with override_settings(ROOT_URLCONF='products.async_urls'):
+            return asyncio.run(run())
+
+    out.write(f"{'endpoint':>8} {'client':>6} {'concurrent':>10} {'path':>5} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    try:
+        with override_settings(MEDIA_ROOT=media_root):
+            for endpoint, urls in paths.items():
+                for client_label, delay in (('fast', 0), ('slow', 0.05)):
+                    for concurrent in (10, 100):
+                        batch = [urls[i % len(urls)] for i in range(concurrent)]
+                        wsgi(batch, 0)  # warm up (thumbnails، PDFs فالكاش...)
+                        for label, run in (('wsgi', wsgi), ('asgi', asgi)):
+                            latencies = []
+                            began = time.perf_counter()
+                            for _ in range(repeat):
+                                latencies += run(batch, delay)
+                            seconds = time.perf_counter() - began
+                            out.write(
+                                f"{endpoint:>8} {client_label:>6} {concurrent:>10} {label:>5} "
+                                f"{len(latencies) / seconds:>8.0f} {1000 * percentile(latencies, 0.5):>8.1f} "
+                                f"{1000 * percentile(latencies, 0.99):>8.1f}"
+                            )
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+        Order.objects.all().delete()
+        Product.objects.all().delete()
+
+
+# ==========================
+# Suite: المسارات الساخنة على 1k / 100k / 1M طلب
+# ==========================
+SUITE_SCALES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+SUITE_PRODUCTS = 1_000
+SUITE_ITEMS_PER_ORDER = 3
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'benchmark_baseline.json')
+
+
+def spread_orders(count):
+    """count id ديال طلبات make_orders موزعين على الجدول كامل (ماشي غير الجداد)."""
+    total = Order.objects.filter(client_name__startswith='Client ').count()
+    step = max(1, total // count)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT id FROM products_order WHERE client_name LIKE 'Client %%' AND id %% %s = 0 ORDER BY id LIMIT %s",
+            [step, count],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def suite_paths(products, orders):
+    """
+    {اسم: دالة كتدير طلب واحد}. orders: ids موزعين على الجدول كامل، كل
+    طلب كيتعاود بالدور (الـ pdf: كل مرة طلب آخر = رسم ماشي كاش).
+    """
+    client = APIClient()
+    detail_ids = itertools.cycle(orders)
+    pdf_ids = itertools.cycle(orders)
+    update_items = list(OrderItem.objects.filter(order_id=orders[0]).values('id', 'product'))
+    quantities = itertools.cycle((2, 1))
+
+    def get(url, status=200):
+        response = client.get(url)
+        assert response.status_code == status, (url, response.status_code)
+
+    def create(size):
+        payload = {
+            'client_name': 'bench', 'city': 'Rabat',
+            'items': [{'product': product.pk, 'quantity': 1} for product in products[:size]],
+        }
+        return lambda: _check(client.post('/api/orders/', payload, format='json'), 201)
+
+    def update():
+        quantity = next(quantities)
+        payload = {'items': [{**item, 'quantity': quantity} for item in update_items]}
+        _check(client.patch(f'/api/orders/{orders[0]}/', payload, format='json'), 200)
+
+    return {
+        'product_list': lambda: get('/api/products/?page_size=50'),
+        'order_list': lambda: get('/api/orders/?page_size=50'),
+        'order_detail': lambda: get(f'/api/orders/{next(detail_ids)}/'),
+        'order_create_1': create(1),
+        'order_create_10': create(10),
+        'order_create_50': create(50),
+        'order_update': update,
+        'order_pdf': lambda: get(f'/api/orders/{next(pdf_ids)}/pdf/'),
+    }
+
+
+def _check(response, status):
+    assert response.status_code == status, response.content[:500]
+
+
+def summarize(timings, queries):
+    return {
+        'queries': queries,
+        'req_s': round(len(timings) / sum(timings), 1),
+        'p50_ms': round(1000 * percentile(timings, 0.5), 2),
+        'p99_ms': round(1000 * percentile(timings, 0.99), 2),
+    }
+
+
+def run_suite(out, repeat, scales=('1k',)):
+    """
+    كيزرع الطلبات (كل scale كيزيد على اللي قبلو) وكيقيس كل مسار repeat مرة.
+    كيرجع {scale: {path: {queries, req_s, p50_ms, p99_ms}}}.
+    """
+    media_root = tempfile.mkdtemp(prefix='bench-suite-')
+    results = {}
+    try:
+        with override_settings(MEDIA_ROOT=media_root):
+            products = make_products(SUITE_PRODUCTS)
+            seeded = 0
+            for scale in sorted(scales, key=SUITE_SCALES.get):
+                count = SUITE_SCALES[scale]
+                began = time.perf_counter()
+                last_id = Order.objects.order_by('-id').values_list('id', flat=True).first() or 0
+                make_orders(count - seeded, start=seeded)
+                make_order_items(SUITE_ITEMS_PER_ORDER, products, after_id=last_id)
+                seeded = count
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE")
+                out.write(f"== {scale}: {Order.objects.count()} orders, seeded in {time.perf_counter() - began:.1f}s")
+
+                paths = suite_paths(products, spread_orders(repeat + 1))
+                results[scale] = {}
+                for name, func in paths.items():
+                    func()  # warm up (الكاش ديال الكاتالوغ، الخط ديال الـ PDF...)
+                    results[scale][name] = summarize(*measure(func, repeat))
+    finally:
+        shutil.rmtree(media_root, ignore_errors=True)
+        # ماشي .delete(): signals على 1M صف
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM products_orderitem")
+            cursor.execute("DELETE FROM products_order")
+        Product.objects.all().delete()
+    return results
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    """كيبدل غير الـ scales اللي تقاسو، الباقي كيبقى."""
+    baseline = {**load_baseline(path), **results}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(results, baseline, tolerance=0.5):
+    """
+    الـ regressions مقارنة مع الـ baseline: queries أكثر (ديما)، ولا p50 أبطأ
+    بأكثر من tolerance (0.5 = +50%، الوقت كيتبدل من ماكينة لماكينة).
+    """
+    regressions = []
+    for scale, paths in results.items():
+        for name, result in paths.items():
+            base = baseline.get(scale, {}).get(name)
+            if base is None:
+                continue
+            if result['queries'] > base['queries']:
+                regressions.append(f"{scale} {name}: {base['queries']} -> {result['queries']} queries")
+            if result['p50_ms'] > base['p50_ms'] * (1 + tolerance):
+                regressions.append(f"{scale} {name}: p50 {base['p50_ms']} -> {result['p50_ms']} ms")
+    return regressions
+
+
+def report(out, results, baseline):
+    out.write(f"{'scale':>5} {'path':>16} {'queries':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'p50 vs base':>12}")
+    for scale, paths in results.items():
+        for name, result in paths.items():
+            base = baseline.get(scale, {}).get(name)
+            change = f"{100 * (result['p50_ms'] / base['p50_ms'] - 1):+.0f}%" if base else '-'
+            if base and result['queries'] != base['queries']:
+                change += f" ({base['queries']} q)"
+            out.write(
+                f"{scale:>5} {name:>16} {result['queries']:>8} {result['req_s']:>8.1f} "
+                f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} {change:>12}"
+            )
@@ -0,0 +1,170 @@
+"""
+Cache ديال الأجوبة ديال /api/products/ و /api/products/{id}/.
+
+الـ backend هو CACHES['catalog'] (locmem، file، redis... أي backend ديال Django).
+كل جواب كيتخزن مرندر (bytes + ETag) تحت key فيه "generation":
+
+- catalog:gen:list            كتبدل مع أي تبديل فشي منتج (الليستات كاملين)
+- catalog:gen:product:<id>    كتبدل غير مع تبديل هاد المنتج (الـ detail)
+
+التبديل ديال الـ generation كيخلي الـ entries القدام ماعمرهم يتقراو (كيتمسحو بالـ TIMEOUT/LRU).
+الـ invalidation كتوقع دابا وعاوتاني من بعد الـ commit: قارئ اللي خزن البيانات القديمة
+بين الجوج ماكيبقاش يتسرب. bulk_create و queryset.update() ماكيصيفطوش signals:
+اللي كيستعملهم خاصو يعيط لـ invalidate() بيديه.
+
+غير الأجوبة العمومية كيتخزنو (cacheable): JSON/MessagePack بلا session ولا
+Authorization. الـ browsable API (HTML) فيه الـ username و الـ CSRF token.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+LIST_GENERATION = 'catalog:gen:list'
+CACHEABLE_FORMATS = ('json', 'msgpack')
+
+_stats = {'hit': 0, 'miss': 0, 'not_modified': 0}
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'catalog')]
+
+
+def product_generation(pk):
+    return f'catalog:gen:product:{pk}'
+
+
+def generation(key):
+    cache = get_cache()
+    value = cache.get(key)
+    if value is None:
+        # time_ns ماشي 0: إلا الـ generation تمسحات (LRU) ماكنرجعوش لشي قيمة قديمة
+        cache.add(key, time.time_ns(), None)
+        value = cache.get(key)
+    return value
+
+
+async def ageneration(key):
+    cache = get_cache()
+    value = await cache.aget(key)
+    if value is None:
+        await cache.aadd(key, time.time_ns(), None)
+        value = await cache.aget(key)
+    return value
+
+
+def invalidate(product_ids=()):
+    """كيبدل generation ديال الليستات وديال هاد المنتجات (دابا ومن بعد الـ commit)."""
+    keys = [LIST_GENERATION] + [product_generation(pk) for pk in product_ids]
+    bump(keys)
+    transaction.on_commit(lambda: bump(keys))
+
+
+def bump(keys):
+    now = time.time_ns()
+    get_cache().set_many({key: now for key in keys}, None)
+
+
+def cacheable(request, renderer_format):
+    """الجواب ماكيتعلقش بالمستعمل: format ديال API وبلا session ولا Authorization."""
+    return (
+        renderer_format in CACHEABLE_FORMATS
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and 'Authorization' not in request.headers
+    )
+
+
+def response_key(request, generation):
+    # الـ host داخل (image_url absolute)، و Accept حيت الـ renderer كيتبدل معاه
+    raw = '\n'.join((request.get_host(), request.get_full_path(), request.headers.get('Accept', '')))
+    return f"catalog:response:{generation}:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+
+def count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    served = result['hit'] + result['not_modified'] + result['miss']
+    result['hit_ratio'] = (result['hit'] + result['not_modified']) / served if served else 0.0
+    return result
+
+
+def reset_stats():
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
+
+
+def cached(request, generation_key, render):
+    """
+    render() كيرجع HttpResponse مرندر (ولا أي status آخر اللي مكيتخزنش).
+    كيرجع الجواب من الـ cache، ولا 304 إلا If-None-Match كيطابق الـ ETag.
+    """
+    cache = get_cache()
+    key = response_key(request, generation(generation_key))
+    entry = cache.get(key)
+    state = 'HIT'
+    if entry is None:
+        state = 'MISS'
+        response = render()
+        if response.status_code != 200:
+            return response
+        entry = make_entry(response)
+        cache.set(key, entry)
+    return respond(request, entry, state)
+
+
+async def acached(request, generation_key, render):
+    """نفس cached() للـ views async: render() هنا coroutine."""
+    cache = get_cache()
+    key = response_key(request, await ageneration(generation_key))
+    entry = await cache.aget(key)
+    state = 'HIT'
+    if entry is None:
+        state = 'MISS'
+        response = await render()
+        if response.status_code != 200:
+            return response
+        entry = make_entry(response)
+        await cache.aset(key, entry)
+    return respond(request, entry, state)
+
+
+CACHED_HEADERS = ('Link',)
+
+
+def make_entry(response):
+    content = bytes(response.content)
+    return {
+        'etag': f'"{hashlib.sha1(content).hexdigest()}"',
+        'content_type': response['Content-Type'],
+        'content': content,
+        # Link: الصفحة الجاية فـ ?pagination=off
+        'headers': {name: response[name] for name in CACHED_HEADERS if name in response},
+    }
+
+
+def respond(request, entry, state):
+    # مقارنة weak: CompressionMiddleware كيرد الـ ETag W/"..." فالأجوبة المضغوطة
+    etags = {tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))}
+    if entry['etag'] in etags or '*' in etags:
+        count('not_modified')
+        response = HttpResponseNotModified()
+    else:
+        count('hit' if state == 'HIT' else 'miss')
+        response = HttpResponse(entry['content'], content_type=entry['content_type'])
+        for name, value in entry.get('headers', {}).items():
+            response[name] = value
+    response['ETag'] = entry['etag']
+    response['X-Cache'] = state
+    return response
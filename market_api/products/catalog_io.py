@@ -0,0 +1,311 @@
+"""
+Import/export ديال الكاتالوج بـ CSV و XLSX.
+
+    GET  /api/products/export/?output=csv|xlsx   (نفس الفلاتر ديال /api/products/)
+    POST /api/products/import/                   (multipart: file=products.csv|.xlsx)
+
+الاستيراد كيقرا الملف سطر بسطر، كيتحقق من BATCH_SIZE سطر فكل مرة، وكيدير
+upsert بـ bulk_create(update_conflicts=True): سطر فيه id كيبدل المنتج، بلا id
+كيتزاد. الخانة الخاوية = ماتبدلش. الأسطر الغالطين كيترجعو فـ errors بالرقم ديالهم.
+
+ملف ماكيتقراش (encoding، zip خاسر، خانة كبيرة بزاف) كيرجع 400: الـ encoding
+كيتشاف قبل أول batch، والباقي كيقول شحال من سطر تسجل قبل الغلط.
+
+الـ export كيقرا بـ iterator() وكيكتب chunk بـ chunk: الذاكرة ثابتة كيفما كان
+عدد المنتجات.
+"""
+import codecs
+import csv
+import io
+import re
+import zipfile
+from itertools import islice
+from xml.sax.saxutils import escape
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from . import catalog_cache
+from .models import Product
+from .serializers import ProductImportSerializer
+from .streaming import ChunkWriter
+
+COLUMNS = ('id', 'name', 'description', 'price', 'category', 'stock', 'min_stock')
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 2000
+MAX_REPORTED_ERRORS = 1000
+
+
+# ==========================
+# Import
+# ==========================
+def file_format(name):
+    extension = name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+    if extension not in FORMATS:
+        raise ValidationError({'file': "الملف خاصو يكون .csv ولا .xlsx"})
+    return extension
+
+
+class UnreadableFile(Exception):
+    """الملف تقطع فالنص (import_products كيزيد شحال من سطر تسجل)."""
+
+
+def check_encoding(upload, encoding, chunk_size=64 * 1024):
+    """كيقرا الملف كامل مرة قبل الاستيراد باش حتى batch مايتسجل من ملف ماشي UTF-8."""
+    start = upload.tell()
+    decoder = codecs.getincrementaldecoder(encoding)()
+    try:
+        while chunk := upload.read(chunk_size):
+            decoder.decode(chunk)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        raise ValidationError({'file': "الـ CSV خاصو يكون UTF-8 (Excel: \"CSV UTF-8\")"})
+    finally:
+        upload.seek(start)
+
+
+def read_csv(upload):
+    # utf-8-sig: Excel كيزيد BOM فالأول
+    check_encoding(upload, 'utf-8-sig')
+    yield from csv.reader(io.TextIOWrapper(upload, encoding='utf-8-sig', newline=''))
+
+
+def read_xlsx(upload):
+    try:
+        import openpyxl
+        from openpyxl.utils.exceptions import InvalidFileException
+    except ImportError:
+        raise ValidationError({'file': "XLSX خاصو openpyxl (requirements.txt)"})
+    # read_only: openpyxl كيقرا الـ sheet XML بالتدريج، ماشي كامل فالذاكرة
+    try:
+        workbook = openpyxl.load_workbook(upload, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError):
+        # KeyError: zip صحيح ولكن بلا xl/workbook.xml
+        raise ValidationError({'file': "الملف ماشي XLSX صالح"})
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield ['' if value is None else value for value in row]
+    finally:
+        workbook.close()
+
+
+def read_rows(upload, name):
+    """كيرجع (رقم السطر، {column: value}) بلا الخانات الخاويين؛ السطر 1 هو الـ header."""
+    reader = read_xlsx(upload) if file_format(name) == 'xlsx' else read_csv(upload)
+    number = 0
+    try:
+        header = [str(column).strip().lower() for column in next(reader, [])]
+        unknown = [column for column in header if column and column not in COLUMNS]
+        if unknown or ('name' not in header and 'id' not in header):
+            raise ValidationError({'file': f"الأعمدة الممكنة: {', '.join(COLUMNS)}"})
+
+        number = 1
+        for number, row in enumerate(reader, 2):
+            data = {}
+            for column, value in zip(header, row):
+                if isinstance(value, str):
+                    value = value.strip()
+                if column and value not in ('', None):
+                    data[column] = value
+            if data:
+                yield number, data
+    except csv.Error as exc:
+        # بحال خانة فوق csv.field_size_limit() ولا NUL فالسطر
+        raise UnreadableFile(f"السطر {number + 1}: {exc}")
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, row, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row, 'errors': errors})
+
+    def as_dict(self):
+        # "المنتج ما كاينش" كيتعرف غير فـ save_batch، من بعد أخطاء الـ validation
+        self.errors.sort(key=lambda error: error['row'])
+        return {'created': self.created, 'updated': self.updated, 'failed': self.failed, 'errors': self.errors}
+
+
+def validate_batch(rows, report):
+    """[(row, data)] -> [(row, validated_data)] صالحين؛ الباقي كيمشي لـ report."""
+    # serializer واحد للجداد وواحد partial للتعديل: الـ fields كيتبناو مرة وحدة
+    creating, updating = ProductImportSerializer(), ProductImportSerializer(partial=True)
+    valid, seen = [], set()
+    for number, data in rows:
+        serializer = updating if 'id' in data else creating
+        try:
+            validated = serializer.run_validation(data)
+        except ValidationError as exc:
+            report.error(number, exc.detail)
+            continue
+        if 'id' in validated:
+            if validated['id'] in seen:
+                report.error(number, {'id': ["نفس الـ id تكرر فالملف"]})
+                continue
+            seen.add(validated['id'])
+        valid.append((number, validated))
+    return valid
+
+
+def save_batch(rows, report):
+    """upsert ديال batch واحد بـ INSERT ... ON CONFLICT(id) DO UPDATE."""
+    with transaction.atomic():
+        # الصفوف اللي غادي يتبدلو مقفولين: الخانات اللي ماتبعثوش كيبقاو كيف ماهوما
+        existing = Product.objects.select_for_update().in_bulk(
+            [data['id'] for _, data in rows if 'id' in data]
+        )
+        products = []
+        for number, data in rows:
+            if 'id' not in data:
+                products.append(Product(**data))
+                continue
+            product = existing.get(data['id'])
+            if product is None:
+                report.error(number, {'id': ["المنتج ما كاينش"]})
+                continue
+            for field, value in data.items():
+                setattr(product, field, value)
+            products.append(product)
+        if not products:
+            return
+
+        # update_fields: غير الأعمدة اللي تبعثو فهاد الـ batch (+ updated_at للـ /api/sync/)
+        columns = sorted({column for _, data in rows for column in data} - {'id'})
+        Product.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=['id'],
+            update_fields=columns + ['updated_at'],
+        )
+        # bulk_create ما كيصيفطش post_save
+        catalog_cache.invalidate(list(existing))
+        report.updated += sum(1 for product in products if product.pk in existing)
+        report.created += sum(1 for product in products if product.pk not in existing)
+
+
+def import_products(upload):
+    """upload: UploadedFile (فوق 2.5MB كيكون فملف مؤقت، ماشي فالذاكرة)."""
+    report = ImportReport()
+    try:
+        for batch in batches(read_rows(upload.file, upload.name), BATCH_SIZE):
+            save_batch(validate_batch(batch, report), report)
+    except UnreadableFile as exc:
+        # الـ batches اللي قبل الغلط تسجلو: الكلاينت خاصو يعرف شحال
+        committed = report.created + report.updated
+        raise ValidationError({'file': f"{exc} ({committed} منتج تسجل قبل هاد السطر)"})
+    return report.as_dict()
+
+
+# ==========================
+# Export
+# ==========================
+def export_rows(queryset):
+    return queryset.values_list(*COLUMNS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def export_csv(rows, chunk_size=64 * 1024):
+    buffer = io.StringIO()
+    buffer.write('﻿')  # BOM: Excel كيقرا العربية مزيان
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" Type="http://schemas.openxmlformats.org/'
+        'officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="products" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" Type="http://schemas.openxmlformats.org/'
+        'officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+SHEET_END = '</sheetData></worksheet>'
+# الحروف اللي ممنوعين فـ XML 1.0
+INVALID_XML_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def xlsx_cell(reference, value):
+    if isinstance(value, str):
+        text = escape(INVALID_XML_RE.sub('', value))
+        return f'<c r="{reference}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+    return f'<c r="{reference}"><v>{value}</v></c>'
+
+
+def xlsx_row(number, values):
+    cells = ''.join(
+        xlsx_cell(f'{chr(ord("A") + index)}{number}', value)
+        for index, value in enumerate(values) if value is not None
+    )
+    return f'<row r="{number}">{cells}</row>'
+
+
+def export_xlsx(rows, flush_every=1000):
+    """
+    XLSX مكتوب بيدينا (inline strings، بلا styles) فـ zip كيتبعث chunk بـ chunk.
+    openpyxl (write_only) كيكتب الملف كامل قبل ما يبدا يتبعث.
+    """
+    writer = ChunkWriter()
+    with zipfile.ZipFile(writer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(SHEET_START.encode())
+            sheet.write(xlsx_row(1, COLUMNS).encode())
+            for number, row in enumerate(rows, 2):
+                sheet.write(xlsx_row(number, row).encode())
+                if number % flush_every == 0:
+                    yield writer.pop()
+            sheet.write(SHEET_END.encode())
+    yield writer.pop()
@@ -0,0 +1,196 @@
+"""
+Filtering/ordering ديال /api/products/:
+
+    ?category=food,drinks  ?min_price=10  ?max_price=50  ?in_stock=1
+    ?search=atay           ?ordering=-price,name
+
+الـ search كيدوز من products_product_fts (FTS5) على SQLite، و icontains على غيرها.
+نفس الفلاتر كيتطبقو على /api/products/export/.
+
+و ديال /api/orders/ (و /api/orders/export/):
+
+    ?status=pending,paid   ?date_from=2026-10-01  ?date_to=2026-10-17
+    ?city=Rabat,Fes        ?phone=0600000000      ?email=a@b.ma
+"""
+import datetime
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection
+from django.db.models import Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Order
+from .serializers import query_list
+
+ORDERING_FIELDS = ('id', 'name', 'price', 'stock', 'category')
+FTS_TABLE = 'products_product_fts'
+TOKEN_RE = re.compile(r'\w+')
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+FTS_TRIGGERS = {
+    f"{FTS_TABLE}_ai": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON products_product BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+        END""",
+    f"{FTS_TABLE}_ad": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON products_product BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+        END""",
+    # UPDATE OF: تبدال الـ stock/price مايمسّش الـ index
+    f"{FTS_TABLE}_au": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, description ON products_product BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+        END""",
+}
+
+
+def install_fts(connection):
+    """
+    كيصاوب products_product_fts (external content) والـ triggers إلا ماكانوش.
+    الـ triggers كيتمسحو إلا SQLite عاود بنا products_product (AlterField...)،
+    داكشي علاش كيتعاود من post_migrate، ومع rebuild إلا كان شي واحد ناقص.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "name, description, content='products_product', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'products_product'"
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if set(FTS_TRIGGERS) <= existing:
+            return
+        for sql in FTS_TRIGGERS.values():
+            cursor.execute(sql)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def product_ordering(request):
+    """?ordering=-price,name -> ('-price', 'name', 'id'): id فالتالي باش الترتيب يكون فريد (keyset)."""
+    raw = request.query_params.get('ordering', '') if request is not None else ''
+    ordering = [name.strip() for name in raw.split(',') if name.strip()]
+    invalid = [name for name in ordering if name.lstrip('-') not in ORDERING_FIELDS]
+    if invalid:
+        raise ValidationError({'ordering': f"ordering ماشي صالح: {', '.join(invalid)}"})
+    if not any(name.lstrip('-') == 'id' for name in ordering):
+        ordering.append('id')
+    return tuple(ordering)
+
+
+def parse_price(params, name):
+    if not params.get(name):
+        return None
+    try:
+        return Decimal(params[name])
+    except InvalidOperation:
+        raise ValidationError({name: "الثمن خاصو يكون رقم"})
+
+
+def fts_query(text):
+    """نص المستعمل -> MATCH ديال FTS5: كل كلمة prefix ("atay"*)، والكلمات كاملين AND."""
+    return ' '.join(f'"{token}"*' for token in TOKEN_RE.findall(text))
+
+
+def search(queryset, text):
+    if connection.vendor != 'sqlite':
+        for token in TOKEN_RE.findall(text):
+            queryset = queryset.filter(Q(name__icontains=token) | Q(description__icontains=token))
+        return queryset
+    match = fts_query(text)
+    if not match:
+        return queryset
+    return queryset.filter(id__in=RawSQL(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match],
+    ))
+
+
+class ProductFilter(BaseFilterBackend):
+    def filter_queryset(self, request, queryset, view):
+        if view.action not in ('list', 'export'):
+            return queryset
+        params = request.query_params
+
+        categories = query_list(request, 'category')
+        if categories:
+            queryset = queryset.filter(category__in=categories)
+        min_price = parse_price(params, 'min_price')
+        if min_price is not None:
+            queryset = queryset.filter(price__gte=min_price)
+        max_price = parse_price(params, 'max_price')
+        if max_price is not None:
+            queryset = queryset.filter(price__lte=max_price)
+        if params.get('in_stock', '').lower() in TRUE_VALUES:
+            queryset = queryset.filter(stock__gt=0)
+        if params.get('search', '').strip():
+            queryset = search(queryset, params['search'])
+        return queryset.order_by(*product_ordering(request))
+
+
+def parse_date_param(params, name):
+    if not params.get(name):
+        return None
+    value = parse_date(params[name])
+    if value is None:
+        raise ValidationError({name: "التاريخ خاصو يكون YYYY-MM-DD"})
+    return value
+
+
+def start_of_day(day):
+    """بداية النهار فالـ timezone الحالية (نفس الحدود ديال created_at__date)."""
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+class OrderFilter(BaseFilterBackend):
+    """
+    الفلاتر كيقارنو created_at مباشرة (ماشي created_at__date) باش
+    order_status_created_idx / order_city_created_idx يتستعملو.
+    """
+    params = ('status', 'date_from', 'date_to', 'city', 'phone', 'email')
+
+    def applied(self, request):
+        """الفلاتر اللي عندهم قيمة (?status= ولا ?city=, ماكيفلترو والو)."""
+        params = request.query_params
+        return [name for name in self.params if params.get(name, '').strip(' ,')]
+
+    def filter_queryset(self, request, queryset, view):
+        if view.action not in ('list', 'export', 'transition'):
+            return queryset
+        params = request.query_params
+
+        statuses = query_list(request, 'status')
+        if statuses:
+            choices = dict(Order._meta.get_field('status').choices)
+            if not statuses <= set(choices):
+                raise ValidationError({'status': f"الحالات الممكنة: {', '.join(choices)}"})
+            queryset = queryset.filter(status__in=statuses)
+        date_from = parse_date_param(params, 'date_from')
+        if date_from is not None:
+            queryset = queryset.filter(created_at__gte=start_of_day(date_from))
+        date_to = parse_date_param(params, 'date_to')
+        if date_to is not None:
+            queryset = queryset.filter(created_at__lt=start_of_day(date_to + datetime.timedelta(days=1)))
+        cities = query_list(request, 'city')
+        if cities:
+            queryset = queryset.filter(city__in=cities)
+        if params.get('phone', '').strip():
+            queryset = queryset.filter(phone=params['phone'].strip())
+        if params.get('email', '').strip():
+            # LOWER(email) = LOWER(%s): نفس الـ expression ديال order_email_idx
+            queryset = queryset.alias(email_lower=Lower('email')).filter(
+                email_lower=Lower(Value(params['email'].strip()))
+            )
+        return queryset
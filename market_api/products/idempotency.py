@@ -0,0 +1,182 @@
+"""
+Idempotency-Key لـ POST /api/orders/.
+
+- الطلب الأول كيحجز الـ key (INSERT unique، commit دغيا) وكيخزن الجواب ديالو.
+- retry بنفس الـ key ونفس الـ body كيرجع نفس الجواب (Idempotent-Replayed: true)
+  من الـ cache (بلا DB)، ولا من الجدول إلا الـ cache نسى.
+- duplicate كيوصل والأول باقي كيتخدم كيتسنى حتى IDEMPOTENCY_WAIT_SECONDS، ومن بعد 409.
+- نفس الـ key مع body آخر: 422.
+- غير الأجوبة الناجحة (2xx) كيتخزنو: خطأ (validation، ستوك ناقص، 5xx) كيطلق الـ key
+  باش الـ retry يتعاود بصح (ماتبدل والو فالـ DB).
+- الحجز عندو lease (locked_until، IDEMPOTENCY_LEASE_SECONDS): إلا الـ worker مات
+  فوسط الطلب، retry من بعد الـ lease كياخد الـ key بلاصتو. الأول إلا كمل من بعد
+  ما تاخد منو كيدير rollback (ماكيتخلقش الطلب جوج مرات).
+
+الـ keys كيتمسحو من بعد IDEMPOTENCY_TTL (index على expires_at).
+"""
+import hashlib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, OperationalError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+POLL_INTERVAL = 0.05
+
+
+class LeaseLost(Exception):
+    pass
+
+
+def ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_TTL', 24 * 3600))
+
+
+def lease():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LEASE_SECONDS', 60))
+
+
+def stale(record, now):
+    """طلب باقي ماكملش والـ lease ديالو فات (الـ worker مات)."""
+    return record.status_code is None and (record.locked_until is None or record.locked_until < now)
+
+
+def cache_key(key):
+    return f"idempotency:{hashlib.sha256(key.encode()).hexdigest()}"
+
+
+def fingerprint(request):
+    sha = hashlib.sha256()
+    for part in (request.method.encode(), request.path.encode(), request.body):
+        sha.update(part)
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
+def replay(entry):
+    response = HttpResponse(entry['content'], status=entry['status_code'], content_type=entry['content_type'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def mismatch():
+    return JsonResponse({'detail': f"{HEADER} تستعمل من قبل مع طلب آخر."}, status=422)
+
+
+def claim(key, digest):
+    """
+    كيرجع (locked_until، None) إلا حجزنا الـ key، ولا (None، الـ IdempotencyKey اللي كاين).
+    """
+    while True:
+        now = timezone.now()
+        # الـ keys القدام (index على expires_at)
+        IdempotencyKey.objects.filter(expires_at__lt=now).delete()
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    key=key, fingerprint=digest, expires_at=now + ttl(), locked_until=now + lease(),
+                )
+            return record.locked_until, None
+        except IntegrityError:
+            pass
+        record = IdempotencyKey.objects.filter(key=key).first()
+        if record is None:
+            continue  # الأول فشل ومسح الـ key بيناتنا: نعاودو نحجزو
+        if record.fingerprint == digest and stale(record, now):
+            locked_until = now + lease()
+            taken = IdempotencyKey.objects.filter(
+                pk=record.pk, status_code__isnull=True, locked_until=record.locked_until,
+            ).update(locked_until=locked_until)
+            if taken:
+                return locked_until, None
+            continue
+        return None, record
+
+
+def wait_for(key):
+    deadline = time.monotonic() + getattr(settings, 'IDEMPOTENCY_WAIT_SECONDS', 10)
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        try:
+            record = IdempotencyKey.objects.filter(key=key).first()
+        except OperationalError:
+            # SQLite: الطلب الأول شاد الـ lock
+            continue
+        if record is None or record.status_code is not None:
+            return record
+        if stale(record, timezone.now()):
+            return None  # claim() كياخدو
+    return IdempotencyKey.objects.filter(key=key).first()
+
+
+def run(request, handler):
+    """handler() كيرجع جواب مرندر. بلا Idempotency-Key كيتعيط عليه مباشرة."""
+    key = request.headers.get(HEADER)
+    if not key:
+        return handler()
+    if len(key) > 255:
+        return JsonResponse({'detail': f"{HEADER} طويلة بزاف (255 حرف)."}, status=400)
+
+    digest = fingerprint(request)
+    cache = caches['default']
+    entry = cache.get(cache_key(key))
+    if entry is not None:
+        return replay(entry) if entry['fingerprint'] == digest else mismatch()
+
+    while True:
+        locked_until, record = claim(key, digest)
+        if record is None:
+            break
+        if record.fingerprint != digest:
+            return mismatch()
+        if record.status_code is None:
+            record = wait_for(key)
+            if record is None:
+                continue  # الأول فشل ولا مات: نعاودو نحجزو
+            if record.status_code is None:
+                return JsonResponse({'detail': "الطلب الأول باقي كيتخدم، عاود من بعد."}, status=409)
+        return replay(remember(record))
+
+    # غير الحجز ديالنا: إلا الـ lease فات شي طلب آخر يقدر يكون خداه
+    ours = IdempotencyKey.objects.filter(key=key, locked_until=locked_until, status_code__isnull=True)
+    record = None
+    try:
+        # الطلب والجواب المخزن كيتكوميتاو بجوج ولا والو
+        with transaction.atomic():
+            response = handler()
+            if 200 <= response.status_code < 300:
+                record = IdempotencyKey(
+                    key=key, fingerprint=digest, status_code=response.status_code,
+                    content_type=response.get('Content-Type', ''), content=bytes(response.content),
+                )
+                if not ours.update(
+                    status_code=record.status_code, content_type=record.content_type, content=record.content,
+                ):
+                    raise LeaseLost
+    except LeaseLost:
+        return JsonResponse({'detail': "الطلب تعاود من طلب آخر (lease فات)، عاود."}, status=409)
+    except BaseException:
+        ours.delete()
+        raise
+    if record is None:
+        ours.delete()
+        return response
+    remember(record)
+    return response
+
+
+def remember(record):
+    entry = {
+        'fingerprint': record.fingerprint,
+        'status_code': record.status_code,
+        'content_type': record.content_type,
+        'content': bytes(record.content),
+    }
+    caches['default'].set(cache_key(record.key), entry, int(ttl().total_seconds()))
+    return entry
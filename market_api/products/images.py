@@ -0,0 +1,100 @@
+"""
+Thumbnails ديال صور المنتجات.
+
+لكل صورة كنصاوبو نسخ صغار (PRODUCT_IMAGE_SIZES بالعرض) فـ
+MEDIA_ROOT/products/thumbs/، WebP إلا Pillow كيدعمو وإلا JPEG. كيتصاوبو
+ملي كتترفع الصورة (signal) ولا أول مرة كيطلبهم الـ serializer، ومن بعد
+كيتقراو من الديسك. الـ app كتختار أصغر نسخة اللي كتكفي من image_srcset.
+"""
+import os
+import tempfile
+
+from django.conf import settings
+from PIL import Image, ImageOps, features
+
+from . import mediafiles
+
+THUMBS_DIR = 'thumbs'
+
+
+def image_sizes():
+    return sorted(getattr(settings, 'PRODUCT_IMAGE_SIZES', (160, 320, 640)))
+
+
+def image_format():
+    wanted = getattr(settings, 'PRODUCT_IMAGE_FORMAT', 'WEBP').upper()
+    if wanted == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return wanted
+
+
+def thumbnail_name(name, width, fmt=None):
+    """products/x.jpg -> products/thumbs/x_jpg_320w.webp (نسبي لـ MEDIA_ROOT)."""
+    fmt = fmt or image_format()
+    directory, filename = os.path.split(name)
+    stem = filename.replace('.', '_')  # x.jpg و x.png مايتخلطوش
+    extension = 'webp' if fmt == 'WEBP' else 'jpg'
+    return os.path.join(directory, THUMBS_DIR, f"{stem}_{width}w.{extension}")
+
+
+def generate(name):
+    """كيصاوب جميع الأحجام ديال الصورة (ولا اللي ناقصين ولا قدام من الأصل)."""
+    source = os.path.join(settings.MEDIA_ROOT, name)
+    source_mtime = os.path.getmtime(source)
+    fmt = image_format()
+    quality = getattr(settings, 'PRODUCT_IMAGE_QUALITY', 80)
+
+    missing = []
+    for width in image_sizes():
+        path = os.path.join(settings.MEDIA_ROOT, thumbnail_name(name, width, fmt))
+        try:
+            if os.path.getmtime(path) >= source_mtime:
+                continue
+        except FileNotFoundError:
+            pass
+        missing.append((width, path))
+    if not missing:
+        return
+
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        if fmt == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+        for width, path in missing:
+            thumb = image.copy()
+            # ماكنكبروش الصورة: إلا كانت أصغر كتبقى بالعرض ديالها
+            thumb.thumbnail((width, width * 4), Image.LANCZOS)
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as handle:
+                thumb.save(handle, fmt, quality=quality, optimize=True)
+            os.replace(tmp, path)
+
+
+def srcset(image):
+    """{عرض: url} لـ ImageField (كيصاوب الناقصين أول مرة)."""
+    if not image:
+        return {}
+    try:
+        generate(image.name)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        # الصورة الأصلية مكاينةش، ماشي صورة، ولا فوق Image.MAX_IMAGE_PIXELS: نرجعو غير الأصل
+        return {}
+    fmt = image_format()
+    return {
+        width: mediafiles.versioned_name_url(image.storage, thumbnail_name(image.name, width, fmt).replace(os.sep, '/'))
+        for width in image_sizes()
+    }
+
+
+def delete(name):
+    for fmt in ('WEBP', 'JPEG'):
+        for width in image_sizes():
+            try:
+                os.remove(os.path.join(settings.MEDIA_ROOT, thumbnail_name(name, width, fmt)))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from products import benchmarks
+from products.benchmarks import BENCHMARKS, SUITE_SCALES
+
+
+class Command(BaseCommand):
+    help = (
+        "كيشغل benchmarks ديال الـ API على قاعدة بيانات مؤقتة. "
+        "--suite: المسارات الساخنة على 1k/100k/1M طلب مقارنة مع الـ baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help="الأسماء (الكل إلا ماتعطاش): " + ", ".join(BENCHMARKS))
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--suite', action='store_true', help="products.benchmarks.run_suite")
+        parser.add_argument(
+            '--scale', action='append', choices=list(SUITE_SCALES),
+            help="عدد الطلبات فالـ suite (كتقدر تعاودها؛ default: 1k)",
+        )
+        parser.add_argument('--baseline', default=benchmarks.BASELINE_PATH)
+        parser.add_argument('--save-baseline', action='store_true', help="كيكتب النتائج فالـ baseline")
+        parser.add_argument(
+            '--tolerance', type=float, default=0.5,
+            help="p50 أبطأ من الـ baseline بأكثر من هادي = regression (0.5 = +50%%)",
+        )
+
+    def handle(self, *args, **options):
+        if options['suite'] and options['names']:
+            raise CommandError("--suite ماكيتخلطش مع أسماء الـ benchmarks")
+        names = options['names'] or ([] if options['suite'] else list(BENCHMARKS))
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f"Benchmark غير معروف: {', '.join(unknown)}")
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            for name in names:
+                self.stdout.write(self.style.MIGRATE_HEADING(f"== {name}"))
+                BENCHMARKS[name](self.stdout, options['repeat'])
+            if options['suite']:
+                results = benchmarks.run_suite(self.stdout, options['repeat'], options['scale'] or ['1k'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['suite']:
+            self.suite_report(results, options)
+
+    def suite_report(self, results, options):
+        baseline = benchmarks.load_baseline(options['baseline'])
+        benchmarks.report(self.stdout, results, baseline)
+        if options['save_baseline']:
+            benchmarks.save_baseline(results, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f"baseline: {options['baseline']}"))
+            return
+        regressions = benchmarks.compare(results, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError("Regressions:\n" + "\n".join(regressions))
+        if baseline:
+            self.stdout.write(self.style.SUCCESS("ما كاين حتى regression مقارنة مع الـ baseline"))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from products import analytics
+from products.models import DailyOrderStats, DailyProductSales
+
+
+class Command(BaseCommand):
+    help = "كيعاود يحسب الـ summary tables ديال الـ analytics من الطلبات."
+
+    def handle(self, *args, **options):
+        analytics.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"{DailyOrderStats.objects.count()} daily order rows, "
+            f"{DailyProductSales.objects.count()} daily product rows"
+        ))
@@ -0,0 +1,58 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from products.receipts import FONT_NAME
+
+
+# كيتشغل فـ process جديد باش نقيسو cold start بصح
+PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter()
+import products.views
+views = time.perf_counter()
+from reportlab.pdfbase import pdfmetrics
+print(json.dumps({
+    'setup': setup - start,
+    'views': views - setup,
+    'fonts': pdfmetrics.getRegisteredFontNames(),
+}))
+"""
+
+
+def measure_startup(runs=5):
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'market_api.settings')}
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE], cwd=settings.BASE_DIR, env=env,
+            capture_output=True, text=True, check=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+class Command(BaseCommand):
+    help = "كيقيس الوقت ديال django.setup() و import products.views فـ process جديد."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+
+    def handle(self, *args, **options):
+        results = measure_startup(options['runs'])
+        for label in ('setup', 'views'):
+            values = [1000 * result[label] for result in results]
+            self.stdout.write(
+                f"{label:>6}: median {statistics.median(values):7.1f} ms, "
+                f"min {min(values):7.1f} ms, max {max(values):7.1f} ms"
+            )
+        loaded = FONT_NAME in results[-1]['fonts']
+        self.stdout.write(f"receipt font registered at import: {'yes' if loaded else 'no'}")
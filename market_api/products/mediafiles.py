@@ -0,0 +1,155 @@
+"""
+تقديم ملفات MEDIA فالإنتاج (بلاصة django.conf.urls.static اللي خدام غير فـ DEBUG).
+
+- URLs فيهم hash ديال المحتوى (?v=...) باش يتخزنو immutable عند الكلاينت.
+- ETag / Last-Modified و 304 على If-None-Match / If-Modified-Since.
+- Range requests (bytes=start-end) بـ 206.
+- FileResponse (wsgi.file_wrapper / sendfile)، ولا X-Accel-Redirect / X-Sendfile
+  إلا MEDIA_SENDFILE_HEADER مضبوط، باش الـ web server يبعث الملف بوحدو.
+"""
+import functools
+import hashlib
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, no-cache'
+CHUNK_SIZE = 64 * 1024
+
+
+@functools.lru_cache(maxsize=4096)
+def _digest(path, mtime_ns, size):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()[:16]
+
+
+def file_version(path):
+    """(hash ديال المحتوى، os.stat). الـ hash كيتحسب مرة وحدة لكل (path, mtime, size)."""
+    stat = os.stat(path)
+    return _digest(path, stat.st_mtime_ns, stat.st_size), stat
+
+
+def versioned_url(field):
+    """URL ديال ImageField/FileField مع ?v=<hash> (ولا بلا بيه إلا الملف ماكاينش)."""
+    return versioned_name_url(field.storage, field.name)
+
+
+def versioned_name_url(storage, name):
+    url = storage.url(name)
+    try:
+        version, _ = file_version(storage.path(name))
+    except (NotImplementedError, OSError):
+        # storage بعيد (S3...) ولا الملف ماكاينش
+        return url
+    return f"{url}?v={version}"
+
+
+def parse_range(header, size):
+    """كيرجع (start, end) ولا None (الـ header ماشي صالح/بزاف ديال ranges)، ولا False إلا خارج الملف."""
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        return False
+    if end < start:
+        return None
+    return start, end
+
+
+def file_chunks(path, start, end):
+    with open(path, 'rb') as handle:
+        handle.seek(start)
+        remaining = end - start + 1
+        while remaining:
+            chunk = handle.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def serve(request, path):
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404(path)
+    try:
+        version, stat = file_version(full_path)
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        raise Http404(path)
+
+    etag = f'"{version}"'
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': IMMUTABLE if request.GET.get('v') == version else REVALIDATE,
+        'Accept-Ranges': 'bytes',
+    }
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        for header, value in headers.items():
+            not_modified[header] = value
+        return not_modified
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    size = stat.st_size
+
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if range_header and if_range_matches(request.headers.get('If-Range'), etag, stat.st_mtime):
+        byte_range = parse_range(range_header, size)
+        if byte_range is False:
+            response = HttpResponse(status=416, headers=headers)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    sendfile_header = getattr(settings, 'MEDIA_SENDFILE_HEADER', None)
+    if sendfile_header:
+        # nginx/apache كيبعثو الملف (وكيتكلفو بالـ Range) بلا ما يدوز من Python
+        prefix = getattr(settings, 'MEDIA_SENDFILE_PREFIX', settings.MEDIA_URL)
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response[sendfile_header] = prefix + path
+        return response
+
+    if byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            file_chunks(full_path, start, end), status=206, content_type=content_type, headers=headers,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+        return response
+
+    return FileResponse(open(full_path, 'rb'), content_type=content_type, headers=headers)
+
+
+def if_range_matches(if_range, etag, mtime):
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and int(mtime) <= date
@@ -0,0 +1,269 @@
+"""
+Metrics ديال الـ API بـ Prometheus text format على /metrics/.
+
+لكل view و action (OrderViewSet/list، product_detail/get...):
+
+    market_request_duration_seconds    histogram ديال الـ latency (+ status: 2xx، 4xx...)
+    market_request_queries             histogram ديال عدد الـ SQL queries فالطلب
+    market_request_db_seconds          histogram ديال الوقت فالـ DB
+    market_request_serializer_seconds  histogram ديال الوقت فـ to_representation
+    market_request_pdf_seconds         histogram ديال الوقت فرسم الـ receipts
+    market_pdf_render_seconds          histogram لكل receipt كيترسم فهاد الـ process
+    market_catalog_cache_*             catalog_cache.stats()
+
+الأرقام كيتجمعو فالذاكرة ديال كل process (MetricsMiddleware): مع بزاف ديال
+workers، Prometheus خاصو يقرا كل واحد بوحدو. Server-Timing (app، db، serializer،
+pdf) كيتزاد للجواب غير إلا METRICS_SERVER_TIMING=True.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_lock = threading.Lock()
+_current = ContextVar('market_request_metrics', default=None)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets, labels):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labels = labels
+        # labels -> [عدد فكل bucket (ماشي cumulative)..., +Inf] + sum
+        self.series = defaultdict(lambda: [0] * (len(buckets) + 1) + [0.0])
+
+    def observe(self, value, *labels):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with _lock:
+            row = self.series[labels]
+            row[index] += 1
+            row[-1] += value
+
+    def clear(self):
+        with _lock:
+            self.series.clear()
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            series = {labels: list(row) for labels, row in self.series.items()}
+        for labels, row in sorted(series.items()):
+            base = [f'{name}="{escape(value)}"' for name, value in zip(self.labels, labels)]
+            total = 0
+            for bound, count in zip((*self.buckets, '+Inf'), row):
+                total += count
+                bucket = ','.join(base + [f'le="{bound}"'])
+                lines.append(f"{self.name}_bucket{{{bucket}}} {total}")
+            suffix = '{' + ','.join(base) + '}' if base else ''
+            lines.append(f"{self.name}_sum{suffix} {row[-1]!r}")
+            lines.append(f"{self.name}_count{suffix} {total}")
+        return lines
+
+
+REQUEST_LABELS = ('view', 'action')
+REQUEST_SECONDS = Histogram(
+    'market_request_duration_seconds', "Request latency.", LATENCY_BUCKETS, REQUEST_LABELS + ('status',)
+)
+REQUEST_QUERIES = Histogram(
+    'market_request_queries', "SQL queries per request.", QUERY_BUCKETS, REQUEST_LABELS
+)
+REQUEST_DB_SECONDS = Histogram(
+    'market_request_db_seconds', "Time spent in SQL per request.", LATENCY_BUCKETS, REQUEST_LABELS
+)
+REQUEST_SERIALIZER_SECONDS = Histogram(
+    'market_request_serializer_seconds', "Time spent in serializers per request.", LATENCY_BUCKETS, REQUEST_LABELS
+)
+REQUEST_PDF_SECONDS = Histogram(
+    'market_request_pdf_seconds', "Time spent rendering receipts per request.", LATENCY_BUCKETS, REQUEST_LABELS
+)
+PDF_RENDER_SECONDS = Histogram(
+    'market_pdf_render_seconds', "Receipt PDF render time.", LATENCY_BUCKETS, ()
+)
+HISTOGRAMS = (
+    REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_DB_SECONDS,
+    REQUEST_SERIALIZER_SECONDS, REQUEST_PDF_SECONDS, PDF_RENDER_SECONDS,
+)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def reset():
+    for histogram in HISTOGRAMS:
+        histogram.clear()
+
+
+# ==========================
+# القياس ديال طلب واحد
+# ==========================
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.timings = defaultdict(float)
+        self.active = set()
+
+
+def start():
+    """كيبدا القياس ديال الطلب الحالي؛ كيرجع token لـ finish()."""
+    return _current.set(RequestMetrics())
+
+
+def finish(token):
+    state = _current.get()
+    _current.reset(token)
+    return state
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def timer(name, histogram=None):
+    """
+    كيزيد الوقت لـ timings[name] ديال الطلب الحالي (إلا كان). الـ timers
+    المتداخلين بنفس الاسم (serializer داخل serializer) كيتحسبو مرة وحدة.
+    """
+    state = _current.get()
+    nested = state is not None and name in state.active
+    if state is not None and not nested:
+        state.active.add(name)
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - began
+        if histogram is not None:
+            histogram.observe(elapsed)
+        if state is not None and not nested:
+            state.timings[name] += elapsed
+            state.active.discard(name)
+
+
+def db_wrapper(execute, sql, params, many, context):
+    state = _current.get()
+    if state is None:
+        return execute(sql, params, many, context)
+    began = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        state.queries += 1
+        state.db += time.perf_counter() - began
+
+
+def install(connection):
+    # فالأول: connection.execute_wrapper() كيحيد الأخير ملي كيسالي
+    if db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, db_wrapper)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    # الـ threads ديال sync_to_async كيحلو connections جداد
+    install(connection)
+
+
+class TimedSerializerMixin:
+    """to_representation كيتحسب فـ market_request_serializer_seconds."""
+
+    def to_representation(self, instance):
+        with timer('serializer'):
+            return super().to_representation(instance)
+
+
+# ==========================
+# Labels و Server-Timing
+# ==========================
+def view_labels(request):
+    """(view، action): ViewSet -> (OrderViewSet، list)؛ view عادي -> (url name، method)."""
+    method = request.method.lower()
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched', method
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is not None:
+        actions = getattr(match.func, 'actions', None) or {}
+        return view_class.__name__, actions.get(method, method)
+    return match.url_name or match.func.__name__, method
+
+
+def record(request, response, state):
+    elapsed = time.perf_counter() - state.started
+    labels = view_labels(request)
+    REQUEST_SECONDS.observe(elapsed, *labels, f"{response.status_code // 100}xx")
+    REQUEST_QUERIES.observe(state.queries, *labels)
+    REQUEST_DB_SECONDS.observe(state.db, *labels)
+    REQUEST_SERIALIZER_SECONDS.observe(state.timings['serializer'], *labels)
+    if state.timings['pdf']:
+        REQUEST_PDF_SECONDS.observe(state.timings['pdf'], *labels)
+
+    if getattr(settings, 'METRICS_SERVER_TIMING', False):
+        parts = [f'app;dur={elapsed * 1000:.1f}', f'db;dur={state.db * 1000:.1f};desc="{state.queries} queries"']
+        parts += [
+            f'{name};dur={seconds * 1000:.1f}' for name, seconds in sorted(state.timings.items()) if seconds
+        ]
+        response['Server-Timing'] = ', '.join(parts)
+    return response
+
+
+# ==========================
+# /metrics/
+# ==========================
+def expose():
+    # lazy: receipts كيستورد metrics
+    from . import catalog_cache, receipts
+
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.expose()
+
+    stats = catalog_cache.stats()
+    lines += [
+        "# HELP market_catalog_cache_requests_total Catalog cache lookups by result.",
+        "# TYPE market_catalog_cache_requests_total counter",
+    ]
+    lines += [
+        f'market_catalog_cache_requests_total{{result="{escape(name)}"}} {value}'
+        for name, value in sorted(stats.items()) if name != 'hit_ratio'
+    ]
+    lines += [
+        "# HELP market_catalog_cache_hit_ratio Share of catalog requests served from cache.",
+        "# TYPE market_catalog_cache_hit_ratio gauge",
+        f"market_catalog_cache_hit_ratio {stats['hit_ratio']!r}",
+    ]
+
+    # lru_cache ديال rtl() فهاد الـ process (receipts.shaping_stats)
+    shaping = receipts.shaping_stats()
+    lines += [
+        "# HELP market_receipt_shaping_cache_requests_total Arabic shaping cache lookups by result.",
+        "# TYPE market_receipt_shaping_cache_requests_total counter",
+        f'market_receipt_shaping_cache_requests_total{{result="hit"}} {shaping["hits"]}',
+        f'market_receipt_shaping_cache_requests_total{{result="miss"}} {shaping["misses"]}',
+        "# HELP market_receipt_shaping_cache_entries Entries in the Arabic shaping cache.",
+        "# TYPE market_receipt_shaping_cache_entries gauge",
+        f"market_receipt_shaping_cache_entries {shaping['size']}",
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """GET /metrics/ (إلا METRICS_TOKEN معمر: Authorization: Bearer <token>)."""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponseForbidden()
+    return HttpResponse(expose(), content_type=CONTENT_TYPE)
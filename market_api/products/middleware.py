@@ -0,0 +1,171 @@
+"""
+CompressionMiddleware: ضغط الأجوبة حسب Accept-Encoding: zstd، br (Brotli) ولا gzip.
+
+- غير الأجوبة اللي فوق COMPRESSION_MIN_SIZE (أجوبة صغار كيكبرو بالـ headers).
+- غير JSON/MessagePack/نص: الصور و PDF و ZIP مضغوطين من قبل.
+- الـ level لكل encoding فـ COMPRESSION_LEVELS.
+- brotli و zstandard اختياريين: إلا ماكانوش كيبقى gzip.
+
+MetricsMiddleware: latency و queries و الوقت فالـ DB لكل view (products.metrics).
+"""
+import gzip
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+from . import metrics
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+DEFAULT_LEVELS = {'zstd': 3, 'br': 4, 'gzip': 6}
+COMPRESSIBLE = re.compile(r'^(application/(json|msgpack|javascript|xml)|text/)')
+
+
+def compress_gzip(data, level):
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def compress_br(data, level):
+    return brotli.compress(data, quality=level)
+
+
+def compress_zstd(data, level):
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def available_encodings():
+    encodings = {'gzip': compress_gzip}
+    if brotli is not None:
+        encodings['br'] = compress_br
+    if zstandard is not None:
+        encodings['zstd'] = compress_zstd
+    return encodings
+
+
+def accepted_encodings(header):
+    """Accept-Encoding -> {encoding: q}."""
+    accepted = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        match = re.search(r'q\s*=\s*([0-9.]+)', params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(header, preference=None):
+    """أحسن encoding (q الكبير، ومن بعد ترتيب COMPRESSION_ENCODINGS)، ولا None."""
+    accepted = accepted_encodings(header)
+    preference = preference or getattr(settings, 'COMPRESSION_ENCODINGS', ['zstd', 'br', 'gzip'])
+    encodings = available_encodings()
+    candidates = [
+        (accepted.get(name, accepted.get('*', 0)), -index, name)
+        for index, name in enumerate(preference)
+        if name in encodings
+    ]
+    candidates = [candidate for candidate in candidates if candidate[0] > 0]
+    return max(candidates)[2] if candidates else None
+
+
+def compress(data, encoding):
+    levels = {**DEFAULT_LEVELS, **getattr(settings, 'COMPRESSION_LEVELS', {})}
+    return available_encodings()[encoding](data, levels[encoding])
+
+
+class CompressionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        if (
+            response.streaming
+            or response.status_code != 200
+            or response.has_header('Content-Encoding')
+            or not COMPRESSIBLE.match(response.get('Content-Type', ''))
+        ):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < getattr(settings, 'COMPRESSION_MIN_SIZE', 1024):
+            return response
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # نفس الـ representation ماشي byte-for-byte: ETag قوي كيولي weak (بحال GZipMiddleware)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+
+class MetricsMiddleware:
+    """خاصو يكون الأول فـ MIDDLEWARE باش الـ latency تحسب كلشي."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            state = metrics.finish(token)
+        return metrics.record(request, response, state)
+
+    async def __acall__(self, request):
+        token = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            state = metrics.finish(token)
+        return metrics.record(request, response, state)
+
+    def start(self):
+        # connections اللي تحلو قبل ما metrics يتـ import (connection_created فات)
+        for connection in connections.all(initialized_only=True):
+            metrics.install(connection)
+        return metrics.start()
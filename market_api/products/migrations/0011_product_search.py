@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-17 11:25
+
+from django.db import migrations, models
+
+
+def create_fts(apps, schema_editor):
+    from products.filters import install_fts
+    install_fts(schema_editor.connection)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in ('ai', 'ad', 'au'):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS products_product_fts_{name}")
+    schema_editor.execute("DROP TABLE IF EXISTS products_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_low_stock_index_stock_alert'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='product_price_idx'),
+        ),
+        # FTS5 على name/description (SQLite فقط)، متزامن بـ triggers
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -1,72 +1,190 @@
-from django.db import models
-from django.core.exceptions import ValidationError
-
-
-class Product(models.Model):
-    name = models.CharField(max_length=100)
-    description = models.TextField(default="", blank=True)  # ✅ مايبقاش يوقفك
-    price = models.DecimalField(max_digits=10, decimal_places=2, default=0)  # ✅ default
-    image = models.ImageField(upload_to='products/', blank=True, null=True)  # ✅ يقبل فارغ
-    category = models.CharField(max_length=50, default="general")  # ✅ default
-
-    stock = models.PositiveIntegerField(default=10)
-    min_stock = models.PositiveIntegerField(default=5)
-
-    def __str__(self):
-        return self.name
-
-
-class Order(models.Model):
-    client_name = models.CharField(max_length=255, blank=True, null=True)
-    phone = models.CharField(max_length=50, blank=True, null=True)
-    email = models.EmailField(blank=True, null=True)
-    city = models.CharField(max_length=100, blank=True, null=True)
-    address = models.TextField(blank=True, null=True)
-    total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
-    created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)  # ✅ يقبل القديم
-
-    status = models.CharField(
-        max_length=20,
-        choices=[
-            ('pending', 'Pending'),
-            ('paid', 'Paid'),
-            ('shipped', 'Shipped')
-        ],
-        default='pending'
-    )
-
-    def __str__(self):
-        return f"Order {self.id} by {self.client_name}"
-
-    @property
-    def paid(self):
-        return self.status == "paid"
-
-
-class OrderItem(models.Model):
-    order = models.ForeignKey(Order, related_name="items", on_delete=models.CASCADE)
-    product = models.ForeignKey(Product, on_delete=models.CASCADE)
-    quantity = models.PositiveIntegerField(default=1)  # ✅ عندو default
-    price = models.DecimalField(max_digits=10, decimal_places=2, default=0)  # ✅ default
-
-    def save(self, *args, **kwargs):
-        # التحقق من الستوك
-        if self._state.adding:
-            if self.product.stock < self.quantity:
-                raise ValidationError("المخزون غير كافي لهذا المنتج")
-            self.product.stock -= self.quantity
-        else:
-            old = OrderItem.objects.get(pk=self.pk)
-            diff = self.quantity - old.quantity
-            if diff > 0 and self.product.stock < diff:
-                raise ValidationError("المخزون غير كافي للتعديل")
-            self.product.stock -= diff
-
-        self.product.save()
-        super().save(*args, **kwargs)
-
-    def delete(self, *args, **kwargs):
-        # إرجاع الكمية عند الحذف
-        self.product.stock += self.quantity
-        self.product.save()
-        super().delete(*args, **kwargs)
+from django.db import models, transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+
+class Product(models.Model):
+    name = models.CharField(max_length=100)
+    description = models.TextField(default="", blank=True)  # ✅ مايبقاش يوقفك
+    price = models.DecimalField(max_digits=10, decimal_places=2, default=0)  # ✅ default
+    image = models.ImageField(upload_to='products/', blank=True, null=True)  # ✅ يقبل فارغ
+    category = models.CharField(max_length=50, default="general")  # ✅ default
+
+    stock = models.PositiveIntegerField(default=10)
+    min_stock = models.PositiveIntegerField(default=5)
+    # /api/sync/: queryset.update() (stock.adjust...) خاصو يحطها بيديه
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # partial index: غير المنتجات اللي خاصهم يتعاودو يتشراو (stock <= min_stock)
+            models.Index(
+                fields=['stock'],
+                condition=models.Q(stock__lte=models.F('min_stock')),
+                name='product_low_stock_idx',
+            ),
+            # ?category= (مع ?min_price/?max_price ولا ?ordering=price داخل category)
+            models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+            models.Index(fields=['price'], name='product_price_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def low_stock(self):
+        return self.stock <= self.min_stock
+
+
+class Order(models.Model):
+    client_name = models.CharField(max_length=255, blank=True, null=True)
+    phone = models.CharField(max_length=50, blank=True, null=True)
+    email = models.EmailField(blank=True, null=True)
+    city = models.CharField(max_length=100, blank=True, null=True)
+    address = models.TextField(blank=True, null=True)
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)  # ✅ يقبل القديم
+    # كتبدل حتى مع تبديل الـ items (OrderItem.save/delete)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            ('pending', 'Pending'),
+            ('paid', 'Paid'),
+            ('shipped', 'Shipped')
+        ],
+        default='pending'
+    )
+
+    # POST /api/orders/transition/: الحالة الجديدة -> الحالة اللي خاص الطلب يكون فيها
+    TRANSITIONS = {'paid': 'pending', 'shipped': 'paid'}
+
+    class Meta:
+        indexes = [
+            # بلا فلتر: الترتيب الافتراضي ديال OrderPagination (-created_at, -id)
+            models.Index(fields=['created_at'], name='order_created_idx'),
+            # ?status=pending&date_from=... (مرتبين بـ created_at بحال OrderPagination)
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+            models.Index(fields=['city', 'created_at'], name='order_city_created_idx'),
+            models.Index(fields=['phone'], name='order_phone_idx'),
+            # ?email= ماكيفرقش بين الحروف الكبار والصغار
+            models.Index(Lower('email'), name='order_email_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order {self.id} by {self.client_name}"
+
+    @property
+    def paid(self):
+        return self.status == "paid"
+
+
+class OrderItem(models.Model):
+    order = models.ForeignKey(Order, related_name="items", on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)  # ✅ عندو default
+    price = models.DecimalField(max_digits=10, decimal_places=2, default=0)  # ✅ default
+
+    def save(self, *args, **kwargs):
+        # التحقق من الستوك: كلشي كيدوز من products.stock (UPDATE مشروط)
+        from . import stock
+
+        with transaction.atomic():
+            deltas = {self.product_id: self.quantity}
+            if not self._state.adding:
+                old_product_id, old_quantity = OrderItem.objects.values_list(
+                    'product_id', 'quantity'
+                ).get(pk=self.pk)
+                deltas[old_product_id] = deltas.get(old_product_id, 0) - old_quantity
+
+            products = stock.adjust(deltas)
+            if self.product_id in products:
+                self.product.stock = products[self.product_id].stock
+            super().save(*args, **kwargs)
+            Order.objects.filter(pk=self.order_id).update(updated_at=timezone.now())
+
+    def delete(self, *args, **kwargs):
+        # إرجاع الكمية عند الحذف
+        from . import stock
+
+        with transaction.atomic():
+            products = stock.release({self.product_id: self.quantity})
+            if self.product_id in products:
+                self.product.stock = products[self.product_id].stock
+            result = super().delete(*args, **kwargs)
+            Order.objects.filter(pk=self.order_id).update(updated_at=timezone.now())
+            return result
+
+
+class Tombstone(models.Model):
+    """سجل ديال الحذف: /api/sync/ كيقول للتطبيق شنو يمسح من عندو."""
+    model = models.CharField(max_length=20)  # 'product' / 'order'
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Idempotency-Key ديال POST /api/orders/: الجواب الأول كيتعاود للـ retries.
+    status_code فارغ = الطلب الأول باقي كيتخدم (الـ duplicates كيتسناوه) حتى locked_until.
+    """
+    key = models.CharField(max_length=255, unique=True)
+    fingerprint = models.CharField(max_length=64)  # sha256 ديال method + path + body
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True, default="")
+    content = models.BinaryField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+    # lease ديال الحجز: من بعدو retry ياخد الـ key (الـ worker مات)
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.key
+
+
+class StockAlert(models.Model):
+    """
+    Event كيتسجل غير ملي منتج كيدوز الحد (min_stock) فـ stock.adjust:
+    low = نزل تحت الحد، restocked = طلع فوقو. الـ id كيتستعمل كـ cursor.
+    """
+    LOW = 'low'
+    RESTOCKED = 'restocked'
+
+    product = models.ForeignKey(Product, related_name="stock_alerts", on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=[(LOW, 'Low'), (RESTOCKED, 'Restocked')])
+    stock = models.PositiveIntegerField()
+    min_stock = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+# ==========================
+# Analytics (summary tables)
+# ==========================
+class DailyOrderStats(models.Model):
+    """عدد الطلبات والمداخيل لكل (نهار، مدينة، حالة). كيتحدثو من products.analytics."""
+    date = models.DateField()
+    city = models.CharField(max_length=100, blank=True, default="")
+    status = models.CharField(max_length=20)
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'city', 'status'], name='daily_order_stats_key'),
+        ]
+
+
+class DailyProductSales(models.Model):
+    """الكمية المبيوعة من كل منتج فكل نهار. كيتحدثو من products.analytics."""
+    date = models.DateField()
+    product = models.ForeignKey(Product, related_name="daily_sales", on_delete=models.CASCADE)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product'], name='daily_product_sales_key'),
+        ]
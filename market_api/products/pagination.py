@@ -0,0 +1,148 @@
+"""
+Keyset (cursor) pagination.
+
+كل list كيتقسم (page_size افتراضي 50، max_page_size 500): {next, results}.
+التطبيقات القديمة اللي كتسنى ليستة كتبعث ?pagination=off: نفس الشكل القديم
+(ليستة) ولكن محدودة بـ max_page_size، والصفحة الجاية فـ header Link: <url>; rel="next".
+"""
+import base64
+import json
+
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .filters import product_ordering
+
+
+def encode_value(value):
+    # isoformat كامل: DjangoJSONEncoder كيقطع الـ microseconds
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)  # Decimal
+
+
+class KeysetPagination(BasePagination):
+    ordering = ('-id',)
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    legacy_query_param = 'pagination'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def legacy(self, request):
+        """?pagination=off: ليستة بلا {next, results} (التطبيقات القديمة)."""
+        return request.query_params.get(self.legacy_query_param) == 'off'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request)))
+
+    def page_queryset(self, queryset, request):
+        """الـ queryset ديال الصفحة (page_size + 1 صف). (للـ async ORM)"""
+        params = request.query_params
+        self.request = request
+        self.is_legacy = self.legacy(request)
+        self.fields = [
+            (name.lstrip('-'), name.startswith('-'), queryset.model._meta.get_field(name.lstrip('-')))
+            for name in self.get_ordering(request)
+        ]
+        queryset = queryset.order_by(*[
+            F(name).desc(nulls_last=True) if desc else F(name).asc(nulls_last=True)
+            for name, desc, _ in self.fields
+        ])
+
+        cursor = params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self.after(self.decode_cursor(cursor)))
+
+        self.current_page_size = self.get_page_size(request)
+        return queryset[:self.current_page_size + 1]
+
+    def set_page(self, rows):
+        self.has_next = len(rows) > self.current_page_size
+        self.page = rows[:self.current_page_size]
+        return self.page
+
+    def get_ordering(self, request):
+        return self.ordering
+
+    def get_page_size(self, request):
+        default = self.max_page_size if self.legacy(request) else self.page_size
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return default
+        return max(1, min(size, self.max_page_size))
+
+    def after(self, values):
+        """الصفوف اللي جايين من بعد values فالترتيب (lexicographic، NULL فالتالي)."""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, desc, field), value in zip(self.fields, values):
+            if value is None:
+                strictly_after = Q(pk__in=[])
+            else:
+                strictly_after = Q(**{f"{name}__{'lt' if desc else 'gt'}": value})
+                if field.null:
+                    strictly_after |= Q(**{f"{name}__isnull": True})
+            condition |= equal & strictly_after
+            equal &= Q(**{f"{name}__isnull": True}) if value is None else Q(**{name: value})
+        return condition
+
+    def encode_cursor(self, row):
+        values = [getattr(row, name) for name, _, _ in self.fields]
+        raw = json.dumps(values, default=encode_value, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            return [
+                None if value is None else field.to_python(value)
+                for (_, _, field), value in zip(self.fields, values)
+            ]
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_data(self, data):
+        if self.is_legacy:
+            return data
+        return {'next': self.get_next_link(), 'results': data}
+
+    def get_headers(self):
+        next_link = self.get_next_link() if self.is_legacy else None
+        return {'Link': f'<{next_link}>; rel="next"'} if next_link else {}
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data), headers=self.get_headers())
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ProductPagination(KeysetPagination):
+    def get_ordering(self, request):
+        # نفس الترتيب ديال ProductFilter (?ordering=)
+        return product_ordering(request)
+
+
+class OrderPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
@@ -0,0 +1,484 @@
+"""
+رسم الـ receipts (PDF) والكاش ديالهم.
+
+الرسم كيخدم على snapshot (dict) ديال الطلب ماشي على الـ model، والكاش
+content-addressed: الساروت هو hash ديال الـ snapshot، يعني أي تغيير فالطلب
+ولا فالـ items كيعطي ملف جديد. الملفات كيتخزنو فـ MEDIA_ROOT/receipts/<order_id>/
+(invalidate كيمسح دوسي واحد بلا ما يقرا الكاش كامل) مع حد أقصى للحجم (LRU
+على mtime). الحجم كيتحسب تقريبا فكل process، والكاش كيتقرا كامل غير ملي
+هاد التقدير كيفوت الحد.
+"""
+import contextlib
+import functools
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from django.conf import settings
+
+from reportlab.pdfgen import canvas
+from reportlab.lib.units import mm
+from reportlab.lib import colors
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+import arabic_reshaper
+from bidi.algorithm import get_display
+
+from . import metrics
+from .streaming import ChunkWriter
+
+logger = logging.getLogger(__name__)
+
+RECEIPT_SIZE = (80 * mm, 200 * mm)
+# كتزاد مع كل تغيير فالرسم باش الكاش القديم مايتستعملش
+RECEIPT_LAYOUT = 2
+
+
+# ==========================
+# الخط العربي (كيتسجل أول مرة كنرسمو، ماشي فالـ import)
+# ==========================
+FONT_NAME = 'Arabic'
+FALLBACK_FONT = 'Helvetica'
+_font = None
+_font_lock = threading.Lock()
+
+
+def find_font():
+    """RECEIPT_FONT_PATH، ولا أول ملف من RECEIPT_FONT_FILES فـ RECEIPT_FONT_DIRS."""
+    path = getattr(settings, 'RECEIPT_FONT_PATH', None)
+    if path and os.path.isfile(path):
+        return str(path)
+
+    wanted = [name.lower() for name in getattr(settings, 'RECEIPT_FONT_FILES', ())]
+    found = {}
+    for directory in getattr(settings, 'RECEIPT_FONT_DIRS', ()):
+        for root, _, files in os.walk(directory):
+            for filename in files:
+                if filename.lower() in wanted:
+                    found.setdefault(filename.lower(), os.path.join(root, filename))
+        for name in wanted:
+            if name in found:
+                return found[name]
+    return None
+
+
+def receipt_font():
+    """كيرجع سمية الخط المسجل فـ reportlab (وكيسجلو أول مرة)."""
+    global _font
+    if _font is None:
+        with _font_lock:
+            if _font is None:
+                path = find_font()
+                if path:
+                    pdfmetrics.registerFont(TTFont(FONT_NAME, path))
+                    _font = FONT_NAME
+                else:
+                    logger.warning(
+                        "No Arabic font found (RECEIPT_FONT_PATH / RECEIPT_FONT_DIRS), "
+                        "receipts will use %s", FALLBACK_FONT,
+                    )
+                    _font = FALLBACK_FONT
+    return _font
+
+
+@functools.lru_cache(maxsize=getattr(settings, 'RTL_CACHE_SIZE', 4096))
+def rtl(text):
+    """
+    reshape + bidi (السطر ديما RTL). مخزن فـ LRU: الـ labels كيتشكلو مرة وحدة
+    فالـ process، والقيم اللي كيتعاودو (أسماء المنتجات، المدن...) حتى هوما.
+    """
+    reshaped = arabic_reshaper.reshape(text)
+    bidi_text = get_display(reshaped, base_dir='R')
+    return bidi_text
+
+
+@functools.lru_cache(maxsize=getattr(settings, 'RTL_CACHE_SIZE', 4096))
+def text_width(text, font, size):
+    return pdfmetrics.stringWidth(text, font, size)
+
+
+def draw_rtl(p, x, y, *parts):
+    """
+    كيرسم سطر RTL مقسوم لـ parts (بالترتيب المنطقي: label ثم القيمة...) من
+    اليمين لليسار. كل part كيتشكل بوحدو، يعني "الاسم: " كيتشكل مرة وحدة
+    ماشي مع كل اسم جديد.
+    """
+    for part in parts:
+        shaped = rtl(part)
+        p.drawRightString(x, y, shaped)
+        x -= text_width(shaped, p._fontname, p._fontsize)
+
+
+def shaping_stats():
+    info = rtl.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'maxsize': info.maxsize}
+
+
+def receipt_data(order):
+    """كل شي اللي كيبان فالـ receipt (+ status)، بلا objects ديال Django."""
+    created_at = order.created_at
+    return {
+        'id': order.id,
+        'status': order.status,
+        'client_name': order.client_name,
+        'phone': order.phone,
+        'city': order.city,
+        'total': str(order.total),
+        'date': created_at.strftime('%Y-%m-%d') if created_at else None,
+        'time': created_at.strftime('%H:%M') if created_at else None,
+        'items': [
+            [item.product.name, item.quantity, str(item.price)]
+            for item in order.items.all()
+        ],
+    }
+
+
+def receipt_key(data):
+    raw = json.dumps([RECEIPT_LAYOUT, data], sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def draw_receipt(p, data):
+    font = receipt_font()
+    width, height = RECEIPT_SIZE
+    y = height - 10 * mm
+    x_margin = 5 * mm
+
+    # Header
+    p.setFont(font, 12)
+    p.drawCentredString(width / 2, y, rtl("متجر آتاي"))
+    y -= 5
+    p.setStrokeColor(colors.black)
+    p.line(x_margin, y, width - x_margin, y)
+    y -= 15
+
+    # Infos client
+    p.setFont(font, 9)
+    draw_rtl(p, width - x_margin, y, "الطلب: ", f"#{data['id']:04d}")
+    y -= 12
+    draw_rtl(p, width - x_margin, y, "الاسم: ", data['client_name'] or '---')
+    y -= 12
+    draw_rtl(p, width - x_margin, y, "الهاتف: ", data['phone'] or '---')
+    y -= 12
+    draw_rtl(p, width - x_margin, y, "المدينة: ", data['city'] or '---')
+    y -= 16
+
+    # Produits
+    p.setFont(font, 9)
+    p.drawRightString(width - x_margin, y, rtl("المشتريات:"))
+    y -= 10
+    p.line(x_margin, y, width - x_margin, y)
+    y -= 12
+
+    for idx, (name, quantity, price) in enumerate(data['items'], start=1):
+        total_item = float(price) * int(quantity)
+        draw_rtl(p, width - x_margin, y, f"{idx}. ", name, f" × {quantity} = {total_item:.2f} ", "درهم")
+        y -= 12
+
+        if y < 20 * mm:
+            p.showPage()
+            p.setFont(font, 9)
+            y = height - 20 * mm
+
+    # Ligne avant total
+    y -= 5
+    p.line(x_margin, y, width - x_margin, y)
+    y -= 12
+
+    # Total
+    p.setFont(font, 10)
+    draw_rtl(p, width - x_margin, y, "المجموع: ", f"{data['total']} ", "درهم")
+    y -= 16
+
+    # Date et heure
+    p.setFont(font, 9)
+    draw_rtl(p, width - x_margin, y, "التاريخ: ", data['date'] or '---')
+    y -= 12
+    draw_rtl(p, width - x_margin, y, "الساعة: ", data['time'] or '---')
+    y -= 16
+
+    # Footer
+    p.line(x_margin, y, width - x_margin, y)
+    y -= 12
+    p.setFont(font, 9)
+    p.drawCentredString(width / 2, y, rtl("شكرا لاختياركم متجر آتاي!"))
+    y -= 12
+    p.drawCentredString(width / 2, y, rtl("الذوق الأصيل… من الطبيعة إلى بابكم"))
+
+    p.showPage()
+
+
+def render_receipt(data):
+    with metrics.timer('pdf', metrics.PDF_RENDER_SECONDS):
+        buffer = BytesIO()
+        p = canvas.Canvas(buffer, pagesize=RECEIPT_SIZE)
+        draw_receipt(p, data)
+        p.save()
+        return buffer.getvalue()
+
+
+# ==========================
+# Cache على الديسك
+# ==========================
+def cache_dir():
+    return os.path.join(settings.MEDIA_ROOT, 'receipts')
+
+
+def order_dir(order_id):
+    return os.path.join(cache_dir(), str(order_id))
+
+
+def cache_path(data, key=None):
+    return os.path.join(order_dir(data['id']), f"{key or receipt_key(data)}.pdf")
+
+
+def cache_files():
+    """(mtime, size, path) لكل PDF فالكاش."""
+    try:
+        top = list(os.scandir(cache_dir()))
+    except FileNotFoundError:
+        return []
+    # الملفات فـ receipts/ مباشرة: الشكل القديم (<order_id>-<key>.pdf)، كيتمسحو بالـ LRU
+    groups = [[entry for entry in top if not entry.is_dir()]]
+    for directory in top:
+        if not directory.is_dir():
+            continue
+        try:
+            groups.append(list(os.scandir(directory.path)))
+        except FileNotFoundError:
+            continue
+    files = []
+    for entries in groups:
+        for entry in entries:
+            if entry.name.endswith('.pdf'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+    return files
+
+
+# الحجم التقريبي ديال الكاش فهاد الـ process (None = مازال ماتقرا)
+_cache_bytes = None
+_cache_lock = threading.Lock()
+
+
+def max_cache_bytes():
+    return getattr(settings, 'RECEIPT_CACHE_MAX_BYTES', 50 * 1024 * 1024)
+
+
+def track(delta):
+    """كيزيد delta للتقدير وكيرجع True إلا فات الحد (خاص evict)."""
+    global _cache_bytes
+    with _cache_lock:
+        if _cache_bytes is None:
+            _cache_bytes = sum(size for _, size, _ in cache_files())
+        else:
+            _cache_bytes = max(0, _cache_bytes + delta)
+        return _cache_bytes > max_cache_bytes()
+
+
+def read_cached(path):
+    try:
+        with open(path, 'rb') as handle:
+            pdf = handle.read()
+    except FileNotFoundError:
+        return None
+    # evict() (ولا invalidate) يقدر يمسحو بين open و utime
+    with contextlib.suppress(FileNotFoundError):
+        os.utime(path)
+    return pdf
+
+
+def open_receipt(data, key=None):
+    """كيرجع file object ديال الـ PDF: من الكاش، ولا كيترسم ويتخزن."""
+    path = cache_path(data, key)
+    try:
+        handle = open(path, 'rb')
+    except FileNotFoundError:
+        pdf = render_receipt(data)
+        store(path, pdf)
+        return BytesIO(pdf)
+    with contextlib.suppress(FileNotFoundError):
+        os.utime(path)  # LRU: آخر استعمال؛ الـ handle مازال صالح إلا تمسح الملف
+    return handle
+
+
+def store(path, pdf):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as handle:
+        handle.write(pdf)
+    os.replace(tmp, path)
+    if track(len(pdf)):
+        evict()
+
+
+def evict(max_bytes=None):
+    """
+    كيمسح الملفات اللي ماتستعملوش بزاف حتى يرجع الحجم تحت 90% ديال الحد
+    (باش store الجاي مايعاودش يقرا الكاش كامل)، وكيصحح التقدير.
+    """
+    global _cache_bytes
+    if max_bytes is None:
+        max_bytes = max_cache_bytes()
+    files = sorted(cache_files())
+    size = sum(file_size for _, file_size, _ in files)
+    target = max_bytes * 0.9 if size > max_bytes else max_bytes
+    for _, file_size, path in files:
+        if size <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        size -= file_size
+        try:
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass  # باقي فيه receipts
+    with _cache_lock:
+        _cache_bytes = size
+
+
+def invalidate(*order_ids):
+    """كيمسح جميع النسخ ديال receipts ديال هاد الطلبات (غير الدوسيات ديالهم)."""
+    removed = 0
+    for order_id in order_ids:
+        directory = order_dir(order_id)
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            try:
+                removed += entry.stat().st_size
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.rmdir(directory)
+        except OSError:
+            pass
+    if removed:
+        track(-removed)
+
+
+# ==========================
+# Export ديال بزاف ديال الطلبات
+# ==========================
+def export_workers():
+    workers = getattr(settings, 'RECEIPT_EXPORT_WORKERS', None)
+    return (os.cpu_count() or 1) if workers is None else workers
+
+
+def _init_worker():
+    # spawn: الـ process الجديد ماعارفش settings
+    import django
+    django.setup()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def export_pool(workers):
+    """
+    Pool دايم مشترك بين الطلبات (ماشي pool جديد لكل export). spawn ماشي fork:
+    fork من server فيه threads كينسخ locks مشدودين فـ threads أخرين.
+    """
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = _pools[workers] = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker,
+            )
+        return pool
+
+
+def discard_pool(workers):
+    with _pools_lock:
+        pool = _pools.pop(workers, None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def render_many(datas, workers=None):
+    """
+    كيرجع (data, pdf) بنفس ترتيب datas. اللي فالكاش كيتقرا مباشرة، والباقي
+    كيترسم فـ process pool. ماكيتحفظوش فالذاكرة أكثر من workers * 2 receipts.
+    """
+    workers = export_workers() if workers is None else workers
+    if workers <= 0:
+        for data in datas:
+            with open_receipt(data) as handle:
+                yield data, handle.read()
+        return
+
+    def finish(entry):
+        data, path, pdf = entry
+        if isinstance(pdf, Future):
+            pdf = pdf.result()
+            store(path, pdf)
+        return data, pdf
+
+    pool = export_pool(workers)
+    window = deque()
+    try:
+        for data in datas:
+            path = cache_path(data)
+            pdf = read_cached(path)
+            window.append((data, path, pdf if pdf is not None else pool.submit(render_receipt, data)))
+            while len(window) > workers * 2:
+                yield finish(window.popleft())
+        while window:
+            yield finish(window.popleft())
+    except BrokenProcessPool:
+        # worker مات (OOM...): الـ export الجاي كيبدا بـ pool جديد
+        discard_pool(workers)
+        raise
+    finally:
+        # الكلاينت قطع: مانكملوش نرسمو receipts ماغاديش يتبعثو
+        for _, _, pdf in window:
+            if isinstance(pdf, Future):
+                pdf.cancel()
+
+
+def export_zip(datas, workers=None):
+    """ZIP فيه PDF لكل طلب، كيتبعث chunk بـ chunk (الذاكرة ثابتة)."""
+    writer = ChunkWriter()
+    with zipfile.ZipFile(writer, 'w', zipfile.ZIP_STORED) as archive:
+        for data, pdf in render_many(datas, workers):
+            archive.writestr(f"invoice_{data['id']}.pdf", pdf)
+            yield writer.pop()
+    yield writer.pop()
+
+
+def export_pdf(datas, chunk_size=64 * 1024):
+    """
+    PDF واحد فيه جميع الـ receipts (صفحة ولا أكثر لكل طلب).
+
+    reportlab ماكيكتب والو حتى p.save()، يعني هاد الشكل كيترسم فـ process
+    واحد وكيتخزن كامل فالذاكرة قبل ما يتبعث: الـ view كيحد عدد الطلبات
+    (RECEIPT_EXPORT_PDF_MAX_ORDERS)، والـ batches الكبار كيدوزو بـ output=zip.
+    """
+    buffer = BytesIO()
+    p = canvas.Canvas(buffer, pagesize=RECEIPT_SIZE)
+    for data in datas:
+        draw_receipt(p, data)
+    p.save()
+    view = buffer.getbuffer()
+    for start in range(0, len(view), chunk_size):
+        yield bytes(view[start:start + chunk_size])
@@ -1,135 +1,354 @@
-from rest_framework import serializers
-from .models import Product, Order, OrderItem
-
-
-# ==========================
-# Product Serializer
-# ==========================
-class ProductSerializer(serializers.ModelSerializer):
-    image_url = serializers.SerializerMethodField(read_only=True)
-
-    class Meta:
-        model = Product
-        fields = [
-            'id', 'name', 'description', 'price',
-            'category', 'image', 'image_url',
-            'stock', 'min_stock'
-        ]
-
-    def get_image_url(self, obj):
-        request = self.context.get('request')
-        if obj.image:
-            return request.build_absolute_uri(obj.image.url) if request else obj.image.url
-        return None
-
-
-# ==========================
-# OrderItem Serializer
-# ==========================
-class OrderItemSerializer(serializers.ModelSerializer):
-    product_name = serializers.CharField(source='product.name', read_only=True)
-    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
-
-    class Meta:
-        model = OrderItem
-        fields = ['id', 'product', 'product_name', 'quantity', 'price']
-        read_only_fields = ['price']   # الكلاينت ميرسلوش
-
-
-# ==========================
-# Order Serializer
-# ==========================
-class OrderSerializer(serializers.ModelSerializer):
-    items = OrderItemSerializer(many=True, required=True)
-
-
-    class Meta:
-        model = Order
-        fields = [
-            'id', 'client_name', 'phone', 'email', 'city', 'address',
-            'total', 'status', 'created_at', 'items'
-        ]
-        read_only_fields = ['total', 'created_at']
-
-    def create(self, validated_data):
-        items_data = validated_data.pop('items')
-        order = Order.objects.create(**validated_data)
-
-        total = 0
-        for item_data in items_data:
-            product = item_data['product']
-            quantity = item_data['quantity']
-
-            if product.stock < quantity:
-                raise serializers.ValidationError(
-                    f"❌ الكمية غير متوفرة للمنتج: {product.name}"
-                )
-
-            # إنشاء OrderItem
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                quantity=quantity,
-                price=product.price  # unit price
-            )
-
-            # حساب المجموع
-            total += product.price * quantity
-
-            # تحديث المخزون
-            product.stock -= quantity
-            product.save()
-
-        order.total = total
-        order.save()
-        return order
-
-    def update(self, instance, validated_data):
-        # إذا كان غير status اللي جاي فـ PATCH
-        if list(validated_data.keys()) == ["status"]:
-            instance.status = validated_data["status"]
-            instance.save()
-            return instance
-
-        # استرجاع المخزون القديم
-        for old_item in instance.items.all():
-            old_item.product.stock += old_item.quantity
-            old_item.product.save()
-
-        instance.items.all().delete()
-
-        # تحديث باقي المعلومات
-        instance.status = validated_data.get('status', instance.status)
-        instance.client_name = validated_data.get('client_name', instance.client_name)
-        instance.phone = validated_data.get('phone', instance.phone)
-        instance.email = validated_data.get('email', instance.email)
-        instance.city = validated_data.get('city', instance.city)
-        instance.address = validated_data.get('address', instance.address)
-        instance.save()
-
-        # إعادة بناء items إذا تبعثو
-        items_data = validated_data.pop('items', [])
-        total = 0
-        for item_data in items_data:
-            product = item_data['product']
-            quantity = item_data['quantity']
-
-            if product.stock < quantity:
-                raise serializers.ValidationError(
-                    f"❌ الكمية غير متوفرة للمنتج: {product.name}"
-                )
-
-            OrderItem.objects.create(
-                order=instance,
-                product=product,
-                quantity=quantity,
-                price=product.price
-            )
-
-            total += product.price * quantity
-            product.stock -= quantity
-            product.save()
-
-        instance.total = total
-        instance.save()
-        return instance
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from rest_framework import serializers
+from .models import Product, Order, OrderItem, StockAlert
+from . import analytics, images, mediafiles, metrics, stock
+
+
+def query_list(request, name):
+    """?name=a,b,c -> {'a', 'b', 'c'} (None إلا الـ param ماكاينش)."""
+    if request is None or name not in request.query_params:
+        return None
+    return {value.strip() for value in request.query_params[name].split(',') if value.strip()}
+
+
+class SparseFieldsMixin:
+    """?fields=id,name,... كيرجع غير هاد الـ fields فالقراءة (GET)."""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        requested = query_list(request, 'fields') if request and request.method == 'GET' else None
+        if requested:
+            fields = {name: field for name, field in fields.items() if name in requested}
+        return fields
+
+
+# ==========================
+# Product Serializer
+# ==========================
+class ProductSerializer(metrics.TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
+    image_url = serializers.SerializerMethodField(read_only=True)
+    # {"160": url, "320": url, ...}: الـ app كتختار أصغر وحدة اللي كتكفي
+    image_srcset = serializers.SerializerMethodField(read_only=True)
+
+    class Meta:
+        model = Product
+        fields = [
+            'id', 'name', 'description', 'price',
+            'category', 'image', 'image_url', 'image_srcset',
+            'stock', 'min_stock'
+        ]
+
+    def get_image_url(self, obj):
+        request = self.context.get('request')
+        if obj.image:
+            url = mediafiles.versioned_url(obj.image)
+            return request.build_absolute_uri(url) if request else url
+        return None
+
+    def get_image_srcset(self, obj):
+        request = self.context.get('request')
+        return {
+            str(width): request.build_absolute_uri(url) if request else url
+            for width, url in images.srcset(obj.image).items()
+        }
+
+
+class LowStockProductSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'category', 'stock', 'min_stock']
+
+
+class ProductImportSerializer(serializers.ModelSerializer):
+    """سطر واحد من ملف الاستيراد (products.catalog_io): بلا id = منتج جديد."""
+    id = serializers.IntegerField(required=False, min_value=1)
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'description', 'price', 'category', 'stock', 'min_stock']
+
+
+class StockAlertSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+
+    class Meta:
+        model = StockAlert
+        fields = ['id', 'product', 'product_name', 'kind', 'stock', 'min_stock', 'created_at']
+
+
+# ==========================
+# OrderItem Serializer
+# ==========================
+class ProductPrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField اللي كيقبل المنتجات محملين من قبل (query وحدة للطلب كامل)."""
+
+    def preload(self, pks):
+        keys = set()
+        for pk in pks:
+            if isinstance(pk, bool):
+                continue
+            try:
+                keys.add(int(pk))
+            except (TypeError, ValueError):
+                continue
+        self._preloaded = self.get_queryset().in_bulk(keys)
+
+    def to_internal_value(self, data):
+        preloaded = getattr(self, '_preloaded', None)
+        if preloaded is not None and not isinstance(data, bool):
+            try:
+                return preloaded[int(data)]
+            except (TypeError, ValueError, KeyError):
+                pass
+        return super().to_internal_value(data)
+
+
+class OrderItemListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        # نجيبو جميع المنتجات بـ query وحدة بلاصة query لكل سطر
+        if isinstance(data, list):
+            self.child.fields['product'].preload(
+                row.get('product') for row in data if isinstance(row, dict)
+            )
+        return super().to_internal_value(data)
+
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    product = ProductPrimaryKeyField(queryset=Product.objects.all())
+    # اختياري: فالتعديل كيحدد السطر القديم اللي كيتبدل (فالإنشاء كيتجاهل)
+    id = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = OrderItem
+        fields = ['id', 'product', 'product_name', 'quantity', 'price']
+        read_only_fields = ['price']   # الكلاينت ميرسلوش
+        list_serializer_class = OrderItemListSerializer
+
+
+# ==========================
+# Order Serializer
+# ==========================
+def item_quantities(items_data):
+    """الكمية المطلوبة لكل منتج (نفس المنتج يقدر يتعاود فأكثر من سطر)."""
+    quantities = {}
+    for item_data in items_data:
+        pk = item_data['product'].pk
+        quantities[pk] = quantities.get(pk, 0) + item_data['quantity']
+    return quantities
+
+
+def reserve_stock(quantities):
+    return adjust_stock(quantities)
+
+
+def adjust_stock(deltas):
+    try:
+        return stock.adjust(deltas)
+    except stock.InsufficientStock as exc:
+        raise serializers.ValidationError(exc.messages)
+
+
+def match_items(existing, items_data):
+    """
+    كيقارن الـ items الجداد مع القدام: بالـ id إلا تبعث، وإلا بالمنتج.
+
+    كيرجع (matched, added, removed): matched = [(item, item_data)].
+    """
+    by_id = {item.pk: item for item in existing}
+    matched, pending = [], []
+    for item_data in items_data:
+        pk = item_data.get('id')
+        if pk is None:
+            pending.append(item_data)
+        elif pk in by_id:
+            matched.append((by_id.pop(pk), item_data))
+        else:
+            raise serializers.ValidationError({'items': [f"❌ السطر {pk} ماشي ديال هاد الطلب"]})
+
+    by_product = {}
+    for item in by_id.values():
+        by_product.setdefault(item.product_id, []).append(item)
+    added = []
+    for item_data in pending:
+        candidates = by_product.get(item_data['product'].pk)
+        if candidates:
+            matched.append((candidates.pop(0), item_data))
+        else:
+            added.append(item_data)
+    removed = [item for items in by_product.values() for item in items]
+    return matched, added, removed
+
+
+class OrderSerializer(metrics.TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
+    items = OrderItemSerializer(many=True, required=True)
+
+
+    class Meta:
+        model = Order
+        fields = [
+            'id', 'client_name', 'phone', 'email', 'city', 'address',
+            'total', 'status', 'created_at', 'items'
+        ]
+        read_only_fields = ['total', 'created_at']
+
+    @transaction.atomic
+    def create(self, validated_data):
+        items_data = validated_data.pop('items')
+
+        # حجز المخزون: UPDATE واحد مشروط، الصفوف مقفولين بترتيب pk
+        reserved = reserve_stock(item_quantities(items_data))
+        # quantity 0 ماكيحركش المخزون: المنتج ماكيرجعش من reserve_stock
+        products = {item_data['product'].pk: item_data['product'] for item_data in items_data}
+        products.update(reserved)
+
+        # حساب المجموع
+        total = sum(
+            (products[item_data['product'].pk].price * item_data['quantity'] for item_data in items_data),
+            0,
+        )
+        order = Order.objects.create(total=total, **validated_data)
+
+        # إنشاء OrderItems بـ INSERT واحد
+        items = OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=products[item_data['product'].pk],
+                quantity=item_data['quantity'],
+                price=products[item_data['product'].pk].price  # unit price
+            )
+            for item_data in items_data
+        ])
+        analytics.record(order, items)
+        return order
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        # الـ analytics كياخدو الفرق بين قبل وبعد التعديل
+        with analytics.track(instance.pk):
+            order = self.update_order(instance, validated_data)
+        # الأسطر تبدلو: items اللي كانو prefetched (إلا كانو) مابقاوش صحاح
+        getattr(order, '_prefetched_objects_cache', {}).pop('items', None)
+        return order
+
+    def to_representation(self, instance):
+        # الجواب كيحتاج items + product.name: query وحدة بلاصة وحدة لكل سطر.
+        # كيتدار هنا ماشي فـ update(): UpdateModelMixin كيمسح _prefetched_objects_cache
+        # من بعد perform_update. إلا الـ items ديجا prefetched ماكيديرش query.
+        prefetch_related_objects(
+            [instance], Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+        )
+        return super().to_representation(instance)
+
+    def update_order(self, instance, validated_data):
+        # PATCH بلا items: الأسطر والمجموع كيبقاو كيف ما هوما
+        items_data = validated_data.pop('items', None)
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        if items_data is not None:
+            instance.total = self.update_items(instance, items_data)
+        instance.save()
+        return instance
+
+    def update_items(self, instance, items_data):
+        """
+        كيبدل غير الأسطر اللي تبدلو وكيرجع المجموع الجديد.
+
+        المخزون كيتحرك بالفرق الصافي لكل منتج (UPDATE واحد مشروط)، والأسطر
+        بـ bulk_create / bulk_update / delete واحد. السطر اللي بقا على نفس
+        المنتج كيحتافظ بالثمن ديالو، السطر الجديد كياخد الثمن الحالي.
+        """
+        existing = list(instance.items.all())
+        matched, added, removed = match_items(existing, items_data)
+
+        # الفرق الصافي: الجديد ناقص القديم (bulk_* ما كيعيطوش لـ OrderItem.save/delete)
+        deltas = item_quantities(items_data)
+        for item in existing:
+            deltas[item.product_id] = deltas.get(item.product_id, 0) - item.quantity
+        adjust_stock(deltas)
+
+        changed = []
+        for item, item_data in matched:
+            product = item_data['product']
+            if item.product_id != product.pk:
+                item.product, item.price = product, product.price
+            elif item.quantity == item_data['quantity']:
+                continue
+            item.quantity = item_data['quantity']
+            changed.append(item)
+        if changed:
+            OrderItem.objects.bulk_update(changed, ['product', 'quantity', 'price'])
+
+        new_items = [
+            OrderItem(
+                order=instance,
+                product=item_data['product'],
+                quantity=item_data['quantity'],
+                price=item_data['product'].price,
+            )
+            for item_data in added
+        ]
+        if new_items:
+            OrderItem.objects.bulk_create(new_items)
+        if removed:
+            OrderItem.objects.filter(pk__in=[item.pk for item in removed]).delete()
+
+        return sum(
+            (item.price * item.quantity for item in [item for item, _ in matched] + new_items),
+            0,
+        )
+
+
+class OrderTransitionSerializer(serializers.Serializer):
+    """{"status": "paid", "ids": [1, 2]}؛ بلا ids كيتطبق على فلاتر ?date_from=&city=..."""
+    status = serializers.ChoiceField(choices=list(Order.TRANSITIONS))
+    # SQLite: كل id = parameter فـ IN (...)
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False, allow_empty=False, max_length=5000
+    )
+
+
+# ==========================
+# Order Read Serializer (list / retrieve)
+# ==========================
+class OrderReadSerializer(serializers.BaseSerializer):
+    """
+    نفس الـ output ديال OrderSerializer بلا ما نبنيو fields لكل سطر.
+
+    كيتسنى queryset فيه prefetch ديال items__product (OrderViewSet.get_queryset).
+    context['fields'] (?fields=) و context['expand_items'] كيحددو شنو يترجع.
+    """
+    decimal_field = serializers.DecimalField(max_digits=10, decimal_places=2)
+    datetime_field = serializers.DateTimeField()
+
+    def to_representation(self, order):
+        with metrics.timer('serializer'):
+            decimal = self.decimal_field.to_representation
+            requested = self.context.get('fields')
+            data = {
+                'id': order.id,
+                'client_name': order.client_name,
+                'phone': order.phone,
+                'email': order.email,
+                'city': order.city,
+                'address': order.address,
+                'total': decimal(order.total),
+                'status': order.status,
+                'created_at': self.datetime_field.to_representation(order.created_at),
+            }
+            if requested:
+                data = {name: value for name, value in data.items() if name in requested}
+            if self.context.get('expand_items', True):
+                data['items'] = [
+                    {
+                        'id': item.id,
+                        'product': item.product_id,
+                        'product_name': item.product.name,
+                        'quantity': item.quantity,
+                        'price': decimal(item.price),
+                    }
+                    for item in order.items.all()
+                ]
+            return data
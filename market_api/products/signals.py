@@ -0,0 +1,53 @@
+from django.db import connections
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import catalog_cache, filters, images, receipts, sync
+from .models import Order, OrderItem, Product
+
+
+@receiver([post_save, post_delete], sender=Order)
+def order_changed(sender, instance, **kwargs):
+    receipts.invalidate(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=OrderItem)
+def order_item_changed(sender, instance, **kwargs):
+    receipts.invalidate(instance.order_id)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed(sender, instance, **kwargs):
+    catalog_cache.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    # الـ thumbnails كيتصاوبو مع الـ upload باش أول طلب مايتسناش
+    if instance.image:
+        images.srcset(instance.image)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    if instance.image:
+        images.delete(instance.image.name)
+
+
+@receiver(post_migrate)
+def ensure_search_index(sender, using, **kwargs):
+    if sender.name == 'products':
+        filters.install_fts(connections[using])
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Order)
+def record_tombstone(sender, instance, **kwargs):
+    sync.record_deletion(instance)
+
+
+@receiver(pre_delete, sender=Product)
+def touch_orders_of_product(sender, instance, **kwargs):
+    # الـ items ديال هاد المنتج غادي يتمسحو (CASCADE) بلا OrderItem.delete
+    Order.objects.filter(items__product=instance).update(updated_at=timezone.now())
@@ -0,0 +1,118 @@
+"""
+خدمة حجز المخزون (stock reservation).
+
+جميع التغييرات على Product.stock خاصها تدوز من هنا: كل تغيير كيتدار
+بـ UPDATE واحد مشروط (stock >= qty) داخل transaction.atomic، وما كاين
+حتى read-modify-write فـ Python. الصفوف كيتقفلو ديما بترتيب pk باش
+جوج checkouts فنفس الوقت مايديروش deadlock.
+"""
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from . import catalog_cache
+from .models import Product, StockAlert
+
+
+class InsufficientStock(ValidationError):
+    def __init__(self, product=None):
+        self.product = product
+        name = product.name if product is not None else ""
+        super().__init__(f"❌ الكمية غير متوفرة للمنتج: {name}".strip())
+
+
+class _Shortfall(Exception):
+    pass
+
+
+def reserve(quantities):
+    """كينقص {product_id: qty} من المخزون. كيرجع {product_id: Product} محدثين."""
+    return adjust(quantities)
+
+
+def release(quantities):
+    """كيرجع {product_id: qty} للمخزون (إلغاء أو تعديل طلب)."""
+    return adjust({pk: -quantity for pk, quantity in quantities.items()})
+
+
+def record_crossings(products, deltas):
+    """كيسجل StockAlert غير للمنتجات اللي دازو الحد (min_stock) فهاد التغيير."""
+    alerts = []
+    for pk, delta in deltas.items():
+        product = products[pk]
+        before = product.stock + delta
+        if before > product.min_stock >= product.stock:
+            kind = StockAlert.LOW
+        elif before <= product.min_stock < product.stock:
+            kind = StockAlert.RESTOCKED
+        else:
+            continue
+        alerts.append(StockAlert(product=product, kind=kind, stock=product.stock, min_stock=product.min_stock))
+    if alerts:
+        StockAlert.objects.bulk_create(alerts)
+
+
+def adjust(deltas):
+    """
+    كيطبق {product_id: delta} على المخزون: delta موجب كينقص، سالب كيزيد.
+
+    يا إما كلشي كيدوز يا إما والو: إلا شي منتج ماعندوش الكمية كيطلع
+    InsufficientStock وكيترجع كلشي كيف كان.
+    """
+    deltas = {pk: delta for pk, delta in sorted(deltas.items()) if delta}
+    if not deltas:
+        return {}
+
+    try:
+        with transaction.atomic():
+            locked = connection.features.has_select_for_update
+            if locked:
+                # نقفلو الصفوف بترتيب pk (ترتيب ثابت = ما كاينش deadlock)
+                products = {
+                    product.pk: product
+                    for product in Product.objects.select_for_update().filter(pk__in=deltas).order_by('pk')
+                }
+                if any(
+                    pk not in products or products[pk].stock < delta
+                    for pk, delta in deltas.items()
+                ):
+                    raise _Shortfall
+
+            # pk IN + CASE واحد: OR لكل منتج كيولي expression tree عميقة
+            # (SQLite: maximum depth 1000 ≈ 1000 منتج)
+            minimum = Case(
+                *[When(pk=pk, then=Value(max(delta, 0))) for pk, delta in deltas.items()],
+                default=Value(0),
+            )
+            updated = Product.objects.filter(pk__in=deltas, stock__gte=minimum).update(
+                stock=Case(
+                    *[When(pk=pk, then=F('stock') - delta) for pk, delta in deltas.items()],
+                    default=F('stock'),
+                    output_field=Product._meta.get_field('stock'),
+                ),
+                updated_at=timezone.now(),
+            )
+            if updated != len(deltas):
+                raise _Shortfall
+
+            if locked:
+                for pk, delta in deltas.items():
+                    products[pk].stock -= delta
+            else:
+                # SQLite: القراءة من بعد الـ UPDATE (عندنا الـ write lock)
+                products = Product.objects.in_bulk(deltas)
+            record_crossings(products, deltas)
+            # queryset.update() ماكيصيفطش post_save: الـ stock كيبان فـ /api/products/
+            catalog_cache.invalidate(deltas)
+            return products
+    except _Shortfall:
+        pass
+
+    # من بعد الـ rollback: نقلبو على المنتج اللي ناقص باش نعطيو message واضح
+    current = Product.objects.in_bulk(deltas)
+    for pk, delta in deltas.items():
+        product = current.get(pk)
+        if product is None or product.stock < delta:
+            raise InsufficientStock(product)
+    raise InsufficientStock()
@@ -0,0 +1,22 @@
+"""
+Helpers مشتركين للـ responses اللي كيتبعثو chunk بـ chunk (receipts ZIP، catalog XLSX).
+"""
+
+
+class ChunkWriter:
+    """File-like بلا seek: zipfile كيكتب فيه ونحن كنفرغوه بـ pop() ونبعثو."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
@@ -0,0 +1,63 @@
+"""
+Delta sync ديال التطبيق (offline): GET /api/sync/?since=<token>
+
+الجواب فيه غير المنتجات/الطلبات اللي تزادو ولا تبدلو (updated_at >= since)
+والـ ids اللي تمسحو (Tombstone). بلا since، ولا since أقدم من SYNC_TOMBSTONE_DAYS،
+كيرجع كلشي مع full=true (التطبيق خاصو يمسح اللي عندو ويعاود يعمر).
+
+الـ token الجاي كيتاخد قبل القراءة ناقص SYNC_OVERLAP_SECONDS: transaction اللي
+كانت باقا ماتكوميتاتش كتبان فالـ sync الجاية. التطبيق كيطبق الأجوبة كـ upsert،
+داكشي علاش التكرار ماكيضرش.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Tombstone
+
+MODELS = {'Product': 'product', 'Order': 'order'}
+
+
+def overlap():
+    return timedelta(seconds=getattr(settings, 'SYNC_OVERLAP_SECONDS', 5))
+
+
+def retention():
+    return timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_DAYS', 30))
+
+
+def encode_token(moment):
+    return str(int(moment.timestamp() * 1_000_000))
+
+
+def decode_token(token):
+    """كيطلع ValueError إلا الـ token ماشي صالح."""
+    micros = int(token)
+    if micros < 0:
+        raise ValueError(token)
+    return datetime.fromtimestamp(micros / 1_000_000, tz=dt_timezone.utc)
+
+
+def record_deletion(instance):
+    now = timezone.now()
+    Tombstone.objects.create(model=MODELS[type(instance).__name__], object_id=instance.pk)
+    # كنمسحو القدام هنا (index على deleted_at) بلا cron
+    Tombstone.objects.filter(deleted_at__lt=now - retention()).delete()
+
+
+def deleted_since(since):
+    deleted = {model: [] for model in MODELS.values()}
+    for model, object_id in (
+        Tombstone.objects.filter(deleted_at__gte=since).order_by('id').values_list('model', 'object_id')
+    ):
+        deleted[model].append(object_id)
+    return deleted
+
+
+def window(since):
+    """(since ولا None للـ full sync، token الجاي)."""
+    now = timezone.now()
+    if since is not None and since < now - retention():
+        since = None
+    return since, encode_token(now - overlap())
@@ -1,3 +1,1591 @@
-from django.test import TestCase
-
-# Create your tests here.
+import csv
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.db import IntegrityError, OperationalError, connection, reset_queries, transaction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+from PIL import Image
+from django.test import AsyncClient
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+
+from . import analytics, benchmarks, catalog_cache, catalog_io, idempotency, images, metrics, middleware, receipts, stock
+from .management.commands.startup_time import measure_startup
+from .models import IdempotencyKey, Product, Order, OrderItem, StockAlert
+from .pagination import KeysetPagination
+from .serializers import OrderSerializer, ProductSerializer
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+try:
+    import openpyxl
+except ImportError:  # pragma: no cover
+    openpyxl = None
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+
+def make_products(count, stock=100, price="10.00"):
+    return [
+        Product.objects.create(name=f"Product {i}", price=Decimal(price), stock=stock)
+        for i in range(count)
+    ]
+
+
+class OrderCreateTests(APITestCase):
+    def post_order(self, items, **extra):
+        payload = {'client_name': 'Test', 'items': items, **extra}
+        return self.client.post('/api/orders/', payload, format='json')
+
+    def test_create_decrements_stock_and_sets_total(self):
+        a, b = make_products(2)
+        response = self.post_order([
+            {'product': a.id, 'quantity': 2},
+            {'product': b.id, 'quantity': 3},
+            {'product': a.id, 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, 201, response.content)
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual(order.total, Decimal("60.00"))
+        self.assertEqual(order.items.count(), 3)
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertEqual((a.stock, b.stock), (97, 97))
+        self.assertEqual(len(response.data['items']), 3)
+        self.assertEqual(response.data['items'][0]['product_name'], a.name)
+
+    def test_insufficient_stock_rolls_back(self):
+        a, b = make_products(2, stock=5)
+        response = self.post_order([
+            {'product': a.id, 'quantity': 2},
+            {'product': b.id, 'quantity': 6},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        a.refresh_from_db()
+        self.assertEqual(a.stock, 5)
+
+    def test_zero_quantity_line_is_accepted(self):
+        a, b = make_products(2, stock=5)
+        response = self.post_order([{'product': a.id, 'quantity': 0}, {'product': b.id, 'quantity': 2}])
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data['total'], '20.00')
+        self.assertEqual(response.data['items'][0]['price'], '10.00')
+        self.assertEqual(self.post_order([{'product': a.id, 'quantity': 0}]).status_code, 201)
+
+    def test_unknown_product_is_rejected(self):
+        response = self.post_order([{'product': 999, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('items', response.data)
+
+    def test_query_count_does_not_grow_with_items(self):
+        products = make_products(30)
+        counts = []
+        for size in (1, 10, 30):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.post_order([{'product': p.id, 'quantity': 1} for p in products[:size]])
+            self.assertEqual(response.status_code, 201, response.content)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(len(set(counts)), 1, counts)
+
+
+class OrderUpdateTests(APITestCase):
+    def setUp(self):
+        self.a, self.b, self.c = make_products(3, stock=20)
+        response = self.client.post('/api/orders/', {
+            'client_name': 'Test',
+            'items': [{'product': self.a.id, 'quantity': 2}, {'product': self.b.id, 'quantity': 3}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.order = Order.objects.get(pk=response.data['id'])
+        self.items = {item.product_id: item.pk for item in self.order.items.all()}
+
+    def put(self, items):
+        return self.client.put(f'/api/orders/{self.order.pk}/', {
+            'client_name': 'Test', 'items': items,
+        }, format='json')
+
+    def stocks(self):
+        return list(Product.objects.order_by('id').values_list('stock', flat=True))
+
+    def test_quantity_edit_keeps_rows(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.put([{'product': self.a.id, 'quantity': 5}, {'product': self.b.id, 'quantity': 3}])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual({item['product']: item['id'] for item in response.data['items']}, self.items)
+        self.assertEqual(self.stocks(), [15, 17, 20])
+        self.assertEqual(response.data['total'], '80.00')
+        writes = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith(('INSERT', 'DELETE'))]
+        self.assertFalse([sql for sql in writes if 'products_orderitem' in sql], writes)
+
+    def test_add_remove_and_match_by_id(self):
+        # السطر ديال a كيتبدل لـ c بالـ id، b كيتمسح، a كيتزاد من جديد
+        response = self.put([
+            {'id': self.items[self.a.id], 'product': self.c.id, 'quantity': 1},
+            {'product': self.a.id, 'quantity': 4},
+        ])
+        self.assertEqual(response.status_code, 200, response.content)
+        rows = sorted(self.order.items.values_list('pk', 'product_id', 'quantity'))
+        self.assertEqual(rows[0], (self.items[self.a.id], self.c.id, 1))
+        self.assertEqual(rows[1][1:], (self.a.id, 4))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(self.stocks(), [16, 20, 19])
+
+    def test_unknown_item_id_is_rejected(self):
+        other = Order.objects.create()
+        item = OrderItem.objects.create(order=other, product=self.c, quantity=1)
+        response = self.put([{'id': item.pk, 'product': self.a.id, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(item.order_id, OrderItem.objects.get(pk=item.pk).order_id)
+
+    def test_insufficient_stock_rolls_back(self):
+        response = self.put([{'product': self.a.id, 'quantity': 1}, {'product': self.b.id, 'quantity': 30}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stocks(), [18, 17, 20])
+        self.assertEqual(sorted(self.order.items.values_list('product_id', 'quantity')), [(self.a.id, 2), (self.b.id, 3)])
+
+    def test_patch_without_items_keeps_them(self):
+        response = self.client.patch(f'/api/orders/{self.order.pk}/', {'city': 'Rabat'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(len(response.data['items']), 2)
+        self.assertEqual(response.data['total'], '50.00')
+        self.assertEqual(self.stocks(), [18, 17, 20])
+
+    def test_update_query_count_does_not_grow_with_items(self):
+        products = make_products(30, stock=20)
+        counts = []
+        for size in (2, 10, 30):
+            items = [{'product': p.id, 'quantity': 1} for p in products[:size]]
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.patch(f'/api/orders/{self.order.pk}/', {'items': items}, format='json')
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(len(response.data['items']), size)
+            counts.append(len(ctx.captured_queries))
+            # نرجعو لـ 2 أسطر باش كل PATCH يبدل نفس العدد ديال الأسطر القدام
+            self.put([{'product': self.a.id, 'quantity': 2}, {'product': self.b.id, 'quantity': 3}])
+        self.assertEqual(len(set(counts)), 1, counts)
+
+
+class StockServiceTests(TestCase):
+    def test_reserve_and_release_many_products(self):
+        a, b = make_products(2, stock=10)
+        products = stock.reserve({b.id: 4, a.id: 3})
+        self.assertEqual((products[a.id].stock, products[b.id].stock), (7, 6))
+        stock.release({a.id: 3, b.id: 4})
+        self.assertEqual(
+            list(Product.objects.order_by('id').values_list('stock', flat=True)), [10, 10]
+        )
+
+    def test_shortfall_changes_nothing(self):
+        a, b = make_products(2, stock=5)
+        with self.assertRaises(stock.InsufficientStock) as ctx:
+            stock.reserve({a.id: 1, b.id: 6})
+        self.assertEqual(ctx.exception.product, b)
+        self.assertEqual(
+            list(Product.objects.order_by('id').values_list('stock', flat=True)), [5, 5]
+        )
+
+    def test_many_skus_in_one_call(self):
+        # OR لكل منتج كان كيطيح SQLite فـ "Expression tree is too large"
+        products = make_products(1500, stock=5)
+        reserved = stock.reserve({product.id: 2 for product in products})
+        self.assertEqual({product.stock for product in reserved.values()}, {3})
+        with self.assertRaises(stock.InsufficientStock) as ctx:
+            stock.reserve({**{product.id: 1 for product in products}, products[-1].id: 4})
+        self.assertEqual(ctx.exception.product, products[-1])
+        self.assertEqual(set(Product.objects.values_list('stock', flat=True)), {3})
+
+    def test_order_item_save_and_delete(self):
+        (product,) = make_products(1, stock=10)
+        order = Order.objects.create()
+        item = OrderItem.objects.create(order=order, product=product, quantity=4)
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 6)
+
+        item.quantity = 1
+        item.save()
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 9)
+
+        item.quantity = 20
+        with self.assertRaises(stock.InsufficientStock):
+            item.save()
+        item.refresh_from_db()
+        self.assertEqual(item.quantity, 1)
+
+        item.delete()
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 10)
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    buyers = 20
+    initial_stock = 7
+
+    def test_no_oversell_under_concurrent_buyers(self):
+        products = make_products(3, stock=self.initial_stock)
+        # كل مشتري كياخد جوج منتوجات بترتيب مختلف باش نجربو الـ deadlocks
+        baskets = [
+            {products[i % 3].id: 1, products[(i + 1) % 3].id: 1}
+            for i in range(self.buyers)
+        ]
+        results = []
+        start = threading.Barrier(self.buyers)
+
+        def buy(basket):
+            start.wait()
+            try:
+                for _ in range(200):
+                    try:
+                        with transaction.atomic():
+                            stock.reserve(basket)
+                        results.append(True)
+                        return
+                    except OperationalError:
+                        # SQLite (in-memory shared cache) كيرفض الـ lock مباشرة
+                        time.sleep(0.005)
+                    except stock.InsufficientStock:
+                        results.append(False)
+                        return
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(basket,)) for basket in baskets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), self.buyers)
+        remaining = dict(Product.objects.values_list('id', 'stock'))
+        self.assertTrue(all(value >= 0 for value in remaining.values()), remaining)
+        # كل بيع ناجح نقص جوج وحدات بالضبط، ما كاينش lost updates
+        units_sold = sum(self.initial_stock - value for value in remaining.values())
+        self.assertEqual(units_sold, 2 * results.count(True))
+        # 3 منتجات × 7 = 21 وحدة، كل سلة فيها 2: ماكثر من 10 مبيعات
+        self.assertLessEqual(results.count(True), (3 * self.initial_stock) // 2)
+
+
+class OrderListTests(APITestCase):
+    def make_orders(self, count, items_per_order):
+        products = make_products(items_per_order, stock=10_000)
+        for i in range(count):
+            order = Order.objects.create(client_name=f"Client {i}", city="Rabat", total=Decimal("12.50"))
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=2, price=product.price)
+                for product in products
+            ])
+
+    def test_list_matches_order_serializer(self):
+        self.make_orders(2, 3)
+        response = self.client.get('/api/orders/?pagination=off')
+        self.assertEqual(response.status_code, 200)
+        expected = OrderSerializer(Order.objects.order_by('-created_at', '-id'), many=True).data
+        self.assertEqual(response.json(), [dict(row) for row in expected])
+
+        order = Order.objects.first()
+        response = self.client.get(f'/api/orders/{order.id}/')
+        self.assertEqual(response.json(), OrderSerializer(order).data)
+
+    def test_list_query_count_is_constant(self):
+        self.make_orders(2, 2)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/api/orders/?pagination=off')
+        self.make_orders(20, 8)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get('/api/orders/?pagination=off')
+        self.assertEqual(len(response.json()), 22)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertLessEqual(len(large.captured_queries), 2)
+
+
+class OrderFilterTests(APITestCase):
+    # sqlite_stat1 ديال 1M طلب بنفس التوزيع ديال benchmarks.make_orders
+    # (3 statuses، 4 cities، created_at/phone/email فريدين)
+    MILLION_ORDER_STATS = {
+        'order_created_idx': '1000000 1',
+        'order_status_created_idx': '1000000 333334 1',
+        'order_city_created_idx': '1000000 250000 1',
+        'order_phone_idx': '1000000 1',
+        'order_email_idx': '1000000 1',
+    }
+
+    def setUp(self):
+        benchmarks.make_orders(300)
+        # النص التاني ديال الطلبات فـ 2024-01-02
+        Order.objects.filter(phone__gt='0600000150').update(created_at=F('created_at') + timedelta(days=1))
+
+    def get(self, params):
+        return self.client.get(f'/api/orders/?page_size=100&{params}')
+
+    def ids(self, params):
+        response = self.get(params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [row['id'] for row in response.json()['results']]
+
+    def expected(self, **lookups):
+        return list(
+            Order.objects.filter(**lookups).order_by('-created_at', '-id')[:100].values_list('id', flat=True)
+        )
+
+    def test_filters(self):
+        self.assertEqual(
+            self.ids('status=pending&date_to=2024-01-01'),
+            self.expected(status='pending', created_at__date__lte='2024-01-01'),
+        )
+        self.assertEqual(
+            self.ids('city=Rabat,Fes&date_from=2024-01-02'),
+            self.expected(city__in=['Rabat', 'Fes'], created_at__date__gte='2024-01-02'),
+        )
+        self.assertEqual(
+            self.ids('status=paid,shipped&date_from=2024-01-02&date_to=2024-01-02&city=Tanger'),
+            self.expected(status__in=['paid', 'shipped'], created_at__date='2024-01-02', city='Tanger'),
+        )
+        order = Order.objects.get(phone='0600000042')
+        self.assertEqual(self.ids('phone=0600000042'), [order.id])
+        self.assertEqual(self.ids('email=CLIENT42@Example.MA'), [order.id])
+
+    def test_invalid_params(self):
+        self.assertEqual(self.get('status=lost').status_code, 400)
+        self.assertEqual(self.get('date_from=17-10-2026').status_code, 400)
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN ديال SQLite")
+    def test_indexes_are_used_at_a_million_rows(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+            cursor.execute("DELETE FROM sqlite_stat1 WHERE tbl = 'products_order'")
+            cursor.executemany(
+                "INSERT INTO sqlite_stat1 (tbl, idx, stat) VALUES ('products_order', %s, %s)",
+                list(self.MILLION_ORDER_STATS.items()),
+            )
+            cursor.execute("ANALYZE sqlite_schema")  # كيعاود يقرا sqlite_stat1
+
+        for params, index in (
+            ('status=pending&date_from=2024-01-01&date_to=2024-01-01', 'order_status_created_idx'),
+            ('city=Rabat&date_from=2024-01-02', 'order_city_created_idx'),
+            ('phone=0600000042', 'order_phone_idx'),
+            ('email=client42@example.ma', 'order_email_idx'),
+            ('', 'order_created_idx'),
+        ):
+            with CaptureQueriesContext(connection) as ctx:
+                self.ids(params)
+            plan = benchmarks.query_plan(ctx.captured_queries[0]['sql'])
+            self.assertIn(f'USING INDEX {index}', plan, params)
+            self.assertNotIn('SCAN products_order', plan.replace(f'SCAN products_order USING INDEX {index}', ''))
+
+
+class PaginationTests(APITestCase):
+    def collect(self, url):
+        rows, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            rows += response.json()['results']
+            url = response.json()['next']
+            pages += 1
+        return rows, pages
+
+    def test_lists_are_paginated_by_default(self):
+        make_products(7)
+        response = self.client.get('/api/products/')
+        self.assertEqual(len(response.json()['results']), 7)
+        self.assertIsNone(response.json()['next'])
+        with mock.patch.object(KeysetPagination, 'page_size', 3), mock.patch.object(KeysetPagination, 'max_page_size', 5):
+            catalog_cache.invalidate()
+            rows, pages = self.collect('/api/products/')
+            self.assertEqual((len(rows), pages), (7, 3))
+
+            # الشكل القديم: ليستة محدودة بـ max_page_size، والباقي فـ Link
+            response = self.client.get('/api/products/?pagination=off')
+            self.assertEqual(len(response.json()), 5)
+            next_url = response['Link'].removeprefix('<').split('>;')[0]
+            response = self.client.get(next_url)
+            self.assertEqual(len(response.json()), 2)
+            self.assertNotIn('Link', response)
+
+    def test_product_cursor_walks_every_row_once(self):
+        make_products(7)
+        rows, pages = self.collect('/api/products/?page_size=3')
+        self.assertEqual(pages, 3)
+        self.assertEqual([row['id'] for row in rows], list(Product.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_order_cursor_handles_ties_and_null_dates(self):
+        orders = [Order.objects.create(client_name=str(i)) for i in range(6)]
+        same = orders[0].created_at
+        Order.objects.filter(pk__in=[o.pk for o in orders[:3]]).update(created_at=same)
+        Order.objects.filter(pk=orders[5].pk).update(created_at=None)
+
+        rows, _ = self.collect('/api/orders/?page_size=2')
+        ids = [row['id'] for row in rows]
+        self.assertEqual(sorted(ids), sorted(o.pk for o in orders))
+        self.assertEqual(ids[-1], orders[5].pk)
+        self.assertNotIn('items', rows[0])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/orders/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_sparse_fields_and_include(self):
+        (product,) = make_products(1)
+        order = Order.objects.create(client_name="A")
+        OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+
+        response = self.client.get('/api/products/?fields=id,name,price,image_url')
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'name', 'price', 'image_url'})
+
+        response = self.client.get('/api/orders/?fields=id,status')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'status'})
+
+        response = self.client.get('/api/orders/?fields=id&include=items&page_size=10')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'items'})
+        self.assertEqual(response.data['results'][0]['items'][0]['product_name'], product.name)
+
+        self.assertNotIn('items', self.client.get('/api/orders/').data['results'][0])
+        response = self.client.get('/api/orders/?pagination=off')
+        self.assertIn('items', response.data[0])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='receipts-test-'))
+class ReceiptPdfTests(APITestCase):
+    def setUp(self):
+        self.product = make_products(1)[0]
+        self.order = Order.objects.create(client_name="Client", city="Fes", total=Decimal("20.00"))
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=2, price=self.product.price)
+        self.url = f'/api/orders/{self.order.id}/pdf/'
+
+    def tearDown(self):
+        shutil.rmtree(receipts.cache_dir(), ignore_errors=True)
+
+    def cached_files(self):
+        return sorted(path for _, _, path in receipts.cache_files())
+
+    def test_pdf_is_cached_and_revalidated_with_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        body = b''.join(response.streaming_content)
+        self.assertTrue(body.startswith(b'%PDF'))
+        etag = response['ETag']
+        self.assertEqual(len(self.cached_files()), 1)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        response = self.client.get(self.url)
+        self.assertEqual(b''.join(response.streaming_content), body)
+
+    def test_order_change_invalidates(self):
+        etag = self.client.get(self.url)['ETag']
+        self.order.client_name = "Other"
+        self.order.save()
+        self.assertEqual(self.cached_files(), [])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_lru_size_cap(self):
+        data = receipts.receipt_data(self.order)
+        receipts.open_receipt(data).close()
+        size = os.path.getsize(self.cached_files()[0])
+        with self.settings(RECEIPT_CACHE_MAX_BYTES=2 * size + size // 2):
+            for total in ("1.00", "2.00", "3.00"):
+                receipts.open_receipt({**data, 'total': total}).close()
+        self.assertEqual(len(self.cached_files()), 2)
+
+    def test_file_evicted_while_opening_is_still_served(self):
+        data = receipts.receipt_data(self.order)
+        receipts.open_receipt(data).close()
+        path = receipts.cache_path(data)
+
+        def evicted(target, *args, **kwargs):
+            os.remove(target)
+            raise FileNotFoundError(target)
+
+        with mock.patch.object(receipts.os, 'utime', side_effect=evicted):
+            with receipts.open_receipt(data) as handle:
+                self.assertTrue(handle.read().startswith(b'%PDF'))
+        receipts.open_receipt(data).close()
+        with mock.patch.object(receipts.os, 'utime', side_effect=evicted):
+            self.assertTrue(receipts.read_cached(path).startswith(b'%PDF'))
+
+    def test_store_and_invalidate_do_not_scan_the_cache(self):
+        data = receipts.receipt_data(self.order)
+        receipts.open_receipt(data).close()   # أول store: كيحسب الحجم مرة وحدة
+        other = Order.objects.create(client_name="Other")
+        receipts.open_receipt({**data, 'id': other.pk}).close()
+
+        with mock.patch.object(receipts, 'cache_files', side_effect=AssertionError("full scan")):
+            receipts.open_receipt({**data, 'total': '1.00'}).close()
+            receipts.invalidate(self.order.pk)
+        self.assertEqual(
+            [os.path.relpath(path, receipts.cache_dir()) for path in self.cached_files()],
+            [os.path.join(str(other.pk), os.path.basename(receipts.cache_path({**data, 'id': other.pk})))],
+        )
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='receipts-test-'))
+class ReceiptExportTests(APITestCase):
+    def setUp(self):
+        (product,) = make_products(1)
+        self.orders = []
+        for status in ('pending', 'paid', 'paid'):
+            order = Order.objects.create(client_name="Client", status=status, total=Decimal("10.00"))
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+            self.orders.append(order)
+
+    def tearDown(self):
+        shutil.rmtree(receipts.cache_dir(), ignore_errors=True)
+
+    def export(self, query):
+        response = self.client.get(f'/api/orders/export/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_zip_export_with_process_pool(self):
+        for workers in (2, 0):
+            with self.subTest(workers=workers), self.settings(RECEIPT_EXPORT_WORKERS=workers):
+                body = self.export('output=zip&status=paid')
+                with zipfile.ZipFile(io.BytesIO(body)) as archive:
+                    self.assertEqual(
+                        archive.namelist(),
+                        [f"invoice_{order.id}.pdf" for order in self.orders[1:]],
+                    )
+                    self.assertTrue(archive.read(archive.namelist()[0]).startswith(b'%PDF'))
+
+    def test_zip_is_the_default_and_the_pool_is_reused(self):
+        with self.settings(RECEIPT_EXPORT_WORKERS=2):
+            body = self.export('status=paid')
+            self.assertTrue(zipfile.is_zipfile(io.BytesIO(body)))
+            pool = receipts.export_pool(2)
+            self.export('status=pending')
+        self.assertIs(receipts.export_pool(2), pool)
+
+    def test_single_pdf_export(self):
+        today = self.orders[0].created_at.date().isoformat()
+        body = self.export(f'date_from={today}&date_to={today}&output=pdf')
+        self.assertTrue(body.startswith(b'%PDF'))
+        self.assertEqual(body.count(b'/Type /Page\n'), 3)
+
+        with self.settings(RECEIPT_EXPORT_PDF_MAX_ORDERS=2):
+            self.assertEqual(self.client.get('/api/orders/export/?output=pdf').status_code, 400)
+            self.assertEqual(self.client.get('/api/orders/export/?output=pdf&status=paid').status_code, 200)
+
+    def test_invalid_filters(self):
+        for query in ('date_from=yesterday', 'status=lost', 'output=docx'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/api/orders/export/?{query}').status_code, 400)
+
+
+class RtlShapingTests(TestCase):
+    def test_parts_match_whole_line_and_labels_hit_cache(self):
+        for label, value in (("الاسم: ", "Ahmed"), ("المدينة: ", "الدار البيضاء"), ("الاسم: ", "Ahmed محمد")):
+            self.assertEqual(receipts.rtl(value) + receipts.rtl(label), receipts.rtl(label + value))
+
+        receipts.rtl.cache_clear()
+        data = {
+            'id': 1, 'status': 'paid', 'client_name': 'A', 'phone': None, 'city': None,
+            'total': '10.00', 'date': None, 'time': None, 'items': [['أتاي', 1, '10.00']],
+        }
+        receipts.render_receipt(data)
+        first = receipts.shaping_stats()
+        receipts.render_receipt({**data, 'id': 2, 'client_name': 'B'})
+        second = receipts.shaping_stats()
+        # غير الرقم ديال الطلب والاسم اللي جداد فالـ receipt التاني
+        self.assertEqual(second['misses'] - first['misses'], 2)
+
+
+class StartupTests(TestCase):
+    def test_importing_views_does_not_load_the_font(self):
+        (result,) = measure_startup(runs=1)
+        self.assertNotIn(receipts.FONT_NAME, result['fonts'])
+        self.assertLess(result['views'], 5)
+
+    @unittest.skipIf(os.environ.get('RECEIPT_FONT_PATH'), "RECEIPT_FONT_PATH set in the environment")
+    def test_font_is_located_through_search_dirs_by_default(self):
+        self.assertIsNone(settings.RECEIPT_FONT_PATH)
+        self.assertIn(settings.BASE_DIR / 'fonts', settings.RECEIPT_FONT_DIRS)
+
+    def test_font_lookup_falls_back_to_search_dirs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            nested = os.path.join(directory, 'truetype')
+            os.makedirs(nested)
+            path = os.path.join(nested, 'Amiri-Regular.ttf')
+            open(path, 'wb').close()
+            with self.settings(
+                RECEIPT_FONT_PATH=os.path.join(directory, 'missing.ttf'),
+                RECEIPT_FONT_DIRS=[directory],
+                RECEIPT_FONT_FILES=['Khalid.ttf', 'Amiri-Regular.ttf'],
+            ):
+                self.assertEqual(receipts.find_font(), path)
+            with self.settings(RECEIPT_FONT_PATH=None, RECEIPT_FONT_DIRS=[], RECEIPT_FONT_FILES=[]):
+                self.assertIsNone(receipts.find_font())
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_suite_measures_every_path(self):
+        results = benchmarks.run_suite(io.StringIO(), repeat=2, scales=['1k'])
+        self.assertEqual(set(results), {'1k'})
+        self.assertEqual(set(results['1k']), {
+            'product_list', 'order_list', 'order_detail', 'order_create_1',
+            'order_create_10', 'order_create_50', 'order_update', 'order_pdf',
+        })
+        for name, result in results['1k'].items():
+            self.assertGreater(result['req_s'], 0, name)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'], name)
+        # عدد الـ queries ماكيتعلقش بعدد السطور
+        self.assertEqual(results['1k']['order_create_1']['queries'], results['1k']['order_create_50']['queries'])
+        self.assertFalse(Order.objects.exists())
+
+    def test_orm_seed_matches_the_sqlite_seed(self):
+        products = benchmarks.make_products(3)
+        columns = ('client_name', 'phone', 'email', 'city', 'address', 'total', 'status', 'created_at')
+
+        def seeded():
+            orders = list(Order.objects.order_by('id').values_list(*columns))
+            # product_id كيتعلق بالـ id ديال الطلب (AUTOINCREMENT كيكمل من بعد delete)
+            items = list(OrderItem.objects.order_by('order__created_at', 'id').values_list('quantity', 'price'))
+            OrderItem.objects.all().delete()
+            Order.objects.all().delete()
+            return orders, items
+
+        benchmarks.make_orders(7, start=2)
+        benchmarks.make_order_items(2, products)
+        expected = seeded()
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            benchmarks.make_orders(7, start=2)
+            benchmarks.make_order_items(2, products)
+        self.assertTrue(Order._meta.get_field('created_at').auto_now_add)
+        orders, items = seeded()
+        self.assertEqual((orders, items), expected)
+        self.assertEqual(len(items), 14)
+
+    def test_compare_and_save_baseline(self):
+        result = {'queries': 3, 'req_s': 100.0, 'p50_ms': 10.0, 'p99_ms': 20.0}
+        baseline = {'1k': {'order_list': {**result, 'p50_ms': 8.0}}}
+        self.assertEqual(benchmarks.compare({'1k': {'order_list': result}}, baseline), [])
+        self.assertEqual(len(benchmarks.compare({'1k': {'order_list': result}}, baseline, tolerance=0.1)), 1)
+        slower = {**result, 'queries': 4}
+        self.assertEqual(
+            benchmarks.compare({'1k': {'order_list': slower, 'order_pdf': slower}}, baseline),
+            ["1k order_list: 3 -> 4 queries"],
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            benchmarks.save_baseline(baseline, path)
+            benchmarks.save_baseline({'100k': {'order_list': result}}, path)
+            self.assertEqual(set(benchmarks.load_baseline(path)), {'1k', '100k'})
+
+
+class AnalyticsTests(APITestCase):
+    def setUp(self):
+        self.a, self.b = make_products(2, stock=50)
+
+    def create(self, city, items):
+        response = self.client.post('/api/orders/', {
+            'client_name': 'X', 'city': city,
+            'items': [{'product': p.id, 'quantity': q} for p, q in items],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.data['id']
+
+    def dashboard(self):
+        response = self.client.get('/api/analytics/')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_incremental_updates_match_full_rebuild(self):
+        first = self.create('Rabat', [(self.a, 2), (self.b, 1)])
+        second = self.create('Fes', [(self.a, 1)])
+        third = self.create('Fes', [(self.b, 4)])
+
+        self.client.patch(f'/api/orders/{first}/', {'status': 'paid'}, format='json')
+        self.client.put(f'/api/orders/{second}/', {
+            'client_name': 'X', 'city': 'Rabat', 'items': [{'product': self.b.id, 'quantity': 3}],
+        }, format='json')
+        self.client.delete(f'/api/orders/{third}/')
+
+        data = self.dashboard()
+        self.assertEqual(data['orders_by_status'], {'paid': 1, 'pending': 1})
+        self.assertEqual(data['revenue_per_city'], [{'city': 'Rabat', 'orders': 2, 'revenue': '60.00'}])
+        self.assertEqual(
+            [(row['product_id'], row['quantity']) for row in data['top_products']],
+            [(self.b.id, 4), (self.a.id, 2)],
+        )
+
+        analytics.rebuild()
+        self.assertEqual(self.dashboard(), data)
+
+    def test_low_stock(self):
+        Product.objects.filter(pk=self.a.pk).update(stock=3)
+        data = self.dashboard()
+        self.assertEqual([row['id'] for row in data['low_stock']], [self.a.id])
+
+    def test_dashboard_query_count_does_not_depend_on_orders(self):
+        for _ in range(5):
+            self.create('Rabat', [(self.a, 1)])
+        with CaptureQueriesContext(connection) as small:
+            self.dashboard()
+        for _ in range(20):
+            self.create('Fes', [(self.a, 1), (self.b, 1)])
+        with CaptureQueriesContext(connection) as large:
+            self.dashboard()
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='transition-test-'))
+class OrderTransitionTests(APITestCase):
+    def setUp(self):
+        (self.product,) = make_products(1, stock=1000)
+
+    def tearDown(self):
+        shutil.rmtree(receipts.cache_dir(), ignore_errors=True)
+
+    def create(self, city='Rabat', status='pending'):
+        response = self.client.post('/api/orders/', {
+            'client_name': 'Test', 'city': city, 'items': [{'product': self.product.id, 'quantity': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        if status != 'pending':
+            self.client.patch(f"/api/orders/{response.data['id']}/", {'status': status}, format='json')
+        return response.data['id']
+
+    def transition(self, payload, query=''):
+        return self.client.post(f'/api/orders/transition/{query}', payload, format='json')
+
+    def test_ids_with_allowed_and_rejected_transitions(self):
+        pending = [self.create() for _ in range(3)]
+        paid, shipped = self.create(status='paid'), self.create(status='shipped')
+        before = Order.objects.get(pk=pending[0]).updated_at
+
+        response = self.transition({'status': 'paid', 'ids': pending + [paid, shipped, 999]})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['changed'], pending)
+        self.assertEqual(response.data['rejected'], [
+            {'id': paid, 'status': 'paid'}, {'id': shipped, 'status': 'shipped'}, {'id': 999, 'status': None},
+        ])
+        self.assertEqual(
+            dict(Order.objects.values_list('id', 'status')),
+            {**{pk: 'paid' for pk in pending + [paid]}, shipped: 'shipped'},
+        )
+        self.assertGreater(Order.objects.get(pk=pending[0]).updated_at, before)
+
+        # pending -> shipped ماكايناش: خاص يدوز من paid
+        response = self.transition({'status': 'shipped', 'ids': [self.create()]})
+        self.assertEqual(response.data['changed'], [])
+
+    def test_filter_and_analytics_stay_consistent(self):
+        rabat = [self.create() for _ in range(2)]
+        fes = self.create(city='Fes')
+        response = self.transition({'status': 'paid'}, '?city=Rabat&status=pending')
+        self.assertEqual(sorted(response.data['changed']), rabat)
+        self.assertEqual(Order.objects.get(pk=fes).status, 'pending')
+
+        data = self.client.get('/api/analytics/').json()
+        self.assertEqual(data['orders_by_status'], {'paid': 2, 'pending': 1})
+        analytics.rebuild()
+        self.assertEqual(self.client.get('/api/analytics/').json(), data)
+
+    def test_query_count_does_not_grow_with_orders(self):
+        counts = []
+        for size in (2, 20):
+            ids = [self.create() for _ in range(size)]
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.transition({'status': 'paid', 'ids': ids})
+            self.assertEqual(len(response.data['changed']), size)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_receipts_are_invalidated(self):
+        order = self.create()
+        self.client.get(f'/api/orders/{order}/pdf/')
+        self.assertEqual(len(receipts.cache_files()), 1)
+        self.transition({'status': 'paid', 'ids': [order]})
+        self.assertEqual(receipts.cache_files(), [])
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.transition({'status': 'paid'}).status_code, 400)      # بلا ids ولا فلتر
+        self.assertEqual(self.transition({'status': 'pending', 'ids': [1]}).status_code, 400)
+        self.assertEqual(self.transition({'status': 'paid', 'ids': []}).status_code, 400)
+
+    def test_empty_filters_do_not_select_everything(self):
+        order = self.create()
+        for query in ('?status=', '?city=,', '?email=%20&phone='):
+            self.assertEqual(self.transition({'status': 'paid'}, query).status_code, 400, query)
+        self.assertEqual(Order.objects.get(pk=order).status, 'pending')
+
+    def test_ids_excluded_by_filters_keep_their_status(self):
+        rabat, fes = self.create(), self.create(city='Fes')
+        response = self.transition({'status': 'paid', 'ids': [rabat, fes, 999]}, '?city=Rabat')
+        self.assertEqual(response.data['changed'], [rabat])
+        self.assertEqual(response.data['rejected'], [{'id': fes, 'status': 'pending'}, {'id': 999, 'status': None}])
+
+
+class LowStockTests(APITestCase):
+    def setUp(self):
+        (self.product,) = make_products(1, stock=8)  # min_stock = 5
+
+    def test_alert_only_when_threshold_is_crossed(self):
+        stock.reserve({self.product.id: 2})   # 6: مازال فوق الحد
+        self.assertFalse(StockAlert.objects.exists())
+        stock.reserve({self.product.id: 1})   # 5: low
+        stock.reserve({self.product.id: 1})   # 4: مازال low
+        stock.release({self.product.id: 3})   # 7: restocked
+        self.assertEqual(
+            list(StockAlert.objects.order_by('id').values_list('kind', 'stock')),
+            [('low', 5), ('restocked', 7)],
+        )
+
+    def test_low_stock_endpoint_and_index(self):
+        make_products(3, stock=50)
+        Product.objects.filter(pk=self.product.pk).update(stock=2)
+        response = self.client.get('/api/products/low_stock/')
+        self.assertEqual([row['id'] for row in response.data], [self.product.id])
+
+        with connection.cursor() as cursor:
+            sql, params = Product.objects.filter(stock__lte=F('min_stock')).order_by('stock').query.sql_with_params()
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = " ".join(str(row) for row in cursor.fetchall())
+        self.assertIn('product_low_stock_idx', plan)
+
+    def test_feed_long_poll(self):
+        response = self.client.get('/api/stock-alerts/')
+        self.assertEqual(response.data, {'results': [], 'last_id': 0})
+
+        start = time.monotonic()
+        response = self.client.get('/api/stock-alerts/?after=0&wait=0.3')
+        self.assertEqual(response.data['results'], [])
+        self.assertGreaterEqual(time.monotonic() - start, 0.3)
+
+        self.client.post('/api/orders/', {'items': [{'product': self.product.id, 'quantity': 4}]}, format='json')
+        response = self.client.get('/api/stock-alerts/?after=0&wait=10')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['product_name'], self.product.name)
+        last_id = response.data['last_id']
+
+        response = self.client.get(f'/api/stock-alerts/?after={last_id}')
+        self.assertEqual(response.data, {'results': [], 'last_id': last_id})
+
+    def test_feed_rejects_invalid_wait(self):
+        for wait in ('nan', 'inf', '-inf', 'abc'):
+            with self.subTest(wait=wait):
+                response = self.client.get(f'/api/stock-alerts/?after=0&wait={wait}')
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='images-test-'), PRODUCT_IMAGE_SIZES=[160, 320])
+class ProductImageTests(APITestCase):
+    def tearDown(self):
+        shutil.rmtree(os.path.join(settings.MEDIA_ROOT, 'products'), ignore_errors=True)
+
+    def upload(self, size, name='photo.jpg'):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (200, 120, 40)).save(buffer, 'JPEG')
+        upload = SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+        response = self.client.post('/api/products/', {'name': 'Atay', 'image': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.data
+
+    def test_upload_generates_size_buckets(self):
+        data = self.upload((1200, 900))
+        self.assertEqual(set(data['image_srcset']), {'160', '320'})
+        product = Product.objects.get(pk=data['id'])
+        for width in (160, 320):
+            path = os.path.join(settings.MEDIA_ROOT, images.thumbnail_name(product.image.name, width))
+            with Image.open(path) as thumb:
+                self.assertEqual(thumb.format, images.image_format())
+                self.assertEqual(thumb.width, width)
+
+    def test_small_images_are_not_upscaled_and_missing_files_are_ignored(self):
+        data = self.upload((100, 80), name='small.jpg')
+        product = Product.objects.get(pk=data['id'])
+        path = os.path.join(settings.MEDIA_ROOT, images.thumbnail_name(product.image.name, 320))
+        with Image.open(path) as thumb:
+            self.assertEqual(thumb.size, (100, 80))
+
+        Product.objects.filter(pk=product.pk).update(image='products/missing.jpg')
+        response = self.client.get(f'/api/products/{product.pk}/')
+        self.assertEqual(response.json()['image_srcset'], {})
+
+    def test_decompression_bomb_falls_back_to_the_original(self):
+        data = self.upload((1200, 900))
+        product = Product.objects.get(pk=data['id'])
+        images.delete(product.image.name)
+        # فوق 2 * MAX_IMAGE_PIXELS، Pillow كيطلق DecompressionBombError (ماشي OSError)
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000):
+            self.assertEqual(images.srcset(product.image), {})
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, images.thumbnail_name(product.image.name, 160))))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='media-test-'))
+class CatalogImportExportTests(APITestCase):
+    def setUp(self):
+        self.atay, self.zit = make_products(2, stock=5)
+
+    def upload(self, name, content):
+        return self.client.post(
+            '/api/products/import/', {'file': SimpleUploadedFile(name, content)}, format='multipart'
+        )
+
+    def export(self, query=''):
+        response = self.client.get(f'/api/products/export/?{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv_upsert_with_row_errors(self):
+        self.client.get('/api/products/')   # باش الليستة تكون فالكاش
+        before = Product.objects.get(pk=self.atay.pk).updated_at
+        content = (
+            "id,name,price,stock,category\n"
+            f"{self.atay.id},,12.50,,tea\n"      # الخانات الخاويين ماكيتبدلوش
+            ",Sokar,30,7,\n"
+            ",,5,1,\n"                          # بلا name
+            "999,X,1,1,\n"                      # id ما كاينش
+            ",Lben,abc,1,\n"
+            f"{self.atay.id},Atay,1,1,\n"        # نفس الـ id مرتين
+        ).encode()
+        response = self.upload('products.csv', content)
+        self.assertEqual(response.status_code, 200, response.content)
+        report = response.json()
+        self.assertEqual((report['created'], report['updated'], report['failed']), (1, 1, 4))
+        self.assertEqual([error['row'] for error in report['errors']], [4, 5, 6, 7])
+        self.assertIn('name', report['errors'][0]['errors'])
+
+        atay = Product.objects.get(pk=self.atay.pk)
+        self.assertEqual((atay.name, atay.price, atay.stock, atay.category), (self.atay.name, Decimal('12.50'), 5, 'tea'))
+        self.assertGreater(atay.updated_at, before)
+        sokar = Product.objects.get(name='Sokar')
+        self.assertEqual((sokar.price, sokar.stock, sokar.category), (Decimal('30'), 7, 'general'))
+        names = [row['name'] for row in self.client.get('/api/products/').json()['results']]
+        self.assertIn('Sokar', names)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        counts = []
+        for size in (10, 300):
+            rows = ''.join(f",Product {size}-{i},{i},1\n" for i in range(size))
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.upload('products.csv', f"id,name,price,stock\n{rows}".encode())
+            self.assertEqual(response.json()['created'], size)
+            # bulk_create كيقسم الـ INSERT على حساب limit ديال الـ parameters فـ SQLite
+            counts.append(len([q for q in ctx.captured_queries if not q['sql'].startswith('INSERT')]))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_bad_header_is_rejected(self):
+        self.assertEqual(self.upload('products.csv', b"name,colour\nA,red\n").status_code, 400)
+        self.assertEqual(self.upload('products.txt', b"name\nA\n").status_code, 400)
+
+    def test_non_utf8_csv_is_rejected_before_any_batch(self):
+        rows = "".join(f",Product {i},1,1\n" for i in range(catalog_io.BATCH_SIZE + 10))
+        content = f"id,name,price,stock\n{rows},Atay مغربي,1,1\n".encode('cp1256')
+        response = self.upload('products.csv', content)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('UTF-8', response.json()['file'])
+        self.assertEqual(Product.objects.count(), 2)
+
+        response = self.upload('products.csv', "id,name,price\n,Café,1\n".encode('latin-1'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_oversized_csv_field_reports_committed_rows(self):
+        rows = "".join(f",Product {i},1,1\n" for i in range(catalog_io.BATCH_SIZE))
+        content = f"id,name,price,stock\n{rows},{'x' * (csv.field_size_limit() + 1)},1,1\n".encode()
+        response = self.upload('products.csv', content)
+        self.assertEqual(response.status_code, 400)
+        message = response.json()['file']
+        self.assertIn(f"السطر {catalog_io.BATCH_SIZE + 2}", message)
+        self.assertIn(f"{catalog_io.BATCH_SIZE} منتج تسجل", message)
+        self.assertEqual(Product.objects.count(), 2 + catalog_io.BATCH_SIZE)
+
+    @unittest.skipUnless(openpyxl, "openpyxl ماكاينش")
+    def test_invalid_xlsx_is_rejected(self):
+        self.assertEqual(self.upload('products.xlsx', b"id,name\n,Atay\n").status_code, 400)
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr('readme.txt', 'not a workbook')
+        self.assertEqual(self.upload('products.xlsx', buffer.getvalue()).status_code, 400)
+
+    def test_csv_export_roundtrip(self):
+        Product.objects.filter(pk=self.zit.pk).update(name='زيت, "بلدي"', category='food')
+        content = self.export()
+        self.assertTrue(content.startswith('﻿id,name'.encode()))
+        self.assertEqual(self.export('category=food').decode('utf-8-sig').count('\n'), 2)
+
+        response = self.upload('products.csv', content)
+        self.assertEqual(response.json(), {'created': 0, 'updated': 2, 'failed': 0, 'errors': []})
+        self.assertEqual(Product.objects.get(pk=self.zit.pk).name, 'زيت, "بلدي"')
+
+    @unittest.skipUnless(openpyxl, "openpyxl ماكاينش")
+    def test_xlsx_export_and_import(self):
+        Product.objects.filter(pk=self.zit.pk).update(description='a < b & c\x01')
+        workbook = openpyxl.load_workbook(io.BytesIO(self.export('output=xlsx')))
+        rows = list(workbook.active.iter_rows(values_only=True))
+        self.assertEqual(rows[0], ('id', 'name', 'description', 'price', 'category', 'stock', 'min_stock'))
+        self.assertEqual(rows[2][:3], (self.zit.id, self.zit.name, 'a < b & c'))
+
+        sheet = openpyxl.Workbook()
+        sheet.active.append(['id', 'name', 'price', 'stock'])
+        sheet.active.append([self.atay.id, None, 19.99, 40])
+        sheet.active.append([None, 'Qahwa', 45, 3])
+        buffer = io.BytesIO()
+        sheet.save(buffer)
+        response = self.upload('products.xlsx', buffer.getvalue())
+        self.assertEqual(response.json()['created'], 1)
+        atay = Product.objects.get(pk=self.atay.pk)
+        self.assertEqual((atay.price, atay.stock), (Decimal('19.99'), 40))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='media-test-'))
+class MediaServingTests(TestCase):
+    def tearDown(self):
+        shutil.rmtree(os.path.join(settings.MEDIA_ROOT, 'products'), ignore_errors=True)
+
+    def setUp(self):
+        self.content = bytes(range(256)) * 40
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'products'), exist_ok=True)
+        with open(os.path.join(settings.MEDIA_ROOT, 'products', 'photo.jpg'), 'wb') as handle:
+            handle.write(self.content)
+        self.product = Product.objects.create(name='Atay', price='10.00', image='products/photo.jpg')
+
+    def test_versioned_url_is_immutable_and_revalidates_with_304(self):
+        url = ProductSerializer(self.product).data['image_url']
+        self.assertRegex(url, r'^/media/products/photo\.jpg\?v=[0-9a-f]{16}$')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        response = self.client.get('/media/products/photo.jpg', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+        response = self.client.get('/media/products/photo.jpg', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_byte_ranges(self):
+        response = self.client.get('/media/products/photo.jpg', HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[100:200])
+
+        response = self.client.get('/media/products/photo.jpg', HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-10:])
+
+        response = self.client.get('/media/products/photo.jpg', HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+
+        # If-Range قديم: الملف كامل
+        response = self.client.get('/media/products/photo.jpg', HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_and_traversal_are_404(self):
+        self.assertEqual(self.client.get('/media/products/nope.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/media/../settings.py').status_code, 404)
+
+    @override_settings(MEDIA_SENDFILE_HEADER='X-Accel-Redirect')
+    def test_sendfile_offload(self):
+        response = self.client.get('/media/products/photo.jpg')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/products/photo.jpg')
+        self.assertEqual(response.content, b'')
+
+
+class ProductSearchTests(APITestCase):
+    def setUp(self):
+        Product.objects.bulk_create([
+            Product(name='Atay Sultan', description='شاي أخضر', category='drinks', price='25.00', stock=3),
+            Product(name='Café Dubois', description='Arabica moulu', category='drinks', price='40.00', stock=0),
+            Product(name='Zit Lalla', description='huile d’olive', category='food', price='60.00', stock=8),
+            Product(name='Sokar', description='sucre en morceaux', category='food', price='12.50', stock=20),
+        ])
+        catalog_cache.invalidate()
+
+    def names(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        rows = data['results'] if isinstance(data, dict) else data
+        return [row['name'] for row in rows]
+
+    def test_filters_combine(self):
+        self.assertEqual(self.names('/api/products/?category=drinks'), ['Atay Sultan', 'Café Dubois'])
+        self.assertEqual(self.names('/api/products/?min_price=20&max_price=50'), ['Atay Sultan', 'Café Dubois'])
+        self.assertEqual(self.names('/api/products/?category=drinks,food&in_stock=1&max_price=30'), ['Atay Sultan', 'Sokar'])
+        self.assertEqual(self.client.get('/api/products/?min_price=abc').status_code, 400)
+
+    def test_search_uses_fts_and_follows_updates(self):
+        self.assertEqual(self.names('/api/products/?search=cafe'), ['Café Dubois'])
+        self.assertEqual(self.names('/api/products/?search=شاي'), ['Atay Sultan'])
+        self.assertEqual(self.names('/api/products/?search=suc mor'), ['Sokar'])
+        self.assertEqual(self.names('/api/products/?search="'), ['Atay Sultan', 'Café Dubois', 'Zit Lalla', 'Sokar'])
+
+        Product.objects.filter(name='Sokar').update(name='Sokar Cosumar', stock=0)
+        catalog_cache.invalidate()
+        self.assertEqual(self.names('/api/products/?search=cosumar'), ['Sokar Cosumar'])
+        Product.objects.filter(name='Atay Sultan').delete()
+        self.assertEqual(self.names('/api/products/?search=atay'), [])
+
+    def test_ordering_and_keyset_pages(self):
+        self.assertEqual(self.names('/api/products/?ordering=-price'), ['Zit Lalla', 'Café Dubois', 'Atay Sultan', 'Sokar'])
+        self.assertEqual(self.client.get('/api/products/?ordering=description').status_code, 400)
+
+        names, url = [], '/api/products/?ordering=category,-price&page_size=1'
+        while url:
+            response = self.client.get(url)
+            names += [row['name'] for row in response.json()['results']]
+            url = response.json()['next']
+        self.assertEqual(names, ['Café Dubois', 'Atay Sultan', 'Zit Lalla', 'Sokar'])
+
+
+class CatalogCacheTests(APITestCase):
+    def setUp(self):
+        self.first, self.second = make_products(2, stock=10)
+
+    def test_hits_and_revalidation(self):
+        catalog_cache.reset_stats()
+        first = self.client.get('/api/products/')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/products/')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get('/api/products/?fields=id')['X-Cache'], 'MISS')
+        self.assertEqual(catalog_cache.stats(), {'hit': 1, 'miss': 2, 'not_modified': 1, 'hit_ratio': 0.5})
+
+    def test_product_changes_invalidate_precisely(self):
+        self.client.get('/api/products/')
+        self.client.get(f'/api/products/{self.first.pk}/')
+        self.client.get(f'/api/products/{self.second.pk}/')
+
+        self.first.name = 'Renamed'
+        self.first.save()
+        response = self.client.get('/api/products/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['results'][0]['name'], 'Renamed')
+        self.assertEqual(self.client.get(f'/api/products/{self.first.pk}/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(f'/api/products/{self.second.pk}/')['X-Cache'], 'HIT')
+
+    def test_html_and_authenticated_responses_are_not_shared(self):
+        from django.contrib.auth.models import User
+
+        admin = User.objects.create_superuser('catalog-admin', 'admin@example.ma', 'secret')
+        staff = APIClient()
+        staff.force_login(admin)
+        anonymous = APIClient()
+
+        page = staff.get('/api/products/', HTTP_ACCEPT='text/html')
+        self.assertContains(page, 'catalog-admin')
+        self.assertNotIn('X-Cache', page)
+        page = anonymous.get('/api/products/', HTTP_ACCEPT='text/html')
+        self.assertNotIn('X-Cache', page)
+        self.assertNotContains(page, 'catalog-admin')
+
+        self.assertNotIn('X-Cache', staff.get('/api/products/'))
+        self.assertNotIn('X-Cache', anonymous.get('/api/products/', HTTP_AUTHORIZATION='Basic eDp5'))
+        self.assertEqual(anonymous.get('/api/products/')['X-Cache'], 'MISS')
+        self.assertNotIn('X-Cache', staff.get('/api/products/'))
+
+    def test_orders_invalidate_stock(self):
+        detail = self.client.get(f'/api/products/{self.first.pk}/')
+        self.client.post('/api/orders/', {'items': [{'product': self.first.pk, 'quantity': 3}]}, format='json')
+
+        response = self.client.get(f'/api/products/{self.first.pk}/', HTTP_IF_NONE_MATCH=detail['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['stock'], 7)
+
+
+@override_settings(SYNC_OVERLAP_SECONDS=0)
+class SyncTests(APITestCase):
+    def sync(self, token=None):
+        url = '/api/sync/' if token is None else f'/api/sync/?since={token}'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data
+
+    def test_delta_contains_only_changes_and_deletions(self):
+        kept, changed, removed = make_products(3, stock=10)
+        order = self.client.post('/api/orders/', {'items': [{'product': kept.id, 'quantity': 1}]}, format='json').data
+
+        first = self.sync()
+        self.assertTrue(first['full'])
+        self.assertEqual(len(first['products']), 3)
+        self.assertEqual([o['id'] for o in first['orders']], [order['id']])
+
+        time.sleep(0.01)
+        self.assertEqual(self.sync(first['token'])['products'], [])
+        changed.price = Decimal('99.00')
+        changed.save()
+        removed_id = removed.pk
+        removed.delete()
+        self.client.delete(f"/api/orders/{order['id']}/")
+
+        delta = self.sync(first['token'])
+        self.assertFalse(delta['full'])
+        self.assertEqual([p['id'] for p in delta['products']], [changed.id])
+        self.assertEqual(delta['orders'], [])
+        self.assertEqual(delta['deleted'], {'product': [removed_id], 'order': [order['id']]})
+
+    def test_item_changes_touch_the_order(self):
+        (product,) = make_products(1)
+        order = Order.objects.create(client_name='A')
+        token = self.sync()['token']
+        time.sleep(0.01)
+        OrderItem.objects.create(order=order, product=product, quantity=2, price=product.price)
+        delta = self.sync(token)
+        self.assertEqual([o['id'] for o in delta['orders']], [order.id])
+        self.assertEqual(delta['orders'][0]['items'][0]['quantity'], 2)
+
+    def test_stale_or_invalid_tokens(self):
+        self.assertEqual(self.client.get('/api/sync/?since=abc').status_code, 400)
+        self.assertTrue(self.sync('1000000')['full'])
+
+
+class EncodingTests(APITestCase):
+    def setUp(self):
+        make_products(30)
+
+    @unittest.skipIf(msgpack is None, "msgpack not installed")
+    def test_messagepack_round_trip(self):
+        response = self.client.get('/api/products/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), self.client.get('/api/products/').json())
+
+        product = Product.objects.first()
+        body = msgpack.packb({'client_name': 'M', 'items': [{'product': product.id, 'quantity': 2}]})
+        response = self.client.post('/api/orders/', body, content_type='application/msgpack')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data['total'], '20.00')
+
+    @unittest.skipIf(zstandard is None, "zstandard not installed")
+    def test_compression_negotiation_and_threshold(self):
+        plain = self.client.get('/api/products/')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        response = self.client.get('/api/products/', HTTP_ACCEPT_ENCODING='gzip, zstd')
+        self.assertEqual(response['Content-Encoding'], 'zstd')
+        self.assertEqual(zstandard.ZstdDecompressor().decompressobj().decompress(response.content), plain.content)
+        self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
+
+        response = self.client.get('/api/products/', HTTP_ACCEPT_ENCODING='zstd;q=0.5, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+        # ETag weak كيرجع 304
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH='W/' + plain['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        with self.settings(COMPRESSION_MIN_SIZE=10 ** 6):
+            response = self.client.get('/api/products/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_choose_encoding(self):
+        self.assertIsNone(middleware.choose_encoding(''))
+        self.assertIsNone(middleware.choose_encoding('gzip;q=0, identity'))
+        self.assertEqual(middleware.choose_encoding('gzip, deflate'), 'gzip')
+        self.assertEqual(middleware.choose_encoding('*'), middleware.choose_encoding('zstd, br, gzip'))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='async-test-'))
+class AsyncReadTests(TestCase):
+    """products/async_views.py: نفس الأجوبة ديال الـ viewsets."""
+
+    def setUp(self):
+        self.products = make_products(5, stock=50)
+        self.order = Order.objects.create(client_name='Async', city='Rabat', total=Decimal('20.00'))
+        OrderItem.objects.create(order=self.order, product=self.products[0], quantity=2, price=Decimal('10.00'))
+
+    async def get_both(self, url, **headers):
+        sync_response = await sync_to_async(self.client.get)(f'/api{url}', **headers)
+        with self.settings(ROOT_URLCONF='products.async_urls'):
+            async_response = await AsyncClient().get(url, **headers)
+        return sync_response, async_response
+
+    async def test_same_output_as_viewsets(self):
+        for url in (
+            '/products/',
+            '/products/?category=general&ordering=-price&page_size=2',
+            '/products/?fields=id,name&page_size=3',
+            f'/products/{self.products[1].pk}/?fields=id,stock',
+            f'/orders/{self.order.pk}/',
+            f'/orders/{self.order.pk}/?fields=id,total',
+        ):
+            sync_response, async_response = await self.get_both(url)
+            self.assertEqual(async_response.status_code, 200, url)
+            # الـ urlconf ديال التيست مافيهش /api/ (الـ next link)
+            self.assertEqual(async_response.content, sync_response.content.replace(b'/api/', b'/'), url)
+
+    async def test_image_work_runs_off_the_event_loop(self):
+        threads = []
+        srcset = images.srcset
+
+        def record(image):
+            threads.append(threading.get_ident())
+            return srcset(image)
+
+        with mock.patch.object(images, 'srcset', record), self.settings(ROOT_URLCONF='products.async_urls'):
+            client = AsyncClient()
+            self.assertEqual((await client.get('/products/')).status_code, 200)
+            self.assertEqual((await client.get(f'/products/{self.products[0].pk}/')).status_code, 200)
+        self.assertEqual(len(threads), 6)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    async def test_errors_and_writes_fall_back_to_viewsets(self):
+        with self.settings(ROOT_URLCONF='products.async_urls'):
+            client = AsyncClient()
+            self.assertEqual((await client.get('/products/?ordering=nope')).status_code, 400)
+            self.assertEqual((await client.get('/products/999999/')).status_code, 404)
+            self.assertEqual((await client.get('/orders/abc/')).status_code, 404)
+            response = await client.patch(
+                f'/orders/{self.order.pk}/', {'status': 'paid'}, content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual((await Order.objects.aget(pk=self.order.pk)).status, 'paid')
+
+    async def test_pdf_in_thread_pool_with_etag(self):
+        with self.settings(ROOT_URLCONF='products.async_urls'):
+            client = AsyncClient()
+            response = await client.get(f'/orders/{self.order.pk}/pdf/')
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.content.startswith(b'%PDF'))
+            self.assertIn('invoice_', response['Content-Disposition'])
+            response = await client.get(f'/orders/{self.order.pk}/pdf/', headers={'If-None-Match': response['ETag']})
+            self.assertEqual(response.status_code, 304)
+
+
+def metric_value(text, name, **labels):
+    """القيمة ديال سطر واحد من /metrics/ (None إلا ماكاينش)."""
+    suffix = '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}' if labels else ''
+    for line in text.splitlines():
+        if line.startswith(name + suffix + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix='metrics-test-'))
+class MetricsTests(APITestCase):
+    def setUp(self):
+        metrics.reset()
+        self.products = make_products(3, stock=50)
+        self.order = Order.objects.create(client_name='Metrics', city='Rabat', total=Decimal('20.00'))
+        OrderItem.objects.create(order=self.order, product=self.products[0], quantity=2, price=Decimal('10.00'))
+
+    def scrape(self):
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        return response.content.decode()
+
+    def test_queries_and_latency_per_view_and_action(self):
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/orders/').status_code, 200)
+        # captured_queries كيتقرا من connection.queries اللي كيتمسح فكل طلب
+        list_queries = len(queries)
+        self.client.get('/api/orders/')
+        self.client.get(f'/api/orders/{self.order.pk}/')
+        self.client.get('/api/orders/999999/')
+
+        text = self.scrape()
+        labels = {'view': 'OrderViewSet', 'action': 'list'}
+        self.assertEqual(metric_value(text, 'market_request_queries_count', **labels), 2)
+        self.assertEqual(metric_value(text, 'market_request_queries_sum', **labels), 2 * list_queries)
+        self.assertEqual(metric_value(text, 'market_request_duration_seconds_count', **labels, status='2xx'), 2)
+        self.assertGreater(metric_value(text, 'market_request_serializer_seconds_sum', **labels), 0)
+        self.assertEqual(metric_value(
+            text, 'market_request_duration_seconds_count', view='OrderViewSet', action='retrieve', status='4xx',
+        ), 1)
+        self.assertEqual(metric_value(
+            text, 'market_request_duration_seconds_bucket', **labels, status='2xx', le='+Inf',
+        ), 2)
+        self.assertIsNotNone(metric_value(text, 'market_catalog_cache_hit_ratio'))
+
+    def test_pdf_render_time(self):
+        receipts.invalidate(self.order.pk)
+        self.client.get(f'/api/orders/{self.order.pk}/pdf/')
+        text = self.scrape()
+        self.assertEqual(metric_value(text, 'market_pdf_render_seconds_count'), 1)
+        self.assertEqual(metric_value(
+            text, 'market_request_pdf_seconds_count', view='OrderViewSet', action='pdf',
+        ), 1)
+        shaping = receipts.shaping_stats()
+        self.assertGreater(shaping['misses'], 0)
+        self.assertEqual(
+            metric_value(text, 'market_receipt_shaping_cache_requests_total', result='miss'), shaping['misses'],
+        )
+        self.assertEqual(metric_value(text, 'market_receipt_shaping_cache_entries'), shaping['size'])
+
+    def test_server_timing_only_when_enabled(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/orders/'))
+        with self.settings(METRICS_SERVER_TIMING=True):
+            response = self.client.get('/api/orders/')
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertIn('serializer;dur=', response['Server-Timing'])
+
+    def test_token(self):
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics/').status_code, 403)
+            response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
+
+    def test_outside_requests_not_counted(self):
+        list(Product.objects.all())
+        with metrics.timer('serializer'):
+            ProductSerializer(self.products, many=True).data
+        self.assertIsNone(metric_value(self.scrape(), 'market_request_queries_count', view='ProductViewSet', action='list'))
+
+    async def test_async_views(self):
+        with self.settings(ROOT_URLCONF='products.async_urls'):
+            response = await AsyncClient().get(f'/orders/{self.order.pk}/')
+            self.assertEqual(response.status_code, 200)
+        text = await sync_to_async(self.scrape)()
+        labels = {'view': 'order_detail', 'action': 'get'}
+        self.assertEqual(metric_value(text, 'market_request_queries_count', **labels), 1)
+        self.assertGreater(metric_value(text, 'market_request_queries_sum', **labels), 0)
+
+
+class IdempotencyTests(APITestCase):
+    def setUp(self):
+        self.product = make_products(1, stock=10)[0]
+        self.payload = {'client_name': 'Retry', 'items': [{'product': self.product.id, 'quantity': 3}]}
+
+    def post(self, key, payload=None):
+        return self.client.post('/api/orders/', payload or self.payload, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_without_touching_the_database(self):
+        first = self.post('key-1')
+        self.assertEqual(first.status_code, 201)
+        with self.assertNumQueries(0):
+            retry = self.post('key-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 7)
+
+        # الـ cache نسى: الجواب من الجدول
+        caches['default'].clear()
+        self.assertEqual(self.post('key-1').content, first.content)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_key_reuse_with_other_body_and_failed_requests(self):
+        self.post('key-2')
+        other = dict(self.payload, client_name='Other')
+        self.assertEqual(self.post('key-2', other).status_code, 422)
+
+        too_many = {'items': [{'product': self.product.id, 'quantity': 50}]}
+        self.assertEqual(self.post('key-3', too_many).status_code, 400)
+        # الخطأ ماتخزنش: نفس الـ key يقدر يتعاود من بعد
+        self.assertFalse(IdempotencyKey.objects.filter(key='key-3').exists())
+        self.assertEqual(self.post('key-3').status_code, 201)
+        self.assertEqual(self.client.post('/api/orders/', self.payload, format='json').status_code, 201)
+        self.assertEqual(Order.objects.count(), 3)
+
+    def test_key_released_between_conflict_and_lookup(self):
+        # الطلب الأول فشل ومسح الـ key بين الـ INSERT ديالنا والقراية
+        create = IdempotencyKey.objects.create
+        calls = []
+
+        def racing_create(**kwargs):
+            calls.append(kwargs['key'])
+            if len(calls) == 1:
+                raise IntegrityError("UNIQUE constraint failed")
+            return create(**kwargs)
+
+        with mock.patch.object(IdempotencyKey.objects, 'create', racing_create):
+            response = self.post('key-4')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(calls, ['key-4', 'key-4'])
+
+    def test_stale_claim_is_taken_over_after_the_lease(self):
+        now = timezone.now()
+        digest = idempotency.fingerprint(APIRequestFactory().post('/api/orders/', self.payload, format='json'))
+        IdempotencyKey.objects.create(
+            key='key-5', fingerprint=digest, expires_at=now + timedelta(days=1), locked_until=now + timedelta(minutes=1),
+        )
+        with self.settings(IDEMPOTENCY_WAIT_SECONDS=0.1):
+            self.assertEqual(self.post('key-5').status_code, 409)
+        self.assertFalse(Order.objects.exists())
+
+        # الـ worker مات: من بعد الـ lease الـ retry كياخد الـ key
+        IdempotencyKey.objects.filter(key='key-5').update(locked_until=now - timedelta(seconds=1))
+        self.assertEqual(self.post('key-5', dict(self.payload, client_name='Other')).status_code, 422)
+        response = self.post('key-5')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(self.post('key-5').content, response.content)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_request_that_lost_its_lease_rolls_back(self):
+        def handler():
+            # طلب آخر خدا الـ key وحنا باقين كنخدمو
+            IdempotencyKey.objects.filter(key='key-6').update(locked_until=timezone.now() + timedelta(hours=1))
+            Order.objects.create(client_name='Late')
+            return HttpResponse(status=201)
+
+        request = RequestFactory().post('/api/orders/', HTTP_IDEMPOTENCY_KEY='key-6')
+        self.assertEqual(idempotency.run(request, handler).status_code, 409)
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(IdempotencyKey.objects.filter(key='key-6', status_code__isnull=True).exists())
+
+
+class ConcurrentIdempotencyTests(TransactionTestCase):
+    def test_concurrent_duplicates_wait_for_the_first(self):
+        product = make_products(1, stock=10)[0]
+        payload = {'client_name': 'Race', 'items': [{'product': product.id, 'quantity': 1}]}
+        start = threading.Barrier(5)
+        responses = []
+
+        def submit():
+            client = APIClient()
+            start.wait()
+            try:
+                for _ in range(200):
+                    try:
+                        responses.append(
+                            client.post('/api/orders/', payload, format='json', HTTP_IDEMPOTENCY_KEY='same')
+                        )
+                        return
+                    except OperationalError:
+                        # SQLite (in-memory shared cache) كيرفض الـ lock مباشرة: التطبيق كيعاود
+                        time.sleep(0.005)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=submit) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([r.status_code for r in responses], [201] * 5)
+        self.assertEqual(len({r.content for r in responses}), 1)
+        self.assertEqual(Order.objects.count(), 1)
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 9)
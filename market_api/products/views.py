@@ -1,115 +1,347 @@
-from rest_framework import viewsets
-from rest_framework.decorators import action
-from django.http import HttpResponse
-from .models import Product, Order
-from .serializers import ProductSerializer, OrderSerializer
-
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import mm
-from reportlab.lib import colors
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from io import BytesIO
-
-import arabic_reshaper
-from bidi.algorithm import get_display
-
-# تسجيل الخط العربي
-pdfmetrics.registerFont(TTFont('Arabic', r"C:\Users\dell\Desktop\projet complet\market_admin\Khalid Art bold Regular.ttf"))
-
-def rtl(text):
-    reshaped = arabic_reshaper.reshape(text)
-    bidi_text = get_display(reshaped)
-    return bidi_text
-
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
-    serializer_class = ProductSerializer
-
-
-class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all()
-    serializer_class = OrderSerializer
-
-    @action(detail=True, methods=['get'])
-    def pdf(self, request, pk=None):
-        order = self.get_object()
-
-        buffer = BytesIO()
-        width, height = 80 * mm, 200 * mm
-        p = canvas.Canvas(buffer, pagesize=(width, height))
-
-        y = height - 10 * mm
-        x_margin = 5 * mm
-
-        # Header
-        p.setFont("Arabic", 12)
-        p.drawCentredString(width / 2, y, rtl("متجر آتاي"))
-        y -= 5
-        p.setStrokeColor(colors.black)
-        p.line(x_margin, y, width - x_margin, y)
-        y -= 15
-
-        # Infos client
-        p.setFont("Arabic", 9)
-        p.drawRightString(width - x_margin, y, rtl(f"الطلب: #{order.id:04d}"))
-        y -= 12
-        p.drawRightString(width - x_margin, y, rtl(f"الاسم: {order.client_name or '---'}"))
-        y -= 12
-        p.drawRightString(width - x_margin, y, rtl(f"الهاتف: {order.phone or '---'}"))
-        y -= 12
-        p.drawRightString(width - x_margin, y, rtl(f"المدينة: {order.city or '---'}"))
-        y -= 16
-
-        # Produits
-        p.setFont("Arabic", 9)
-        p.drawRightString(width - x_margin, y, rtl("المشتريات:"))
-        y -= 10
-        p.line(x_margin, y, width - x_margin, y)
-        y -= 12
-
-        for idx, item in enumerate(order.items.all(), start=1):
-            total_item = float(item.price) * int(item.quantity)
-            line = f"{idx}. {item.product.name} × {item.quantity} = {total_item:.2f} درهم"
-            p.drawRightString(width - x_margin, y, rtl(line))
-            y -= 12
-
-            if y < 20 * mm:
-                p.showPage()
-                p.setFont("Arabic", 9)
-                y = height - 20 * mm
-
-        # Ligne avant total
-        y -= 5
-        p.line(x_margin, y, width - x_margin, y)
-        y -= 12
-
-        # Total
-        p.setFont("Arabic", 10)
-        p.drawRightString(width - x_margin, y, rtl(f"المجموع: {order.total} درهم"))
-        y -= 16
-
-        # Date et heure
-        p.setFont("Arabic", 9)
-        p.drawRightString(width - x_margin, y, rtl(f"التاريخ: {order.created_at.strftime('%Y-%m-%d')}"))
-        y -= 12
-        p.drawRightString(width - x_margin, y, rtl(f"الساعة: {order.created_at.strftime('%H:%M')}"))
-        y -= 16
-
-        # Footer
-        p.line(x_margin, y, width - x_margin, y)
-        y -= 12
-        p.setFont("Arabic", 9)
-        p.drawCentredString(width / 2, y, rtl("شكرا لاختياركم متجر آتاي!"))
-        y -= 12
-        p.drawCentredString(width / 2, y, rtl("الذوق الأصيل… من الطبيعة إلى بابكم"))
-
-        p.showPage()
-        p.save()
-
-        pdf = buffer.getvalue()
-        buffer.close()
-
-        response = HttpResponse(pdf, content_type="application/pdf")
-        response['Content-Disposition'] = f'attachment; filename=\"invoice_{order.id}.pdf\"'
-        return response
+import math
+import time
+
+from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, Prefetch
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from . import analytics, catalog_cache, catalog_io, idempotency, receipts, sync
+from .models import Product, Order, OrderItem, StockAlert
+from .filters import OrderFilter, ProductFilter, parse_date_param, product_ordering
+from .pagination import ProductPagination, OrderPagination
+from .serializers import (
+    ProductSerializer, OrderSerializer, OrderReadSerializer, OrderTransitionSerializer, LowStockProductSerializer,
+    StockAlertSerializer, query_list,
+)
+
+
+def sparse_products(queryset, request):
+    """?fields=id,name,price,image_srcset: مانقراوش description وغيرها."""
+    fields = query_list(request, 'fields')
+    if not fields:
+        return queryset
+    if fields & {'image_url', 'image_srcset'}:
+        fields = fields | {'image'}
+    # أعمدة الترتيب (cursor ديال keyset) خاصهم يكونو مقريين حتى هما
+    fields = fields | {name.lstrip('-') for name in product_ordering(request)}
+    columns = {field.name for field in Product._meta.concrete_fields} & fields
+    return queryset.only('id', *columns)
+
+
+def item_prefetch():
+    """items + product.name بـ query وحدة لجميع الطلبات (ماشي وحدة لكل طلب/سطر)."""
+    items = OrderItem.objects.select_related('product').only(
+        'id', 'order_id', 'product_id', 'quantity', 'price', 'product__name'
+    )
+    return Prefetch('items', queryset=items)
+
+
+def receipt_headers(key):
+    return {
+        'ETag': f'"{key}"',
+        'Cache-Control': 'private, no-cache',
+    }
+
+
+def transition_orders(queryset, status, ids=None, chunk_size=5000):
+    """
+    كيدوز الطلبات من Order.TRANSITIONS[status] لـ status بـ UPDATE مشروط
+    (WHERE id IN (...) AND status = ...) لكل chunk_size طلب، ماشي save() لكل واحد.
+    queryset.update ماكيصيفطش signals: الـ analytics والـ receipts كيتحدثو هنا.
+    """
+    source = Order.TRANSITIONS[status]
+    with transaction.atomic():
+        # مقفولين حتى للـ UPDATE: الـ analytics محتاجين الحالة القديمة بالضبط
+        orders = list(queryset.select_for_update().values('id', 'created_at', 'city', 'status', 'total'))
+        changed = [order for order in orders if order['status'] == source]
+        now = timezone.now()
+        for start in range(0, len(changed), chunk_size):
+            chunk = [order['id'] for order in changed[start:start + chunk_size]]
+            Order.objects.filter(pk__in=chunk, status=source).update(status=status, updated_at=now)
+        if changed:
+            analytics.change_status(changed, status)
+            receipts.invalidate(*[order['id'] for order in changed])
+
+    found = {order['id'] for order in orders}
+    missing = [pk for pk in dict.fromkeys(ids or ()) if pk not in found]
+    # الطلبات اللي الفلاتر حيدوهم كيترجعو بالحالة ديالهم؛ null = ما كاينش
+    existing = dict(Order.objects.filter(pk__in=missing).values_list('id', 'status')) if missing else {}
+    return {
+        'status': status,
+        'changed': [order['id'] for order in changed],
+        'rejected': [
+            {'id': order['id'], 'status': order['status']} for order in orders if order['status'] != source
+        ] + [{'id': pk, 'status': existing.get(pk)} for pk in missing],
+    }
+
+
+class ProductViewSet(viewsets.ModelViewSet):
+    queryset = Product.objects.all()
+    serializer_class = ProductSerializer
+    pagination_class = ProductPagination
+    filter_backends = [ProductFilter]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            queryset = sparse_products(queryset, self.request)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(catalog_cache.LIST_GENERATION, super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(catalog_cache.product_generation(kwargs['pk']), super().retrieve, request, *args, **kwargs)
+
+    def cached(self, generation_key, handler, request, *args, **kwargs):
+        if not catalog_cache.cacheable(request, request.accepted_renderer.format):
+            return handler(request, *args, **kwargs)
+
+        def render():
+            response = self.finalize_response(request, handler(request, *args, **kwargs), *args, **kwargs)
+            return response.render()
+        return catalog_cache.cached(request, generation_key, render)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """?output=csv|xlsx مع نفس الفلاتر ديال list (?category=&search=...)."""
+        export_format = request.query_params.get('output', 'csv')
+        if export_format not in catalog_io.FORMATS:
+            raise ValidationError({'output': "csv ولا xlsx"})
+        rows = catalog_io.export_rows(self.filter_queryset(self.get_queryset()))
+        writer = catalog_io.export_xlsx if export_format == 'xlsx' else catalog_io.export_csv
+        response = StreamingHttpResponse(writer(rows), content_type=catalog_io.FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="products.{export_format}"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        """multipart file=products.csv|.xlsx -> {created, updated, failed, errors: [{row, errors}]}"""
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': "خاص ملف CSV ولا XLSX"})
+        return Response(catalog_io.import_products(upload))
+
+    @action(detail=False, methods=['get'])
+    def low_stock(self, request):
+        """المنتجات اللي stock <= min_stock (كيستعمل product_low_stock_idx)."""
+        products = Product.objects.filter(stock__lte=F('min_stock')).order_by('stock', 'id')
+        return Response(LowStockProductSerializer(products, many=True).data)
+
+
+class OrderViewSet(viewsets.ModelViewSet):
+    queryset = Order.objects.all()
+    serializer_class = OrderSerializer
+    pagination_class = OrderPagination
+    filter_backends = [OrderFilter]
+    read_actions = ('list', 'retrieve', 'pdf', 'export')
+
+    def expand_items(self):
+        """
+        الـ items كيترجعو فـ retrieve وفـ list القديمة (?pagination=off)، إلا إلا
+        الكلاينت استعمل ?fields=: تما (وفـ list العادية) خاص ?include=items.
+        """
+        if self.action not in ('list', 'retrieve'):
+            return True
+        if 'items' in (query_list(self.request, 'include') or ()):
+            return True
+        fields = query_list(self.request, 'fields')
+        if fields is not None:
+            return 'items' in fields
+        if self.action == 'retrieve':
+            return True
+        return self.paginator.legacy(self.request)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in ('list', 'retrieve'):
+            context['fields'] = query_list(self.request, 'fields')
+            context['expand_items'] = self.expand_items()
+        return context
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.read_actions and self.expand_items():
+            queryset = queryset.prefetch_related(item_prefetch())
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action in ('list', 'retrieve') and self.request.method == 'GET':
+            return OrderReadSerializer
+        return super().get_serializer_class()
+
+    def create(self, request, *args, **kwargs):
+        # Idempotency-Key: retry ديال التطبيق مايصاوبش طلب جديد ولا يحجز الستوك مرتين
+        def handler():
+            response = super(OrderViewSet, self).create(request, *args, **kwargs)
+            return self.finalize_response(request, response, *args, **kwargs).render()
+        return idempotency.run(request, handler)
+
+    def perform_destroy(self, instance):
+        with analytics.track(instance.pk):
+            instance.delete()
+
+    @action(detail=True, methods=['get'])
+    def pdf(self, request, pk=None):
+        order = self.get_object()
+        data = receipts.receipt_data(order)
+        key = receipts.receipt_key(data)
+        headers = receipt_headers(key)
+
+        # نفس الطلب بنفس المحتوى: 304 بلا ما نقراو حتى الملف
+        not_modified = get_conditional_response(request, etag=headers['ETag'])
+        if not_modified is not None:
+            for header, value in headers.items():
+                not_modified[header] = value
+            return not_modified
+
+        return FileResponse(
+            receipts.open_receipt(data, key),
+            as_attachment=True,
+            filename=f"invoice_{order.id}.pdf",
+            content_type="application/pdf",
+            headers=headers,
+        )
+
+    @action(detail=False, methods=['post'])
+    def transition(self, request):
+        """
+        {"status": "paid", "ids": [1, 2, 3]} ولا {"status": "paid"} مع فلاتر list
+        (?status=pending&date_from=2026-10-17...). pending -> paid -> shipped فقط.
+        """
+        serializer = OrderTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data.get('ids')
+        if ids is None and not OrderFilter().applied(request):
+            raise ValidationError({'ids': "خاص ids ولا شي فلتر (?date_from=&city=...)"})
+
+        queryset = Order.objects.all() if ids is None else Order.objects.filter(pk__in=ids)
+        queryset = self.filter_queryset(queryset)
+        return Response(transition_orders(queryset, serializer.validated_data['status'], ids))
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Receipts ديال بزاف ديال الطلبات فـ response واحد:
+        ?date_from=YYYY-MM-DD&date_to=YYYY-MM-DD&status=paid&output=zip|pdf
+        (ماشي format=: هادي ديال DRF للـ renderers). zip (افتراضي) كيتبعث receipt
+        بـ receipt؛ pdf واحد محدود بـ RECEIPT_EXPORT_PDF_MAX_ORDERS طلب.
+        """
+        params = request.query_params
+        # نفس الفلاتر ديال list (OrderFilter)
+        queryset = self.filter_queryset(self.get_queryset())
+
+        export_format = params.get('output', 'zip')
+        if export_format not in ('pdf', 'zip'):
+            raise ValidationError({'output': "pdf ولا zip"})
+        if export_format == 'pdf':
+            limit = getattr(settings, 'RECEIPT_EXPORT_PDF_MAX_ORDERS', 200)
+            if queryset[:limit + 1].count() > limit:
+                raise ValidationError({'output': f"pdf واحد حتى {limit} طلب: استعمل output=zip"})
+
+        orders = queryset.order_by('created_at', 'id').iterator(chunk_size=200)
+        datas = (receipts.receipt_data(order) for order in orders)
+        if export_format == 'zip':
+            response = StreamingHttpResponse(receipts.export_zip(datas), content_type="application/zip")
+        else:
+            response = StreamingHttpResponse(receipts.export_pdf(datas), content_type="application/pdf")
+        response['Content-Disposition'] = f'attachment; filename="receipts.{export_format}"'
+        return response
+
+
+class AnalyticsViewSet(viewsets.ViewSet):
+    """
+    إحصائيات الداشبورد من الـ summary tables (O(أيام) ماشي O(طلبات)):
+    ?date_from=YYYY-MM-DD&date_to=YYYY-MM-DD&top=10
+    """
+
+    def list(self, request):
+        params = request.query_params
+        try:
+            top = max(1, min(int(params.get('top', 10)), 100))
+        except ValueError:
+            raise ValidationError({'top': "خاصو يكون رقم"})
+        return Response(analytics.dashboard(
+            date_from=parse_date_param(params, 'date_from'),
+            date_to=parse_date_param(params, 'date_to'),
+            top=top,
+        ))
+
+
+class SyncViewSet(viewsets.ViewSet):
+    """
+    Delta sync: ?since=<token> (من الجواب اللي قبل) كيرجع غير اللي تبدل ولا تمسح.
+    {token, full, products, orders, deleted: {product: [...], order: [...]}}
+    """
+
+    def list(self, request):
+        since = None
+        if request.query_params.get('since'):
+            try:
+                since = sync.decode_token(request.query_params['since'])
+            except (ValueError, OverflowError, OSError):
+                raise ValidationError({'since': "token ماشي صالح"})
+        since, token = sync.window(since)
+
+        products = Product.objects.order_by('id')
+        orders = Order.objects.prefetch_related(item_prefetch()).order_by('id')
+        if since is not None:
+            products = products.filter(updated_at__gte=since)
+            orders = orders.filter(updated_at__gte=since)
+
+        context = {'request': request}
+        return Response({
+            'token': token,
+            'full': since is None,
+            'products': ProductSerializer(products, many=True, context=context).data,
+            'orders': OrderReadSerializer(orders, many=True, context=context).data,
+            'deleted': sync.deleted_since(since) if since is not None else {'product': [], 'order': []},
+        })
+
+
+class StockAlertViewSet(viewsets.GenericViewSet):
+    """
+    Feed ديال StockAlert (long-poll): ?after=<last_id>&wait=<ثواني>
+    كيرجع مباشرة إلا كاينين events جداد، وإلا كيتسنى حتى wait (max 30s).
+    بلا after كيرجع آخر events باش الكلاينت ياخد last_id.
+    """
+    queryset = StockAlert.objects.select_related('product')
+    serializer_class = StockAlertSerializer
+    page_limit = 100
+    max_wait = 30
+    poll_interval = 0.5
+
+    def list(self, request):
+        params = request.query_params
+        try:
+            after = int(params['after']) if 'after' in params else None
+            wait = float(params.get('wait', 0))
+        except ValueError:
+            raise ValidationError("after و wait خاصهم يكونو أرقام")
+        # nan/inf كيخليو الـ deadline ماعمرو يتوصل
+        if not math.isfinite(wait):
+            raise ValidationError("wait خاصو يكون رقم محدود")
+        wait = min(max(wait, 0), self.max_wait)
+
+        if after is None:
+            alerts = list(self.get_queryset().order_by('-id')[:self.page_limit])[::-1]
+            return self.feed_response(alerts, 0)
+
+        deadline = time.monotonic() + wait
+        while True:
+            alerts = list(self.get_queryset().filter(id__gt=after).order_by('id')[:self.page_limit])
+            if alerts or time.monotonic() >= deadline:
+                return self.feed_response(alerts, after)
+            time.sleep(self.poll_interval)
+
+    def feed_response(self, alerts, after):
+        return Response({
+            'results': self.get_serializer(alerts, many=True).data,
+            'last_id': alerts[-1].id if alerts else after,
+        })